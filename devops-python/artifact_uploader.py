@@ -0,0 +1,571 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+try:
+    import boto3
+    from botocore.config import Config
+except ImportError:
+    # Only FileStore can be uploaded to without boto3
+    boto3 = None
+
+# Files up to this size go up in one request, bigger ones in parts
+MULTIPART_THRESHOLD = 16 * 1024 * 1024
+
+# Size of every part but the last; S3 wants at least 5 MiB and at most 10000 parts
+PART_SIZE = 8 * 1024 * 1024
+MAX_PARTS = 10000
+
+# Requests in flight, which is also the size of boto3's connection pool
+DEFAULT_WORKERS = 8
+
+# Where unfinished multipart uploads and file hashes are remembered between runs
+STATE_PATH = ".upload-state.json"
+
+# Bytes read at a time while hashing
+HASH_BLOCK = 1024 * 1024
+
+
+class NoSuchKey(Exception):
+    pass
+
+
+class FileStore:
+    """A bucket store in a local directory that answers the boto3 S3 client calls the uploader makes.
+
+    Objects are files under ``root/bucket/objects`` with their metadata in
+    a JSON file beside them, and unfinished multipart uploads are
+    directories of parts under ``root/bucket/uploads``. ``latency`` adds a
+    delay to every request, like a network round trip, and ``fail_after``
+    makes every upload_part after that many fail, to interrupt an upload.
+    """
+
+    def __init__(self, root, latency=0.0, fail_after=None):
+        self.root = root
+        self.latency = latency
+        self.fail_after = fail_after
+        self.requests = 0
+        self._parts_done = 0
+        self._lock = threading.Lock()
+
+    def _request(self):
+        with self._lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _object_path(self, bucket, key):
+        return os.path.join(self.root, bucket, "objects", *key.split("/"))
+
+    def _write(self, path, chunks):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        digest = hashlib.md5()
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, "wb") as file:
+            for chunk in chunks:
+                digest.update(chunk)
+                file.write(chunk)
+        os.replace(temp_path, path)
+        return digest
+
+    def put_object(self, Bucket, Key, Body, Metadata=None):
+        self._request()
+        path = self._object_path(Bucket, Key)
+        etag = f'"{self._write(path, [Body]).hexdigest()}"'
+        with open(f"{path}.meta.json", "w") as file:
+            json.dump({"Metadata": Metadata or {}, "ETag": etag}, file)
+        return {"ETag": etag}
+
+    def head_object(self, Bucket, Key):
+        self._request()
+        path = self._object_path(Bucket, Key)
+        try:
+            with open(f"{path}.meta.json") as file:
+                meta = json.load(file)
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            raise NoSuchKey(Key) from None
+        return {"ContentLength": size, "ETag": meta["ETag"], "Metadata": meta["Metadata"]}
+
+    def get_object(self, Bucket, Key):
+        self._request()
+        try:
+            with open(self._object_path(Bucket, Key), "rb") as file:
+                return {"Body": file.read()}
+        except FileNotFoundError:
+            raise NoSuchKey(Key) from None
+
+    def create_multipart_upload(self, Bucket, Key, Metadata=None):
+        self._request()
+        upload_id = uuid.uuid4().hex
+        directory = os.path.join(self.root, Bucket, "uploads", upload_id)
+        os.makedirs(directory)
+        with open(os.path.join(directory, "upload.json"), "w") as file:
+            json.dump({"Key": Key, "Metadata": Metadata or {}}, file)
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self._request()
+        with self._lock:
+            if self.fail_after is not None and self._parts_done >= self.fail_after:
+                raise ConnectionError("Connection reset by FileStore")
+            self._parts_done += 1
+        directory = os.path.join(self.root, Bucket, "uploads", UploadId)
+        if not os.path.isdir(directory):
+            raise NoSuchKey(UploadId)
+        digest = self._write(os.path.join(directory, f"{PartNumber:05d}.part"), [Body])
+        return {"ETag": f'"{digest.hexdigest()}"'}
+
+    def list_parts(self, Bucket, Key, UploadId, PartNumberMarker=0):
+        self._request()
+        directory = os.path.join(self.root, Bucket, "uploads", UploadId)
+        if not os.path.isdir(directory):
+            raise NoSuchKey(UploadId)
+        parts = []
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith(".part") or int(name[:5]) <= PartNumberMarker:
+                continue
+            path = os.path.join(directory, name)
+            with open(path, "rb") as file:
+                etag = f'"{hashlib.md5(file.read()).hexdigest()}"'
+            parts.append({"PartNumber": int(name[:5]), "Size": os.path.getsize(path), "ETag": etag})
+        return {"Parts": parts, "IsTruncated": False}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self._request()
+        directory = os.path.join(self.root, Bucket, "uploads", UploadId)
+        with open(os.path.join(directory, "upload.json")) as file:
+            upload = json.load(file)
+
+        def chunks():
+            for part in MultipartUpload["Parts"]:
+                with open(os.path.join(directory, f"{part['PartNumber']:05d}.part"), "rb") as file:
+                    while True:
+                        chunk = file.read(HASH_BLOCK)
+                        if not chunk:
+                            break
+                        yield chunk
+
+        path = self._object_path(Bucket, Key)
+        self._write(path, chunks())
+        # S3's multipart ETag: the MD5 of the parts' MD5s, and the part count
+        digests = b"".join(bytes.fromhex(part["ETag"].strip('"')) for part in MultipartUpload["Parts"])
+        etag = f'"{hashlib.md5(digests).hexdigest()}-{len(MultipartUpload["Parts"])}"'
+        with open(f"{path}.meta.json", "w") as file:
+            json.dump({"Metadata": upload["Metadata"], "ETag": etag}, file)
+        shutil.rmtree(directory)
+        return {"ETag": etag}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self._request()
+        shutil.rmtree(os.path.join(self.root, Bucket, "uploads", UploadId), ignore_errors=True)
+        return {}
+
+
+def s3_client(endpoint_url=None, workers=DEFAULT_WORKERS):
+    """Return a boto3 S3 client whose connection pool fits ``workers`` requests at once."""
+    if boto3 is None:
+        raise RuntimeError("boto3 is not installed; pip install boto3, or upload to a FileStore")
+    return boto3.client("s3", endpoint_url=endpoint_url, config=Config(max_pool_connections=workers))
+
+
+def _is_missing(error):
+    """Return whether a client error means the key or upload does not exist."""
+    if isinstance(error, NoSuchKey):
+        return True
+    code = getattr(error, "response", {}).get("Error", {}).get("Code")
+    return code in ("404", "NoSuchKey", "NoSuchUpload", "NotFound")
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb", buffering=0) as file:
+        while True:
+            block = file.read(HASH_BLOCK)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_part(path, number, part_size):
+    """Return the bytes of 1-based part ``number`` of a file."""
+    with open(path, "rb", buffering=0) as file:
+        file.seek((number - 1) * part_size)
+        return file.read(part_size)
+
+
+def part_size_for(size, part_size=PART_SIZE):
+    """Return ``part_size``, or as much more as keeps a file within MAX_PARTS parts."""
+    return max(part_size, -(-size // MAX_PARTS))
+
+
+class UploadState:
+    """What the uploader remembers between runs, in one JSON file.
+
+    ``uploads`` maps an object key to its unfinished multipart upload, so
+    a run that was interrupted carries on with the parts already sent.
+    ``hashes`` maps a local path to its size, mtime and SHA-256, so files
+    that have not changed are not read again to find out.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.uploads = {}
+        self.hashes = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path) as file:
+                data = json.load(file)
+            self.uploads = data.get("uploads", {})
+            self.hashes = data.get("hashes", {})
+
+    def sha256(self, path):
+        """Return the SHA-256 of a file, from the cache if its size and mtime have not changed."""
+        st = os.stat(path)
+        cached = self.hashes.get(path)
+        if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            return cached[2]
+        digest = file_sha256(path)
+        with self._lock:
+            self.hashes[path] = [st.st_size, st.st_mtime_ns, digest]
+        return digest
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            data = json.dumps({"uploads": self.uploads, "hashes": self.hashes})
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as file:
+            file.write(data)
+        os.replace(temp_path, self.path)
+
+
+class UploadReport:
+    def __init__(self):
+        self.files = 0
+        self.skipped = 0
+        self.uploaded = 0
+        self.parts = 0
+        self.resumed_parts = 0
+        self.bytes_sent = 0
+        self.failed = {}
+
+    def to_dict(self):
+        return {
+            "files": self.files,
+            "skipped": self.skipped,
+            "uploaded": self.uploaded,
+            "parts": self.parts,
+            "resumed_parts": self.resumed_parts,
+            "bytes_sent": self.bytes_sent,
+            "failed": self.failed
+        }
+
+
+class Uploader:
+    """Uploads many files to one bucket at once, over ``workers`` requests in flight.
+
+    ``client`` is a boto3 S3 client or a FileStore. Every object carries
+    the SHA-256 of its content in its metadata, and a file whose object
+    already has the same hash is skipped. Files over
+    ``multipart_threshold`` go up as parts of ``part_size``, and every
+    part of every file is its own task in one pool, so one big file keeps
+    all workers busy as well as many small ones do. The unfinished
+    uploads are kept in ``state``, and a later run resumes them, sending
+    only the parts the store does not already have.
+    """
+
+    def __init__(self, client, bucket, workers=DEFAULT_WORKERS, part_size=PART_SIZE,
+                 multipart_threshold=MULTIPART_THRESHOLD, state=None):
+        self.client = client
+        self.bucket = bucket
+        self.workers = workers
+        self.part_size = part_size
+        self.multipart_threshold = max(multipart_threshold, part_size)
+        self.state = state or UploadState()
+
+    def upload(self, files):
+        """Upload ``files``, a list of ``(local path, key)`` pairs, and return an UploadReport."""
+        report = UploadReport()
+        report.files = len(files)
+        with ThreadPoolExecutor(self.workers) as pool:
+            # First hash the files and ask for their objects, all at once
+            plans = {pool.submit(self._plan, path, key): (path, key) for path, key in files}
+            tasks = {}
+            uploads = {}
+            for future in wait(plans).done:
+                path, key = plans[future]
+                try:
+                    action, digest, size, parts = future.result()
+                except Exception as error:
+                    report.failed[key] = str(error)
+                    continue
+                if action == "skip":
+                    report.skipped += 1
+                elif action == "put":
+                    tasks[pool.submit(self._put, path, key, digest)] = (key, None)
+                else:
+                    uploads[key] = {"path": path, "size": size, "pending": set(), "etags": parts}
+                    report.resumed_parts += len(parts)
+                    for number in self._missing_parts(key, size, parts):
+                        uploads[key]["pending"].add(number)
+                        tasks[pool.submit(self._upload_part, path, key, number)] = (key, number)
+            self.state.save()
+
+            # Then send the small files and the parts, completing each upload when its last part is in
+            for key, upload in uploads.items():
+                if not upload["pending"]:
+                    self._finish(key, upload, report)
+            while tasks:
+                done, _ = wait(tasks, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key, number = tasks.pop(future)
+                    try:
+                        sent = future.result()
+                    except Exception as error:
+                        report.failed[key] = str(error)
+                        continue
+                    if number is None:
+                        report.uploaded += 1
+                        report.bytes_sent += sent
+                        continue
+                    etag, sent = sent
+                    report.parts += 1
+                    report.bytes_sent += sent
+                    upload = uploads[key]
+                    upload["etags"][number] = etag
+                    upload["pending"].discard(number)
+                    if not upload["pending"] and key not in report.failed:
+                        self._finish(key, upload, report)
+        self.state.save()
+        return report
+
+    def _plan(self, path, key):
+        """Decide whether a file is skipped, put in one request or sent in parts.
+
+        Returns the action, the file's hash and size, and for a multipart
+        upload the ETags of the parts already in the store, by number.
+        """
+        digest = self.state.sha256(path)
+        size = os.path.getsize(path)
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=key)
+        except Exception as error:
+            if not _is_missing(error):
+                raise
+        else:
+            if head.get("Metadata", {}).get("sha256") == digest:
+                previous = self.state.uploads.get(key)
+                if previous:
+                    self._abort(key, previous["upload_id"])
+                return "skip", digest, size, None
+        part_size = part_size_for(size, self.part_size)
+        previous = self.state.uploads.get(key)
+        if size <= self.multipart_threshold:
+            if previous:
+                self._abort(key, previous["upload_id"])
+            return "put", digest, size, None
+
+        if previous and previous["sha256"] == digest and previous["part_size"] == part_size:
+            parts = self._uploaded_parts(key, previous["upload_id"])
+            if parts is not None:
+                return "multipart", digest, size, self._verified_parts(path, key, size, parts)
+            # The store no longer has it, so start again
+        if previous:
+            self._abort(key, previous["upload_id"])
+        response = self.client.create_multipart_upload(Bucket=self.bucket, Key=key, Metadata={"sha256": digest})
+        with self.state._lock:
+            self.state.uploads[key] = {"upload_id": response["UploadId"], "sha256": digest, "part_size": part_size}
+        return "multipart", digest, size, {}
+
+    def _uploaded_parts(self, key, upload_id):
+        """Return ``{part number: (size, ETag)}`` of an unfinished upload, or None if it is gone."""
+        parts = {}
+        marker = 0
+        try:
+            while True:
+                response = self.client.list_parts(Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumberMarker=marker)
+                for part in response.get("Parts", []):
+                    parts[part["PartNumber"]] = (part["Size"], part["ETag"])
+                if not response.get("IsTruncated"):
+                    return parts
+                marker = response["NextPartNumberMarker"]
+        except Exception as error:
+            if _is_missing(error):
+                return None
+            raise
+
+    def _verified_parts(self, path, key, size, parts):
+        """Keep the uploaded parts whose size and MD5 match the file, so a part cut off midway is sent again."""
+        part_size = self.state.uploads[key]["part_size"]
+        count = -(-size // part_size)
+        verified = {}
+        for number, (part_size_sent, etag) in parts.items():
+            if number > count:
+                continue
+            body = read_part(path, number, part_size)
+            if len(body) == part_size_sent and f'"{hashlib.md5(body).hexdigest()}"' == etag:
+                verified[number] = etag
+        return verified
+
+    def _missing_parts(self, key, size, parts):
+        part_size = self.state.uploads[key]["part_size"]
+        return [number for number in range(1, -(-size // part_size) + 1) if number not in parts]
+
+    def _put(self, path, key, digest):
+        with open(path, "rb") as file:
+            body = file.read()
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=body, Metadata={"sha256": digest})
+        return len(body)
+
+    def _upload_part(self, path, key, number):
+        upload = self.state.uploads[key]
+        body = read_part(path, number, upload["part_size"])
+        response = self.client.upload_part(Bucket=self.bucket, Key=key, UploadId=upload["upload_id"], PartNumber=number, Body=body)
+        return response["ETag"], len(body)
+
+    def _finish(self, key, upload, report):
+        parts = [{"PartNumber": number, "ETag": etag} for number, etag in sorted(upload["etags"].items())]
+        try:
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=key, UploadId=self.state.uploads[key]["upload_id"],
+                MultipartUpload={"Parts": parts}
+            )
+        except Exception as error:
+            report.failed[key] = str(error)
+            return
+        with self.state._lock:
+            del self.state.uploads[key]
+        report.uploaded += 1
+
+    def _abort(self, key, upload_id):
+        try:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+        except Exception as error:
+            if not _is_missing(error):
+                raise
+        with self.state._lock:
+            self.state.uploads.pop(key, None)
+
+
+def collect_files(sources, prefix=""):
+    """Return ``(path, key)`` for every file in ``sources``, keyed by its path below the source directory."""
+    files = []
+    for source in sources:
+        if os.path.isfile(source):
+            files.append((source, prefix + os.path.basename(source)))
+            continue
+        for dirpath, _, filenames in os.walk(source):
+            for name in sorted(filenames):
+                path = os.path.join(dirpath, name)
+                files.append((path, prefix + os.path.relpath(path, source).replace(os.sep, "/")))
+    return files
+
+
+def bench(args):
+    """Upload generated artifacts to a FileStore with a simulated round trip: sequentially, in parallel, again, and resumed."""
+    workdir = tempfile.mkdtemp(prefix="upload-bench-")
+    try:
+        rng = random.Random(args.seed)
+        source = os.path.join(workdir, "artifacts")
+        os.makedirs(source)
+        for index in range(args.files):
+            with open(os.path.join(source, f"small-{index}.bin"), "wb") as file:
+                file.write(rng.randbytes(rng.randrange(1024, 256 * 1024)))
+        with open(os.path.join(source, "big.bin"), "wb") as file:
+            file.write(rng.randbytes(args.big_mb * 1024 * 1024))
+        files = collect_files([source])
+        part_size = 5 * 1024 * 1024
+
+        results = {}
+        for name, workers in (("sequential", 1), ("parallel", args.workers)):
+            store = FileStore(os.path.join(workdir, name), latency=args.latency)
+            uploader = Uploader(store, "artifacts", workers, part_size, part_size)
+            start = time.perf_counter()
+            report = uploader.upload(files)
+            results[name] = {"seconds": round(time.perf_counter() - start, 3), "requests": store.requests, **report.to_dict()}
+        start = time.perf_counter()
+        report = uploader.upload(files)
+        results["unchanged"] = {"seconds": round(time.perf_counter() - start, 3), **report.to_dict()}
+
+        # Drop the connection partway through the big file, then run again
+        state_path = os.path.join(workdir, STATE_PATH)
+        store = FileStore(os.path.join(workdir, "resumed"), latency=args.latency, fail_after=args.big_mb // 10)
+        Uploader(store, "artifacts", args.workers, part_size, part_size, UploadState(state_path)).upload(files)
+        store.fail_after = None
+        start = time.perf_counter()
+        report = Uploader(store, "artifacts", args.workers, part_size, part_size, UploadState(state_path)).upload(files)
+        results["resumed"] = {"seconds": round(time.perf_counter() - start, 3), **report.to_dict()}
+        expected = {key: file_sha256(path) for path, key in files}
+        for key, digest in expected.items():
+            body = store.get_object(Bucket="artifacts", Key=key)["Body"]
+            if hashlib.sha256(body).hexdigest() != digest:
+                sys.exit(f"{key} differs after resuming")
+
+        for name, result in results.items():
+            print(f"{name:<10} {result['seconds']:>7.2f} s  uploaded {result['uploaded']:>4}  skipped {result['skipped']:>4}  "
+                  f"parts {result['parts']:>3}  resumed parts {result['resumed_parts']:>3}", file=sys.stderr)
+        json.dump({"files": len(files), "latency_s": args.latency, "workers": args.workers, "results": results}, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run(args):
+    if args.store:
+        client = FileStore(args.store)
+    elif boto3 is None:
+        sys.exit("boto3 is not installed; pip install boto3, or upload with --store DIR")
+    else:
+        client = s3_client(args.endpoint_url, args.workers)
+    uploader = Uploader(client, args.bucket, args.workers, args.part_size * 1024 * 1024,
+                        args.threshold * 1024 * 1024, UploadState(args.state))
+    report = uploader.upload(collect_files(args.sources, args.prefix))
+    json.dump(report.to_dict(), sys.stdout, indent=2)
+    sys.stdout.write("\n")
+    if report.failed:
+        sys.exit(1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Upload build artifacts to S3, skipping unchanged files and resuming cut-off uploads.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    upload_parser = commands.add_parser("upload", help="upload files and directories")
+    upload_parser.add_argument("sources", nargs="+")
+    upload_parser.add_argument("--bucket", required=True)
+    upload_parser.add_argument("--prefix", default="", help="put before every key, like builds/42/")
+    upload_parser.add_argument("--endpoint-url", help="an S3-compatible server instead of AWS")
+    upload_parser.add_argument("--store", help="upload into a FileStore in this directory instead of S3")
+    upload_parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    upload_parser.add_argument("--part-size", type=int, default=PART_SIZE // 1024 // 1024, help="MiB per part (default: 8)")
+    upload_parser.add_argument("--threshold", type=int, default=MULTIPART_THRESHOLD // 1024 // 1024,
+                               help="upload files bigger than this many MiB in parts (default: 16)")
+    upload_parser.add_argument("--state", default=STATE_PATH, help=f"file to resume from (default: {STATE_PATH})")
+    upload_parser.set_defaults(func=run)
+
+    bench_parser = commands.add_parser("bench", help="upload generated artifacts to a FileStore with a simulated round trip")
+    bench_parser.add_argument("--files", type=int, default=200)
+    bench_parser.add_argument("--big-mb", type=int, default=100, help="size of the one big artifact (default: 100)")
+    bench_parser.add_argument("--latency", type=float, default=0.02, help="seconds per request (default: 0.02)")
+    bench_parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    bench_parser.add_argument("--seed", type=int, default=0)
+    bench_parser.set_defaults(func=bench)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+import argparse
+import itertools
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+# Cells submitted to the pool ahead of the ones running, so no worker idles between cells
+PREFETCH = 2
+
+# Characters of output kept from a failed cell
+OUTPUT_TAIL = 2000
+
+
+def parse_axis(text):
+    """Parse ``"python=3.10,3.11"`` or ``"build=106..110"`` into a name and its values.
+
+    A ``first..last`` range, like the build-106 to build-110 tags of
+    assement-2, stays a lazy range, so an axis of a million build numbers
+    costs nothing until it is iterated.
+    """
+    name, sep, values = text.partition("=")
+    if not sep or not name:
+        raise ValueError(f"Bad axis, expected name=value,...: {text}")
+    first, dots, last = values.partition("..")
+    if dots and first.lstrip("-").isdigit() and last.lstrip("-").isdigit():
+        return name, range(int(first), int(last) + 1)
+    return name, values.split(",")
+
+
+def parse_cell(text):
+    """Parse ``"os=windows,python=3.8"`` into a dict, for include and exclude rules."""
+    cell = {}
+    for pair in text.split(","):
+        key, sep, value = pair.partition("=")
+        if not sep:
+            raise ValueError(f"Bad cell, expected key=value,...: {text}")
+        cell[key] = value
+    return cell
+
+
+class Matrix:
+    """The cells of a build matrix: every combination of the axes' values, less the excluded, plus the included.
+
+    ``axes`` maps each axis name to a sequence of values, which may be a
+    range. Cells are yielded one at a time from itertools.product, so
+    nothing is built up front whatever the size of the matrix. An exclude
+    rule like ``{"os": "windows", "python": "3.8"}`` drops the cells that
+    have all of its values, and include cells are yielded after the
+    product as given, like GitHub Actions' ``include``. Values given as
+    strings, as parse_cell returns them, are converted to the type of the
+    axis's values, so ``build=2`` excludes the 2 of a ``1..3`` axis.
+    """
+
+    def __init__(self, axes, include=(), exclude=()):
+        self.names = list(axes)
+        self.values = [axes[name] for name in self.names]
+        positions = {name: index for index, name in enumerate(self.names)}
+        unknown = {key for rule in exclude for key in rule} - set(positions)
+        if unknown:
+            raise ValueError(f"Exclude rules name unknown axes: {', '.join(sorted(unknown))}")
+        self.include = [self._typed(cell, positions) for cell in include]
+        self.exclude = [self._typed(rule, positions) for rule in exclude]
+        # Each rule as (position, value) pairs, compared against the product's tuples directly
+        self._exclude = [tuple((positions[key], value) for key, value in rule.items()) for rule in self.exclude]
+
+    def _typed(self, cell, positions):
+        """Return a copy of an include cell or exclude rule with string values converted to their axis's type."""
+        typed = {}
+        for key, value in cell.items():
+            values = self.values[positions[key]] if key in positions else None
+            if isinstance(value, str) and values and not isinstance(values[0], str):
+                try:
+                    value = type(values[0])(value)
+                except ValueError:
+                    raise ValueError(f"{key}={value} does not fit the {type(values[0]).__name__} values of axis {key}") from None
+            typed[key] = value
+        return typed
+
+    def size(self):
+        """Return the most cells there can be, without iterating: the product's size plus the includes."""
+        return math.prod(len(values) for values in self.values) + len(self.include)
+
+    def __iter__(self):
+        return self.cells()
+
+    def cells(self, start=0, stop=None, step=1):
+        """Yield the cells, or the slice ``start:stop:step`` of them, as dicts.
+
+        The slice is taken before exclusion, over the product followed by
+        the include cells, so ``cells(i, None, n)`` for i in 0..n-1 splits a
+        matrix between n machines, includes and all, without any of them
+        building the whole list.
+        """
+        product = itertools.islice(itertools.product(*self.values), start, stop, step)
+        rules = self._exclude
+        names = self.names
+        for combination in product:
+            if rules and any(all(combination[position] == value for position, value in rule) for rule in rules):
+                continue
+            yield dict(zip(names, combination))
+        # The include cells are numbered on from the end of the product
+        offset = self.size() - len(self.include)
+        end = offset + len(self.include) if stop is None else min(stop, offset + len(self.include))
+        first = start if start >= offset else start + -(-(offset - start) // step) * step
+        for index in range(first, end, step):
+            yield dict(self.include[index - offset])
+
+
+class CommandTask:
+    """Runs a shell command made from a template like ``"tox -e py{python} -- --os {os}"`` for a cell."""
+
+    def __init__(self, template, timeout=None):
+        self.template = template
+        self.timeout = timeout
+
+    def __call__(self, cell):
+        command = self.template.format(**cell)
+        env = dict(os.environ, **{f"MATRIX_{key.upper()}": str(value) for key, value in cell.items()})
+        try:
+            completed = subprocess.run(command, shell=True, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                       timeout=self.timeout)
+        except subprocess.TimeoutExpired as error:
+            return {"returncode": None, "output": (error.output or b"")[-OUTPUT_TAIL:].decode("utf-8", "replace"),
+                    "error": f"timed out after {self.timeout} s"}
+        result = {"returncode": completed.returncode}
+        if completed.returncode:
+            result["output"] = completed.stdout[-OUTPUT_TAIL:].decode("utf-8", "replace")
+        return result
+
+
+def _timed(task, cell):
+    """Run ``task`` on a cell in a worker and return its result with the worker-side timings."""
+    start = time.time()
+    began = time.perf_counter()
+    try:
+        result = task(cell)
+    except Exception as error:
+        result = {"returncode": None, "error": repr(error)}
+    result["started"] = start
+    result["seconds"] = round(time.perf_counter() - began, 6)
+    return result
+
+
+def run_matrix(cells, task, workers=None, threads=False):
+    """Run ``task`` on every cell with at most ``workers`` at once and yield a result per cell as it finishes.
+
+    Cells are taken from the iterable only as workers free up, so a huge
+    lazy matrix starts at once and memory stays at the cells in flight.
+    ``task`` must be picklable for the default process pool; CommandTask
+    is. With ``threads`` a thread pool runs the cells instead, which is
+    cheaper when every cell is a subprocess anyway. Each result has the
+    cell, its index, the task's result and the seconds the cell waited
+    and ran.
+    """
+    workers = workers or os.cpu_count() or 1
+    pool_class = ThreadPoolExecutor if threads else ProcessPoolExecutor
+    cells = enumerate(cells)
+    with pool_class(workers) as pool:
+        pending = {}
+
+        def submit():
+            for index, cell in itertools.islice(cells, workers * PREFETCH - len(pending)):
+                pending[pool.submit(_timed, task, cell)] = (index, cell, time.time())
+
+        submit()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, cell, queued = pending.pop(future)
+                result = future.result()
+                result["waited"] = round(result["started"] - queued, 6)
+                yield {"index": index, "cell": cell, **result}
+            submit()
+
+
+def sleep_task(cell):
+    """A stand-in for a build step: wait 10 ms, as a cell that spends its time in a subprocess would."""
+    time.sleep(0.01)
+    return {"returncode": 0}
+
+
+def bench(args):
+    """Time to first cell and memory of a lazy matrix against a materialized list, then run cells on 1 and N workers."""
+    axes = {
+        "os": ["ubuntu", "macos", "windows"],
+        "python": ["3.9", "3.10", "3.11", "3.12"],
+        "arch": ["x86_64", "arm64"],
+        "build": range(1, args.builds + 1)
+    }
+    exclude = [{"os": "windows", "arch": "arm64"}, {"os": "macos", "python": "3.9"}]
+    matrix = Matrix(axes, exclude=exclude)
+    report = {"size": matrix.size()}
+
+    start = time.perf_counter()
+    lazy = iter(matrix)
+    next(lazy)
+    report["lazy_first_ms"] = round((time.perf_counter() - start) * 1000, 3)
+    count = 1 + sum(1 for _ in lazy)
+    report["lazy_all_s"] = round(time.perf_counter() - start, 3)
+    start = time.perf_counter()
+    eager = list(matrix)
+    report["list_first_ms"] = round((time.perf_counter() - start) * 1000, 3)
+    if len(eager) != count:
+        sys.exit(f"The lazy matrix has {count} cells and the list {len(eager)}")
+    report["cells"] = count
+    del eager
+
+    # Memory on its own pass, as tracing slows everything down
+    tracemalloc.start()
+    for _ in matrix:
+        pass
+    report["lazy_peak_kb"] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+    tracemalloc.reset_peak()
+    eager = list(matrix)
+    report["list_peak_kb"] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+    tracemalloc.stop()
+    del eager
+    print(f"{count} cells  first cell: lazy {report['lazy_first_ms']:.3f} ms, list {report['list_first_ms']:.1f} ms  "
+          f"peak memory: lazy {report['lazy_peak_kb']:.0f} KiB, list {report['list_peak_kb']:.0f} KiB", file=sys.stderr)
+
+    report["runs"] = []
+    sample = list(matrix.cells(0, args.run_cells))
+    for workers in (1, args.workers):
+        start = time.perf_counter()
+        results = list(run_matrix(sample, sleep_task, workers))
+        elapsed = time.perf_counter() - start
+        run = {"workers": workers, "cells": len(results), "seconds": round(elapsed, 3),
+               "mean_cell_s": round(sum(result["seconds"] for result in results) / len(results), 4)}
+        report["runs"].append(run)
+        print(f"{workers:>3} workers  {len(results)} cells of 10 ms  {elapsed:.2f} s", file=sys.stderr)
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+def run(args):
+    try:
+        matrix = Matrix(dict(parse_axis(axis) for axis in args.axis),
+                        [parse_cell(cell) for cell in args.include], [parse_cell(cell) for cell in args.exclude])
+    except ValueError as error:
+        sys.exit(str(error))
+    if args.shard:
+        index, _, count = args.shard.partition("/")
+        cells = matrix.cells(int(index), None, int(count))
+    else:
+        cells = matrix.cells()
+    if not args.command:
+        for cell in cells:
+            print(json.dumps(cell))
+        return
+
+    ran = failed = 0
+    busy = 0.0
+    slowest = None
+    start = time.perf_counter()
+    for result in run_matrix(cells, CommandTask(args.command, args.timeout), args.workers, args.threads):
+        print(json.dumps(result), flush=True)
+        ran += 1
+        busy += result["seconds"]
+        if result["returncode"] != 0:
+            failed += 1
+        if slowest is None or result["seconds"] > slowest["seconds"]:
+            slowest = result
+    elapsed = time.perf_counter() - start
+    print(f"{ran} cells, {failed} failed, {elapsed:.2f} s wall, {busy:.2f} s of commands"
+          + (f", slowest {slowest['cell']} {slowest['seconds']:.2f} s" if slowest else ""), file=sys.stderr)
+    if failed:
+        sys.exit(1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a build matrix lazily and run a command for every cell in parallel.")
+    commands = parser.add_subparsers(dest="command_name", required=True)
+
+    run_parser = commands.add_parser("run", help="list the cells, or run a command per cell and print JSON results")
+    run_parser.add_argument("--axis", action="append", required=True, help="name=v1,v2,... or name=first..last; repeat per axis")
+    run_parser.add_argument("--include", action="append", default=[], help="an extra cell, key=value,...")
+    run_parser.add_argument("--exclude", action="append", default=[], help="drop cells with these values, key=value,...")
+    run_parser.add_argument("--command", help="shell command per cell, with {axis} placeholders; without it the cells are printed")
+    run_parser.add_argument("--workers", type=int, help="cells run at once (default: one per CPU)")
+    run_parser.add_argument("--threads", action="store_true", help="run cells from a thread pool instead of a process pool")
+    run_parser.add_argument("--timeout", type=float, help="seconds a cell's command may take")
+    run_parser.add_argument("--shard", help="only run every COUNT-th cell starting at INDEX, as INDEX/COUNT")
+    run_parser.set_defaults(func=run)
+
+    bench_parser = commands.add_parser("bench", help="compare with a materialized matrix and time the pool")
+    bench_parser.add_argument("--builds", type=int, default=20000, help="values of the build axis (default: 20000)")
+    bench_parser.add_argument("--run-cells", type=int, default=400)
+    bench_parser.add_argument("--workers", type=int, default=16)
+    bench_parser.set_defaults(func=bench)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
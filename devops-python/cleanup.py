@@ -0,0 +1,427 @@
+import argparse
+import fnmatch
+import json
+import os
+import queue
+import random
+import re
+import shutil
+import stat
+import sys
+import tempfile
+import threading
+import time
+
+# Directory walkers; the work is mostly system calls, which release the GIL
+DEFAULT_THREADS = 8
+
+# Files of one directory removed at a time, through the directory's descriptor
+UNLINK_BATCH = 256
+
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+SIZE_UNITS = {"": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3, "t": 1024 ** 4}
+
+
+def parse_duration(text):
+    """Return the seconds in ``"90"``, ``"15m"``, ``"12h"``, ``"30d"`` or ``"2w"``."""
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([smhdw]?)", text.strip().lower())
+    if not match:
+        raise ValueError(f"Bad duration: {text}")
+    return float(match.group(1)) * DURATION_UNITS[match.group(2) or "s"]
+
+
+def parse_size(text):
+    """Return the bytes in ``"512"``, ``"10k"``, ``"100M"`` or ``"2G"``."""
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([kmgt]?)b?", text.strip().lower())
+    if not match:
+        raise ValueError(f"Bad size: {text}")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2)])
+
+
+class Rule:
+    """Files whose names match ``pattern`` and that are older and bigger than the limits given.
+
+    ``older_than`` is in seconds since the last modification and
+    ``larger_than`` in bytes; either may be None to not check it.
+    """
+
+    def __init__(self, pattern="*", older_than=None, larger_than=None):
+        self.pattern = pattern
+        self.older_than = older_than
+        self.larger_than = larger_than
+        # "*" matches every name, which needs no regex
+        self._match = None if pattern == "*" else re.compile(fnmatch.translate(pattern)).match
+
+    def wants(self, name):
+        """Return whether the name alone could make the file match, so it is worth a stat."""
+        return self._match is None or self._match(name) is not None
+
+    def matches(self, name, st, now):
+        if self._match is not None and self._match(name) is None:
+            return False
+        if self.older_than is not None and now - st.st_mtime <= self.older_than:
+            return False
+        if self.larger_than is not None and st.st_size <= self.larger_than:
+            return False
+        return True
+
+    def __repr__(self):
+        return f"Rule({self.pattern!r}, older_than={self.older_than!r}, larger_than={self.larger_than!r})"
+
+
+class RetentionPolicy:
+    """Deletes a file that matches any of ``rules`` and none of the ``keep`` patterns.
+
+    Any object with the same ``wants`` and ``matches`` methods can be given
+    to cleanup instead, for rules this class cannot express. The name
+    patterns are joined into one regex each for the rules and the keep
+    list, since ``wants`` runs for every file of the tree.
+    """
+
+    def __init__(self, rules, keep=()):
+        self.rules = list(rules)
+        self.keep = list(keep)
+        self._keep = _any_pattern(self.keep)
+        self._wanted = None if any(rule.pattern == "*" for rule in self.rules) else _any_pattern(rule.pattern for rule in self.rules)
+
+    def wants(self, name):
+        if self._keep is not None and self._keep(name) is not None:
+            return False
+        return self._wanted is None or self._wanted(name) is not None
+
+    def matches(self, name, st, now):
+        return any(rule.matches(name, st, now) for rule in self.rules)
+
+
+def _any_pattern(patterns):
+    """Return the match method of one regex for all the glob ``patterns``, or None if there are none."""
+    patterns = list(patterns)
+    if not patterns:
+        return None
+    return re.compile("|".join(fnmatch.translate(pattern) for pattern in patterns)).match
+
+
+class CleanupReport:
+    """What one cleanup saw and removed, or would remove in a dry run."""
+
+    def __init__(self):
+        self.directories = 0
+        self.files = 0
+        self.stats = 0
+        self.matched = 0
+        self.matched_bytes = 0
+        self.deleted = 0
+        self.errors = []
+        self.paths = []
+
+    def merge(self, other):
+        self.directories += other.directories
+        self.files += other.files
+        self.stats += other.stats
+        self.matched += other.matched
+        self.matched_bytes += other.matched_bytes
+        self.deleted += other.deleted
+        self.errors.extend(other.errors)
+        self.paths.extend(other.paths)
+
+    def to_dict(self):
+        return {
+            "directories": self.directories,
+            "files": self.files,
+            "stats": self.stats,
+            "matched": self.matched,
+            "matched_bytes": self.matched_bytes,
+            "deleted": self.deleted,
+            "errors": self.errors
+        }
+
+
+class _OpenDirectory:
+    """A directory descriptor shared by the directory's scan and its queued subdirectories.
+
+    Subdirectories are opened relative to it, so it stays open until the
+    scan and every subdirectory have let go of it.
+    """
+
+    def __init__(self, fd, path):
+        self.fd = fd
+        self.path = path
+        self._users = 1
+        self._lock = threading.Lock()
+
+    def hold(self, count):
+        with self._lock:
+            self._users += count
+
+    def release(self):
+        with self._lock:
+            self._users -= 1
+            if self._users:
+                return
+        os.close(self.fd)
+
+
+def _open_directory(parent, name, path):
+    """Open a root by path, or a subdirectory by name relative to its parent's descriptor.
+
+    A subdirectory is opened with O_NOFOLLOW, so one swapped for a symlink
+    after its parent was scanned fails to open instead of leading the
+    cleanup into the symlink's target.
+    """
+    if parent is None:
+        return os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    return os.open(name, os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW, dir_fd=parent.fd)
+
+
+def _clean_directory(fd, path, policy, now, dry_run, collect, report, subdirs):
+    """Scan one open directory, remove its matching files and append the names of its subdirectories to ``subdirs``.
+
+    Everything in the directory is reached relative to its descriptor, so
+    the kernel does not resolve the whole path again for every stat and
+    unlink, and no path can be redirected midway. The file type comes from
+    the directory entry itself, and only the files whose names a rule
+    wants are stat'ed.
+    """
+    doomed = []
+    with os.scandir(fd) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.name)
+                    continue
+                report.files += 1
+                if not policy.wants(entry.name):
+                    continue
+                st = entry.stat(follow_symlinks=False)
+                report.stats += 1
+            except OSError as error:
+                report.errors.append(f"{os.path.join(path, entry.name)}: {error.strerror}")
+                continue
+            if stat.S_ISREG(st.st_mode) and policy.matches(entry.name, st, now):
+                report.matched += 1
+                report.matched_bytes += st.st_size
+                doomed.append(entry.name)
+                if collect:
+                    report.paths.append(os.path.join(path, entry.name))
+                if not dry_run and len(doomed) >= UNLINK_BATCH:
+                    _unlink_batch(path, fd, doomed, report)
+                    doomed = []
+    if not dry_run and doomed:
+        _unlink_batch(path, fd, doomed, report)
+    report.directories += 1
+
+
+def _unlink_batch(path, fd, names, report):
+    for name in names:
+        try:
+            os.unlink(name, dir_fd=fd)
+            report.deleted += 1
+        except OSError as error:
+            report.errors.append(f"{os.path.join(path, name)}: {error.strerror}")
+
+
+def cleanup(roots, policy, dry_run=True, threads=DEFAULT_THREADS, collect=False, now=None):
+    """Walk ``roots`` on ``threads`` threads and remove the files ``policy`` matches; return a CleanupReport.
+
+    Each thread takes a directory off a shared queue, handles its files and
+    queues its subdirectories, so wide and deep trees alike keep all
+    threads busy. Subdirectories are opened relative to their parent's
+    descriptor, so symlinks are never followed nor removed, even ones
+    swapped in during the walk. The queue is last in, first out, so the
+    walk goes deep first and only the descriptors of about ``threads``
+    paths from the roots are open at once. Nothing is removed in a dry
+    run, and ``collect`` lists the matching paths in the report.
+    """
+    now = time.time() if now is None else now
+    pending = queue.LifoQueue()
+    for root in roots:
+        pending.put((None, None, root))
+    reports = []
+
+    def walk():
+        report = CleanupReport()
+        reports.append(report)
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            parent, name, path = item
+            try:
+                try:
+                    fd = _open_directory(parent, name, path)
+                finally:
+                    if parent is not None:
+                        parent.release()
+                directory = _OpenDirectory(fd, path)
+                subdirs = []
+                try:
+                    _clean_directory(fd, path, policy, now, dry_run, collect, report, subdirs)
+                finally:
+                    directory.hold(len(subdirs))
+                    for subdir in subdirs:
+                        pending.put((directory, subdir, os.path.join(path, subdir)))
+                    directory.release()
+            except OSError as error:
+                report.errors.append(f"{path}: {error.strerror or error}")
+            except Exception as error:
+                # A failing policy or a bug must not end the thread, or pending.join() waits forever
+                report.errors.append(f"{path}: {type(error).__name__}: {error}")
+            finally:
+                pending.task_done()
+
+    workers = [threading.Thread(target=walk, daemon=True) for _ in range(max(threads, 1))]
+    for worker in workers:
+        worker.start()
+    pending.join()
+    for _ in workers:
+        pending.put(None)
+    for worker in workers:
+        worker.join()
+
+    total = CleanupReport()
+    for report in reports:
+        total.merge(report)
+    total.paths.sort()
+    return total
+
+
+def walk_cleanup(roots, policy, dry_run=True, now=None):
+    """The usual way: os.walk, then a stat per file through its full path. Kept as the benchmark baseline."""
+    now = time.time() if now is None else now
+    report = CleanupReport()
+    for root in roots:
+        for dirpath, dirnames, filenames in os.walk(root):
+            report.directories += 1
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                report.files += 1
+                st = os.lstat(path)
+                report.stats += 1
+                if stat.S_ISREG(st.st_mode) and policy.wants(name) and policy.matches(name, st, now):
+                    report.matched += 1
+                    report.matched_bytes += st.st_size
+                    report.paths.append(path)
+                    if not dry_run:
+                        os.remove(path)
+                        report.deleted += 1
+    report.paths.sort()
+    return report
+
+
+def make_tree(root, depth, fanout, files, seed=0, max_age=90 * 86400):
+    """Create ``fanout`` directories per level ``depth`` levels down, each with ``files`` small files.
+
+    The files are logs, rotated logs and a few others with modification
+    times spread over the last ``max_age`` seconds. Returns the file count.
+    """
+    rng = random.Random(seed)
+    now = time.time()
+    names = ["app.log", "app.log.1", "app.log.2.gz", "error.log", "core.dump", "cache.tmp", "data.json"]
+    count = 0
+    level = [root]
+    for _ in range(depth + 1):
+        below = []
+        for directory in level:
+            os.makedirs(directory, exist_ok=True)
+            for index in range(files):
+                path = os.path.join(directory, f"{index}-{rng.choice(names)}")
+                with open(path, "wb") as file:
+                    file.write(b"x" * rng.randrange(0, 4096))
+                mtime = now - rng.random() * max_age
+                os.utime(path, (mtime, mtime))
+                count += 1
+            below.extend(os.path.join(directory, f"d{index}") for index in range(fanout))
+        level = below
+    return count
+
+
+def bench(args):
+    """Time a dry run of cleanup against the os.walk loop on a generated tree, then really clean it."""
+    workdir = tempfile.mkdtemp(prefix="cleanup-bench-")
+    try:
+        count = make_tree(workdir, args.depth, args.fanout, args.files, args.seed)
+        policy = RetentionPolicy([Rule("*.log*", older_than=30 * 86400), Rule("*.tmp"), Rule("*", larger_than=4000)], keep=["*.json"])
+        now = time.time()
+
+        start = time.perf_counter()
+        baseline = walk_cleanup([workdir], policy, now=now)
+        walk_s = time.perf_counter() - start
+        start = time.perf_counter()
+        dry = cleanup([workdir], policy, threads=args.threads, collect=True, now=now)
+        scandir_s = time.perf_counter() - start
+        if dry.paths != baseline.paths:
+            sys.exit("cleanup and os.walk matched different files")
+
+        start = time.perf_counter()
+        real = cleanup([workdir], policy, dry_run=False, threads=args.threads, now=now)
+        delete_s = time.perf_counter() - start
+        if real.deleted != baseline.matched or cleanup([workdir], policy, now=now).matched:
+            sys.exit("cleanup did not remove every matching file")
+
+        report = {
+            "files": count,
+            "directories": dry.directories,
+            "matched": dry.matched,
+            "threads": args.threads,
+            "walk_s": round(walk_s, 3),
+            "walk_stats": baseline.stats,
+            "scandir_s": round(scandir_s, 3),
+            "scandir_stats": dry.stats,
+            "delete_s": round(delete_s, 3)
+        }
+        print(f"os.walk {walk_s:.2f} s ({baseline.stats} stats)  scandir x{args.threads} {scandir_s:.2f} s "
+              f"({dry.stats} stats)  delete {dry.matched} files {delete_s:.2f} s", file=sys.stderr)
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run(args):
+    rules = [
+        Rule(pattern,
+             parse_duration(args.older_than) if args.older_than else None,
+             parse_size(args.larger_than) if args.larger_than else None)
+        for pattern in args.pattern
+    ]
+    policy = RetentionPolicy(rules, args.keep)
+    report = cleanup(args.roots, policy, dry_run=not args.delete, threads=args.threads, collect=args.list)
+    for path in report.paths:
+        print(path)
+    summary = report.to_dict()
+    summary["dry_run"] = not args.delete
+    json.dump(summary, sys.stderr, indent=2)
+    sys.stderr.write("\n")
+    if report.errors:
+        sys.exit(1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Remove old or big files from directory trees on several threads.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="find, and with --delete remove, the files matching the rules")
+    run_parser.add_argument("roots", nargs="+")
+    run_parser.add_argument("--pattern", nargs="+", default=["*"], help="file names the rules apply to (default: *)")
+    run_parser.add_argument("--older-than", help="only files last modified longer ago than this, like 30d or 12h")
+    run_parser.add_argument("--larger-than", help="only files bigger than this, like 100M")
+    run_parser.add_argument("--keep", nargs="+", default=[], help="file names never to remove")
+    run_parser.add_argument("--threads", type=int, default=DEFAULT_THREADS)
+    run_parser.add_argument("--list", action="store_true", help="print the matching paths on stdout")
+    run_parser.add_argument("--delete", action="store_true", help="remove the files instead of only counting them")
+    run_parser.set_defaults(func=run)
+
+    bench_parser = commands.add_parser("bench", help="compare with an os.walk loop on a generated tree")
+    bench_parser.add_argument("--depth", type=int, default=3)
+    bench_parser.add_argument("--fanout", type=int, default=8)
+    bench_parser.add_argument("--files", type=int, default=100, help="files per directory (default: 100)")
+    bench_parser.add_argument("--threads", type=int, default=DEFAULT_THREADS)
+    bench_parser.add_argument("--seed", type=int, default=0)
+    bench_parser.set_defaults(func=bench)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+import argparse
+import json
+import operator
+import sys
+import time
+
+import numpy as np
+
+# Numeric metrics kept per host, all as float32; a missing value is NaN and breaks no rule
+METRICS = ("cpu", "disk", "uptime", "latency")
+
+# Host states, stored as their index in this tuple
+STATUSES = ("up", "down", "degraded", "maintenance")
+STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+
+OPERATORS = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "==": operator.eq,
+    "!=": operator.ne
+}
+
+
+class FleetMetrics:
+    """The latest metrics of a fleet of hosts, one NumPy array per metric.
+
+    Host ``i`` is ``names[i]``; its CPU and disk use in percent, uptime in
+    percent and latency in milliseconds are ``cpu[i]``, ``disk[i]``,
+    ``uptime[i]`` and ``latency[i]``, and ``status[i]`` indexes STATUSES.
+    Values are numbers, so "100" is more than "90" here, unlike in a
+    string comparison.
+    """
+
+    def __init__(self, names, status=None, **metrics):
+        self.names = np.asarray(names, dtype=str)
+        count = len(self.names)
+        unknown = set(metrics) - set(METRICS)
+        if unknown:
+            raise ValueError(f"Unknown metrics: {', '.join(sorted(unknown))}")
+        for metric in METRICS:
+            values = metrics.get(metric)
+            column = np.full(count, np.nan, dtype=np.float32) if values is None else np.asarray(values, dtype=np.float32)
+            if column.shape != (count,):
+                raise ValueError(f"{metric} has {column.size} values for {count} hosts")
+            setattr(self, metric, column)
+        self.status = np.zeros(count, dtype=np.uint8) if status is None else encode_statuses(status)
+        if self.status.shape != (count,):
+            raise ValueError(f"status has {self.status.size} values for {count} hosts")
+
+    @classmethod
+    def from_records(cls, records):
+        """Build the arrays from dicts like ``{"name": "dbserver", "cpu": "96", "status": "down"}``.
+
+        Numbers given as strings are parsed, and a missing metric is NaN.
+        """
+        records = list(records)
+        columns = {
+            metric: [record.get(metric) for record in records]
+            for metric in METRICS
+            if any(metric in record for record in records)
+        }
+        for metric, values in columns.items():
+            columns[metric] = [np.nan if value in (None, "") else value for value in values]
+        return cls(
+            [record["name"] for record in records],
+            status=[record.get("status", "up") for record in records],
+            **columns
+        )
+
+    def __len__(self):
+        return len(self.names)
+
+    def column(self, metric):
+        """Return the array of one metric, or of the status codes."""
+        if metric != "status" and metric not in METRICS:
+            raise ValueError(f"Unknown metric: {metric}")
+        return getattr(self, metric)
+
+    def set_metric(self, metric, values, hosts=None):
+        """Store new values of a metric for all hosts, or for the hosts at the indexes in ``hosts``."""
+        column = self.column(metric)
+        if metric == "status":
+            values = encode_statuses(values)
+        if hosts is None:
+            column[:] = values
+        else:
+            column[hosts] = values
+
+
+def encode_statuses(statuses):
+    """Return the STATUSES codes of an array of status names as uint8."""
+    statuses = np.asarray(statuses)
+    if statuses.dtype.kind in "iu":
+        return statuses.astype(np.uint8)
+    # Look each distinct name up once, not once per host
+    names, inverse = np.unique(statuses, return_inverse=True)
+    unknown = [str(name) for name in names if name not in STATUS_CODES]
+    if unknown:
+        raise ValueError(f"Unknown status: {', '.join(unknown)}")
+    codes = np.array([STATUS_CODES[name] for name in names], dtype=np.uint8)
+    return codes[inverse.reshape(statuses.shape)]
+
+
+class Rule:
+    """A threshold that a host breaks when ``metric op threshold`` holds, such as ``cpu > 90``."""
+
+    def __init__(self, name, metric, op, threshold):
+        if op not in OPERATORS:
+            raise ValueError(f"Unknown operator: {op}")
+        self.name = name
+        self.metric = metric
+        self.op = op
+        self.threshold = threshold
+
+    def mask(self, fleet):
+        """Return a boolean array that is True for the hosts that break the rule."""
+        threshold = self.threshold
+        if self.metric == "status":
+            threshold = STATUS_CODES[threshold]
+        # NaN compares False both ways, so an unknown value breaks no threshold
+        return OPERATORS[self.op](fleet.column(self.metric), threshold)
+
+    def __repr__(self):
+        return f"Rule({self.name!r}, {self.metric!r}, {self.op!r}, {self.threshold!r})"
+
+
+# The thresholds from the notebooks' checks
+DEFAULT_RULES = [
+    Rule("down", "status", "!=", "up"),
+    Rule("high_cpu", "cpu", ">", 90),
+    Rule("high_disk", "disk", ">", 80),
+    Rule("low_uptime", "uptime", "<", 90),
+    Rule("high_latency", "latency", ">", 200)
+]
+
+
+def evaluate(fleet, rules=DEFAULT_RULES):
+    """Return ``{rule name: names of the hosts that break it}``, each an array in host order.
+
+    Every rule is one comparison over a whole column, so the cost is a few
+    passes over contiguous memory whatever the number of hosts.
+    """
+    return {rule.name: fleet.names[np.flatnonzero(rule.mask(fleet))] for rule in rules}
+
+
+def unhealthy(fleet, rules=DEFAULT_RULES):
+    """Return the names of the hosts that break at least one rule."""
+    broken = np.zeros(len(fleet), dtype=bool)
+    for rule in rules:
+        broken |= rule.mask(fleet)
+    return fleet.names[np.flatnonzero(broken)]
+
+
+def random_fleet(hosts, seed=0):
+    """Return a FleetMetrics of ``hosts`` hosts with random, mostly healthy metrics."""
+    rng = np.random.default_rng(seed)
+    # As wide as the longest name, since every offending name is copied out of this array
+    names = np.char.add("srv", np.arange(hosts).astype(str)).astype(f"<U{3 + len(str(max(hosts - 1, 0)))}")
+    return FleetMetrics(
+        names,
+        status=rng.choice(len(STATUSES), size=hosts, p=[0.97, 0.01, 0.01, 0.01]).astype(np.uint8),
+        cpu=rng.beta(2, 5, hosts) * 100,
+        disk=rng.beta(5, 3, hosts) * 100,
+        uptime=100 - rng.exponential(2, hosts),
+        latency=rng.gamma(2, 40, hosts)
+    )
+
+
+def evaluate_records(records, rules=DEFAULT_RULES):
+    """The notebooks' way: loop over the hosts as dicts. Kept as the benchmark baseline."""
+    result = {rule.name: [] for rule in rules}
+    for record in records:
+        for rule in rules:
+            if OPERATORS[rule.op](record[rule.metric], rule.threshold):
+                result[rule.name].append(record["name"])
+    return result
+
+
+def bench(args):
+    """Time evaluate on a random fleet, and the dict loop on the same hosts once."""
+    fleet = random_fleet(args.hosts, args.seed)
+    samples = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        result = evaluate(fleet)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    report = {
+        "hosts": args.hosts,
+        "runs": args.runs,
+        "p50_ms": round(samples[len(samples) // 2], 3),
+        "max_ms": round(samples[-1], 3),
+        "offending": {name: int(len(hosts)) for name, hosts in result.items()}
+    }
+    print(f"vectorized {args.hosts:>9} hosts  p50 {report['p50_ms']:>9.3f} ms  max {report['max_ms']:>9.3f} ms", file=sys.stderr)
+
+    if not args.skip_loop:
+        records = [
+            {"name": str(fleet.names[i]), "status": STATUSES[fleet.status[i]], "cpu": float(fleet.cpu[i]),
+             "disk": float(fleet.disk[i]), "uptime": float(fleet.uptime[i]), "latency": float(fleet.latency[i])}
+            for i in range(len(fleet))
+        ]
+        start = time.perf_counter()
+        loop_result = evaluate_records(records)
+        report["loop_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        if {name: len(hosts) for name, hosts in loop_result.items()} != report["offending"]:
+            sys.exit("The dict loop found different hosts")
+        print(f"dict loop  {args.hosts:>9} hosts  {report['loop_ms']:>13.3f} ms", file=sys.stderr)
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+def check(args):
+    with open(args.path) as file:
+        text = file.read()
+    records = json.loads(text) if text.lstrip().startswith("[") else [json.loads(line) for line in text.splitlines() if line.strip()]
+    rules = [
+        Rule("down", "status", "!=", "up"),
+        Rule("high_cpu", "cpu", ">", args.cpu),
+        Rule("high_disk", "disk", ">", args.disk),
+        Rule("low_uptime", "uptime", "<", args.uptime),
+        Rule("high_latency", "latency", ">", args.latency)
+    ]
+    result = evaluate(FleetMetrics.from_records(records), rules)
+    json.dump({name: hosts.tolist() for name, hosts in result.items()}, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find the hosts of a fleet that break health thresholds.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    check_parser = commands.add_parser("check", help="check hosts from a JSON array or JSON Lines file")
+    check_parser.add_argument("path")
+    check_parser.add_argument("--cpu", type=float, default=90, help="highest healthy CPU use in percent (default: 90)")
+    check_parser.add_argument("--disk", type=float, default=80, help="highest healthy disk use in percent (default: 80)")
+    check_parser.add_argument("--uptime", type=float, default=90, help="lowest healthy uptime in percent (default: 90)")
+    check_parser.add_argument("--latency", type=float, default=200, help="highest healthy latency in ms (default: 200)")
+    check_parser.set_defaults(func=check)
+
+    bench_parser = commands.add_parser("bench", help="time the rules on a random fleet")
+    bench_parser.add_argument("--hosts", type=int, default=1000000)
+    bench_parser.add_argument("--runs", type=int, default=20)
+    bench_parser.add_argument("--seed", type=int, default=0)
+    bench_parser.add_argument("--skip-loop", action="store_true", help="do not time the dict loop baseline")
+    bench_parser.set_defaults(func=bench)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
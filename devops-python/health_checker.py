@@ -0,0 +1,341 @@
+import argparse
+import asyncio
+import heapq
+import json
+import random
+import sys
+import time
+from urllib.parse import urlsplit
+
+DEFAULT_CONCURRENCY = 200
+# Seconds a single probe may take before the host counts as down
+DEFAULT_TIMEOUT = 2.0
+# Seconds between checks of a healthy host
+DEFAULT_INTERVAL = 30.0
+# Intervals are stretched or shrunk at random by up to this fraction, so checks do not bunch up
+DEFAULT_JITTER = 0.1
+# Seconds before the first retry of a failed host; each further failure doubles it
+DEFAULT_RETRY = 1.0
+DEFAULT_MAX_BACKOFF = 300.0
+
+
+class Endpoint:
+    """One host to probe: a TCP connect, or an HTTP(S) GET that must answer 2xx or 3xx."""
+
+    def __init__(self, kind, host, port, path="/", timeout=None, name=None):
+        if kind not in ("tcp", "http", "https"):
+            raise ValueError(f"Unknown probe kind: {kind}")
+        self.kind = kind
+        self.host = host
+        self.port = port
+        self.path = path
+        # Overrides the checker's timeout for this host
+        self.timeout = timeout
+        self.name = name or (f"{kind}://{host}:{port}" + (path if kind != "tcp" else ""))
+
+    def __repr__(self):
+        return f"Endpoint({self.name!r})"
+
+
+def parse_endpoint(text, timeout=None):
+    """Return the Endpoint for ``tcp://host:port``, ``http://host[:port]/path`` or ``https://...``."""
+    parts = urlsplit(text)
+    if parts.scheme not in ("tcp", "http", "https") or not parts.hostname:
+        raise ValueError(f"Not a tcp://, http:// or https:// address: {text!r}")
+    port = parts.port or {"http": 80, "https": 443}.get(parts.scheme)
+    if port is None:
+        raise ValueError(f"No port in {text!r}")
+    path = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+    return Endpoint(parts.scheme, parts.hostname, port, path, timeout, text)
+
+
+async def probe(endpoint, timeout):
+    """Probe one endpoint and return ``(ok, status, error, latency in ms)``; never raises for the host's faults."""
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    status = None
+    error = None
+    try:
+        status = await asyncio.wait_for(_probe(endpoint), timeout)
+    except asyncio.TimeoutError:
+        error = f"timeout after {timeout:g}s"
+    except (OSError, ValueError) as exc:
+        error = exc.strerror or str(exc) if isinstance(exc, OSError) else str(exc)
+    ok = error is None and (status is None or 200 <= status < 400)
+    if error is None and not ok:
+        error = f"HTTP {status}"
+    return ok, status, error, (loop.time() - start) * 1000
+
+
+async def _probe(endpoint):
+    reader, writer = await asyncio.open_connection(endpoint.host, endpoint.port, ssl=endpoint.kind == "https" or None)
+    try:
+        if endpoint.kind == "tcp":
+            return None
+        writer.write(
+            f"GET {endpoint.path} HTTP/1.1\r\nHost: {endpoint.host}\r\nUser-Agent: health-checker\r\n"
+            f"Connection: close\r\n\r\n".encode("ascii")
+        )
+        await writer.drain()
+        status_line = await reader.readline()
+        parts = status_line.split()
+        if len(parts) < 2 or not parts[0].startswith(b"HTTP/") or not parts[1].isdigit():
+            raise ValueError(f"Not an HTTP response: {status_line[:80]!r}")
+        return int(parts[1])
+    finally:
+        writer.close()
+
+
+class HealthChecker:
+    """Probe many endpoints over and over, at most ``concurrency`` at a time, and stream the results.
+
+    A fixed set of worker tasks takes due endpoints off a queue, so memory
+    and open sockets stay bounded however many endpoints there are. Each
+    probe has its own timeout, and a result is handed out the moment its
+    probe finishes, so a slow host only ever holds up its own worker.
+
+    A healthy host is checked again after ``interval`` seconds and a failing
+    one after ``retry`` seconds, doubling with every further failure up to
+    ``max_backoff``. Every delay is jittered by up to ``jitter`` of itself,
+    and the first round is spread over ``jitter * interval`` seconds, so
+    checks do not arrive at the endpoints in bursts.
+    """
+
+    def __init__(self, endpoints, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT,
+                 interval=DEFAULT_INTERVAL, jitter=DEFAULT_JITTER, retry=DEFAULT_RETRY,
+                 max_backoff=DEFAULT_MAX_BACKOFF, seed=None):
+        self.endpoints = [parse_endpoint(endpoint) if isinstance(endpoint, str) else endpoint for endpoint in endpoints]
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.interval = interval
+        self.jitter = jitter
+        self.retry = retry
+        self.max_backoff = max_backoff
+        # Consecutive failures per endpoint
+        self.failures = [0] * len(self.endpoints)
+        self._rng = random.Random(seed)
+
+    def next_delay(self, index):
+        """Return the seconds until endpoint ``index`` is checked again, from its failure count."""
+        failures = self.failures[index]
+        if failures:
+            delay = min(self.retry * 2 ** (failures - 1), self.max_backoff)
+        else:
+            delay = self.interval
+        return delay * self._rng.uniform(1 - self.jitter, 1 + self.jitter)
+
+    async def run(self, rounds=None):
+        """Yield a result dict for each probe as it finishes.
+
+        With ``rounds`` every endpoint is checked that many times and the
+        generator ends; otherwise it runs until it is closed or cancelled.
+        """
+        if not self.endpoints:
+            return
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        spread = self.interval * self.jitter if rounds != 1 else 0.0
+        due = [(now + self._rng.uniform(0, spread), index) for index in range(len(self.endpoints))]
+        heapq.heapify(due)
+        checks_left = [rounds] * len(self.endpoints) if rounds else None
+
+        work = asyncio.Queue()
+        results = asyncio.Queue()
+        workers = [asyncio.ensure_future(self._worker(work, results)) for _ in range(min(self.concurrency, len(self.endpoints)))]
+        running = 0
+        try:
+            while due or running:
+                now = loop.time()
+                while due and due[0][0] <= now:
+                    work.put_nowait(heapq.heappop(due)[1])
+                    running += 1
+                try:
+                    if due and results.empty():
+                        # Wake for the next due check if no result comes first
+                        result = await asyncio.wait_for(results.get(), due[0][0] - now)
+                    else:
+                        result = await results.get()
+                except asyncio.TimeoutError:
+                    continue
+                running -= 1
+                index = result.pop("index")
+                if checks_left is not None:
+                    checks_left[index] -= 1
+                if checks_left is None or checks_left[index] > 0:
+                    delay = self.next_delay(index)
+                    heapq.heappush(due, (loop.time() + delay, index))
+                    result["next_in"] = round(delay, 3)
+                yield result
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    async def _worker(self, work, results):
+        while True:
+            index = await work.get()
+            endpoint = self.endpoints[index]
+            timeout = self.timeout if endpoint.timeout is None else endpoint.timeout
+            try:
+                ok, status, error, latency = await probe(endpoint, timeout)
+            except Exception as exc:
+                # Anything probe does not expect still needs a result, or run waits for it forever
+                ok, status, error, latency = False, None, f"{type(exc).__name__}: {exc}", 0.0
+            self.failures[index] = 0 if ok else self.failures[index] + 1
+            results.put_nowait({
+                "index": index,
+                "endpoint": endpoint.name,
+                "ok": ok,
+                "status": status,
+                "error": error,
+                "latency_ms": round(latency, 3),
+                "failures": self.failures[index],
+                "time": time.time()
+            })
+
+
+async def serve_stub(host="127.0.0.1", port=0, slow_seconds=5.0):
+    """Start a stand-in HTTP server for trying the checker out; returns the asyncio server.
+
+    Any path answers 200 after reading the request, except that paths
+    containing "fail" answer 503 and paths containing "slow" first wait
+    ``slow_seconds``.
+    """
+    async def handle(reader, writer):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.split()
+            path = parts[1].decode("ascii", "replace") if len(parts) > 1 else "/"
+            if "slow" in path:
+                await asyncio.sleep(slow_seconds)
+            status = "503 Service Unavailable" if "fail" in path else "200 OK"
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n".encode("ascii"))
+            await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port, backlog=1024)
+
+
+async def bench_round(endpoints, concurrency, timeout):
+    """Check every endpoint once and return the results and the seconds at which each arrived."""
+    checker = HealthChecker(endpoints, concurrency=concurrency, timeout=timeout)
+    start = time.perf_counter()
+    results = []
+    async for result in checker.run(rounds=1):
+        results.append((time.perf_counter() - start, result))
+    return results
+
+
+async def bench_async(args):
+    server = await serve_stub(slow_seconds=args.timeout * 3)
+    port = server.sockets[0].getsockname()[1]
+    endpoints = []
+    for i in range(args.endpoints):
+        if i % 100 == 0:
+            path = f"/slow/{i}"
+        elif i % 50 == 0:
+            path = f"/fail/{i}"
+        else:
+            path = f"/ok/{i}"
+        endpoints.append(f"http://127.0.0.1:{port}{path}")
+
+    report = {"endpoints": args.endpoints, "timeout_s": args.timeout, "runs": []}
+    for concurrency in (1, args.concurrency):
+        # One at a time only gets a sample, since every slow host costs it a whole timeout
+        sample = endpoints if concurrency > 1 else endpoints[1:args.sequential_sample + 1]
+        results = await bench_round(sample, concurrency, args.timeout)
+        total = results[-1][0]
+        healthy = [at for at, result in results if result["ok"]]
+        run = {
+            "concurrency": concurrency,
+            "checked": len(results),
+            "seconds": round(total, 3),
+            "checks_per_s": round(len(results) / total, 1),
+            "ok": len(healthy),
+            "failed": len(results) - len(healthy),
+            # When the last healthy host was reported; slow hosts must not push this out
+            "last_ok_at_s": round(max(healthy), 3) if healthy else None
+        }
+        report["runs"].append(run)
+        print(f"concurrency {concurrency:>5}  {run['checked']:>6} checks  {total:>8.2f} s  {run['checks_per_s']:>9.1f} checks/s  "
+              f"last healthy result at {run['last_ok_at_s']} s", file=sys.stderr)
+    server.close()
+    await server.wait_closed()
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+def read_targets(args):
+    targets = list(args.targets)
+    if args.file:
+        with open(args.file) as file:
+            for line in file:
+                fields = line.split()
+                if fields and not fields[0].startswith("#"):
+                    # An optional second field is that host's timeout in seconds
+                    targets.append(parse_endpoint(fields[0], float(fields[1]) if len(fields) > 1 else None))
+    return targets
+
+
+async def check_async(args):
+    checker = HealthChecker(read_targets(args), args.concurrency, args.timeout, args.interval, args.jitter,
+                            args.retry, args.max_backoff)
+    async for result in checker.run(rounds=args.rounds):
+        if result["ok"] and args.failures_only:
+            continue
+        print(json.dumps(result), flush=True)
+
+
+async def stub_async(args):
+    server = await serve_stub(args.host, args.port, args.slow)
+    print(f"Serving on http://{args.host}:{server.sockets[0].getsockname()[1]}/", file=sys.stderr)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Health-check many endpoints concurrently and stream the results.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    check_parser = commands.add_parser("check", help="probe endpoints and print one JSON line per result")
+    check_parser.add_argument("targets", nargs="*", help="tcp://host:port, http://host[:port]/path or https://...")
+    check_parser.add_argument("-f", "--file", help="read more targets from this file, one per line, optionally followed by a timeout")
+    check_parser.add_argument("--rounds", type=int, help="stop after checking every endpoint this many times (default: run forever)")
+    check_parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    check_parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="seconds per probe")
+    check_parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL, help="seconds between checks of a healthy host")
+    check_parser.add_argument("--jitter", type=float, default=DEFAULT_JITTER, help="random fraction added to or taken off each delay")
+    check_parser.add_argument("--retry", type=float, default=DEFAULT_RETRY, help="seconds before the first retry of a failed host")
+    check_parser.add_argument("--max-backoff", type=float, default=DEFAULT_MAX_BACKOFF)
+    check_parser.add_argument("--failures-only", action="store_true", help="only print failed checks")
+    check_parser.set_defaults(func=check_async)
+
+    stub_parser = commands.add_parser("stub", help="run a stand-in HTTP server to check against")
+    stub_parser.add_argument("--host", default="127.0.0.1")
+    stub_parser.add_argument("--port", type=int, default=8080)
+    stub_parser.add_argument("--slow", type=float, default=5.0, help="seconds that paths containing 'slow' take")
+    stub_parser.set_defaults(func=stub_async)
+
+    bench_parser = commands.add_parser("bench", help="check endpoints on a local stand-in server, one at a time and concurrently")
+    bench_parser.add_argument("--endpoints", type=int, default=5000)
+    bench_parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    bench_parser.add_argument("--timeout", type=float, default=1.0)
+    bench_parser.add_argument("--sequential-sample", type=int, default=300, help="endpoints checked one at a time (default: 300)")
+    bench_parser.set_defaults(func=bench_async)
+
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(args.func(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
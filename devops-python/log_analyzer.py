@@ -0,0 +1,332 @@
+import argparse
+import gzip
+import json
+import mmap
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+
+# What may come before the level on a line: nothing, or a date and/or time
+TIMESTAMP = rb"(?:\d[^ \t\r\n]* (?:\d[^ \t\r\n]* )?)?"
+TIMESTAMP_RE = re.compile(TIMESTAMP)
+
+# One pass per line: an optional timestamp, the level, an optional numeric code and the message.
+# Matches "ERROR:404 Service not found", "ERROR: Timeout" and "2026-01-01 12:00:00 WARNING:Memory high".
+LINE_RE = re.compile(rb"^" + TIMESTAMP + rb"([A-Z]+):[ \t]*(?:(\d+)\b[ \t]*)?([^\r\n]*)")
+
+# Bytes handed to the matcher at a time; each window ends on a line boundary
+CHUNK_SIZE = 8 * 1024 * 1024
+
+# Most distinct messages kept per level, so a log full of unique lines cannot exhaust memory
+MAX_UNIQUE = 10000
+
+
+def level_pattern(level):
+    """Return the matcher for the code and message of lines at ``level``, given as bytes.
+
+    It starts with the level itself, which lets the regex engine skip to
+    each occurrence with a fast literal search instead of trying every
+    line; LogStats checks that the occurrence is where a level belongs.
+    """
+    return re.compile(re.escape(level) + rb":[ \t]*(?:(\d+)\b[ \t]*)?([^\r\n]*)")
+
+
+class LogStats:
+    """Counts for some levels of one or more logs, in memory that does not grow with their size.
+
+    For every level in ``track`` (bytes, ERROR by default) it counts the
+    lines, the numeric codes that follow the level and the distinct
+    messages, up to ``max_unique`` of them per level; ``dropped`` counts
+    the lines whose message did not fit. ``lines`` and ``bytes`` cover
+    the whole input. Everything is kept as bytes until to_dict.
+    """
+
+    def __init__(self, track=(b"ERROR",), max_unique=MAX_UNIQUE):
+        self.track = tuple(track)
+        self.max_unique = max_unique
+        self.lines = 0
+        self.bytes = 0
+        self.levels = Counter({level: 0 for level in self.track})
+        self.codes = {level: Counter() for level in self.track}
+        self.unique_messages = {level: set() for level in self.track}
+        self.dropped = 0
+        self._patterns = [(level, level_pattern(level)) for level in self.track]
+
+    @property
+    def error_codes(self):
+        """The counts of the codes on ERROR lines."""
+        return self.codes.get(b"ERROR", Counter())
+
+    def add_chunk(self, data):
+        """Count the lines in ``data``, a bytes object of whole lines."""
+        self.bytes += len(data)
+        self.lines += data.count(b"\n")
+        if data and not data.endswith(b"\n"):
+            # The last line of a file without a trailing newline
+            self.lines += 1
+        rfind = data.rfind
+        is_timestamp = TIMESTAMP_RE.fullmatch
+        for level, pattern in self._patterns:
+            # A level that is not at the start of its line may only have a timestamp before it
+            records = [
+                match.groups() for match in pattern.finditer(data)
+                if (start := match.start()) == 0 or data[start - 1] == 10
+                or is_timestamp(data, rfind(b"\n", 0, start) + 1, start)
+            ]
+            self._add(level, records)
+
+    def add_line(self, line):
+        """Count one line given as bytes."""
+        self.bytes += len(line)
+        self.lines += 1
+        match = LINE_RE.match(line)
+        if match is not None and match.group(1) in self.codes:
+            self._add(match.group(1), [match.group(2, 3)])
+
+    def merge(self, other):
+        """Add the counts of another LogStats to this one.
+
+        Everything but the capped message fields comes out as if both inputs
+        had been read in one pass. Once a level has more than ``max_unique``
+        distinct messages, the other side's lines are no longer available:
+        its kept messages count as one dropped line each when they do not
+        fit, and which ones are kept depends on how the input was split.
+        """
+        self.lines += other.lines
+        self.bytes += other.bytes
+        self.dropped += other.dropped
+        for level, count in other.levels.items():
+            self.levels[level] += count
+            self.codes.setdefault(level, Counter()).update(other.codes[level])
+            self._add_messages(level, other.unique_messages[level])
+        return self
+
+    def to_dict(self, top=None):
+        """Return the counts as plain, JSON-friendly values."""
+        def text(value):
+            return value.decode("utf-8", "replace")
+        return {
+            "lines": self.lines,
+            "bytes": self.bytes,
+            "levels": {
+                text(level): {
+                    "lines": self.levels[level],
+                    "codes": {text(code): count for code, count in self.codes[level].most_common(top)},
+                    "unique_codes": sorted(text(code) for code in self.codes[level]),
+                    "unique_messages": sorted(text(message) for message in self.unique_messages[level])[:top]
+                }
+                for level in self.levels
+            },
+            "dropped_messages": self.dropped
+        }
+
+    def _add(self, level, records):
+        self.levels[level] += len(records)
+        self.codes[level].update(code for code, _ in records if code)
+        self._add_messages(level, [message for _, message in records if message])
+
+    def _add_messages(self, level, messages):
+        unique = self.unique_messages.setdefault(level, set())
+        if len(unique) + len(messages) <= self.max_unique:
+            unique.update(messages)
+            return
+        for message in messages:
+            if message in unique:
+                continue
+            if len(unique) < self.max_unique:
+                unique.add(message)
+            else:
+                self.dropped += 1
+
+
+def parse_line(line):
+    """Return ``(level, code, message)`` for a str log line, or None if it has no level.
+
+    ``code`` is None when the level is not followed by a number.
+    """
+    match = LINE_RE.match(line.encode("utf-8"))
+    if match is None:
+        return None
+    level, code, message = (None if part is None else part.decode("utf-8") for part in match.groups())
+    return level, code, message
+
+
+def iter_chunks(path, chunk_size=CHUNK_SIZE, start=0, end=None):
+    """Yield ``path`` in windows of about ``chunk_size`` bytes, each cut just after a newline.
+
+    The file is mapped rather than read, so only the current window is
+    held in memory however big the file is. With ``start`` and ``end``
+    only the lines that begin in that byte range are yielded, so ranges
+    that cover a file between them see every line exactly once.
+    """
+    with open(path, "rb") as file:
+        size = os.fstat(file.fileno()).st_size
+        end = size if end is None else min(end, size)
+        if size == 0 or start >= end:
+            # An empty file cannot be mapped
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if hasattr(mapped, "madvise"):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+            start = line_start(mapped, start, size)
+            end = line_start(mapped, end, size)
+            while start < end:
+                stop = line_start(mapped, min(start + chunk_size, end), size)
+                yield mapped[start:stop]
+                start = stop
+
+
+def line_start(data, position, size):
+    """Return the first offset at or after ``position`` where a line begins, or ``size``."""
+    if position <= 0 or position >= size or data[position - 1] == 10:
+        return min(max(position, 0), size)
+    newline = data.find(b"\n", position)
+    return size if newline < 0 else newline + 1
+
+
+def analyze_file(path, stats=None, use_mmap=True, chunk_size=CHUNK_SIZE, start=0, end=None):
+    """Count the tracked levels in a log file, or in the lines that begin between ``start`` and ``end``.
+
+    The file is mapped and matched a window at a time, or read line by line
+    when ``use_mmap`` is false (for pipes and special files). Rotated logs
+    compressed with gzip are always read line by line. Returns the LogStats.
+    """
+    stats = stats if stats is not None else LogStats()
+    if path.endswith(".gz"):
+        with gzip.open(path, "rb") as file:
+            for line in file:
+                stats.add_line(line)
+    elif use_mmap:
+        for chunk in iter_chunks(path, chunk_size, start, end):
+            stats.add_chunk(chunk)
+    else:
+        with open(path, "rb", buffering=1024 * 1024) as file:
+            for line in file:
+                stats.add_line(line)
+    return stats
+
+
+def analyze_lines(lines, stats=None):
+    """Count an iterable of str log lines, such as the lists in the notebooks."""
+    stats = stats if stats is not None else LogStats()
+    for line in lines:
+        stats.add_line(line.encode("utf-8"))
+    return stats
+
+
+def iter_errors(path, level="ERROR"):
+    """Yield the lines of ``path`` at ``level``, without their newline, one at a time."""
+    wanted = level.encode("ascii")
+    with open(path, "rb", buffering=1024 * 1024) as file:
+        for line in file:
+            match = LINE_RE.match(line)
+            if match is not None and match.group(1) == wanted:
+                yield line.rstrip(b"\r\n").decode("utf-8", "replace")
+
+
+def write_synthetic_log(path, size_mb, seed=0):
+    """Write a log of about ``size_mb`` MiB with a realistic mix of levels, codes and messages."""
+    rng = random.Random(seed)
+    messages = {
+        "INFO": ["Deployment started", "Deployment completed", "Health check passed", "Request served"],
+        "WARNING": ["Memory high", "Disk usage above 80%", "Slow response from upstream"],
+        "ERROR": ["Service not found", "Internal Server Error", "Bad Gateway", "Service Unavailable",
+                  "Connection failed", "Timeout"],
+        "DEBUG": ["Cache miss", "Retrying request"]
+    }
+    codes = ["400", "401", "403", "404", "500", "502", "503", "504"]
+    # A block of lines is repeated, so generating the log costs far less than reading it
+    block = []
+    for i in range(20000):
+        level = rng.choices(["INFO", "WARNING", "ERROR", "DEBUG"], weights=[70, 15, 10, 5])[0]
+        stamp = f"2026-01-{1 + i % 28:02d} {i % 24:02d}:{i % 60:02d}:{(i * 7) % 60:02d}"
+        message = rng.choice(messages[level])
+        if level == "ERROR" and rng.random() < 0.8:
+            message = f"{rng.choice(codes)} {message} on srv{rng.randrange(50)}"
+        block.append(f"{stamp} {level}:{message}\n")
+    block = "".join(block).encode("utf-8")
+    target = size_mb * 1024 * 1024
+    with open(path, "wb") as file:
+        written = 0
+        while written < target:
+            file.write(block)
+            written += len(block)
+
+
+def bench(args):
+    """Time both ways of reading a synthetic log and print MB/s."""
+    workdir = tempfile.mkdtemp(prefix="log-bench-")
+    try:
+        path = os.path.join(workdir, "synthetic.log")
+        write_synthetic_log(path, args.size_mb, args.seed)
+        size = os.path.getsize(path)
+        results = []
+        for name, use_mmap in (("mmap", True), ("lines", False)):
+            if name == "lines" and args.skip_lines:
+                continue
+            start = time.perf_counter()
+            stats = analyze_file(path, use_mmap=use_mmap)
+            elapsed = time.perf_counter() - start
+            results.append({
+                "mode": name,
+                "bytes": size,
+                "seconds": round(elapsed, 3),
+                "mb_per_s": round(size / elapsed / 1e6, 1),
+                "lines": stats.lines,
+                "errors": stats.levels[b"ERROR"]
+            })
+            print(f"{name:<6} {size / 1e6:>9.1f} MB  {elapsed:>8.2f} s  {size / elapsed / 1e6:>8.1f} MB/s", file=sys.stderr)
+        json.dump({"results": results}, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def analyze(args):
+    stats = LogStats(track=[level.encode("ascii") for level in args.track], max_unique=args.max_unique)
+    for path in args.paths:
+        analyze_file(path, stats, use_mmap=not args.lines)
+    json.dump(stats.to_dict(args.top), sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+def errors(args):
+    for path in args.paths:
+        for line in iter_errors(path, args.level):
+            print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Count error lines, codes and unique messages in big log files.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    analyze_parser = commands.add_parser("analyze", help="print counts for one or more logs as JSON")
+    analyze_parser.add_argument("paths", nargs="+")
+    analyze_parser.add_argument("--lines", action="store_true", help="read line by line instead of through mmap")
+    analyze_parser.add_argument("--track", nargs="+", default=["ERROR"], help="levels to count (default: ERROR)")
+    analyze_parser.add_argument("--max-unique", type=int, default=MAX_UNIQUE, help=f"unique messages kept per level (default: {MAX_UNIQUE})")
+    analyze_parser.add_argument("--top", type=int, help="only list this many codes and messages")
+    analyze_parser.set_defaults(func=analyze)
+
+    errors_parser = commands.add_parser("errors", help="print the lines at one level")
+    errors_parser.add_argument("paths", nargs="+")
+    errors_parser.add_argument("--level", default="ERROR")
+    errors_parser.set_defaults(func=errors)
+
+    bench_parser = commands.add_parser("bench", help="measure MB/s on a synthetic log")
+    bench_parser.add_argument("--size-mb", type=int, default=1024, help="size of the synthetic log (default: 1024)")
+    bench_parser.add_argument("--seed", type=int, default=0)
+    bench_parser.add_argument("--skip-lines", action="store_true", help="only time the mmap reader")
+    bench_parser.set_defaults(func=bench)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,377 @@
+import argparse
+import ctypes
+import ctypes.util
+import json
+import os
+import re
+import select
+import struct
+import sys
+import time
+
+# inotify flags from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+# struct inotify_event: int wd; uint32_t mask, cookie, len; char name[len]
+EVENT_HEADER = struct.Struct("iIII")
+
+# Seconds between checks where inotify is not available
+POLL_INTERVAL = 0.25
+
+# Even with inotify every file is checked this often, in case an event could not be
+# seen, such as a write to a file on a network mount
+IDLE_CHECK = 5.0
+
+# Most bytes read from a file per block, so a big backlog is handed out a piece at a time
+READ_SIZE = 1024 * 1024
+
+# A line longer than this without a newline is handed out as it is
+MAX_LINE = 1024 * 1024
+
+# Bytes before the offset that are read again on every check, to spot a file that was
+# truncated and written past the old offset before it was looked at
+TAIL_CHECK = 64
+
+# Seconds between saves of the offsets to the state file
+STATE_EVERY = 5.0
+
+
+class FollowedFile:
+    """One followed path: the file open under it, that file's identity and offset, and any unfinished last line."""
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+        # (st_dev, st_ino) of the open file, to tell when the path points at a new one
+        self.identity = None
+        self.offset = 0
+        # Size of the file when it was last read, so offset < size means there is more
+        self.size = 0
+        self.partial = b""
+        # The last bytes read, which must still be just before the offset
+        self.tail = b""
+
+    def open(self, offset=None):
+        """Open whatever file is at ``path`` now and read on from ``offset``, or from its end.
+
+        Returns False if there is no file there.
+        """
+        try:
+            fd = os.open(self.path, os.O_RDONLY | getattr(os, "O_CLOEXEC", 0))
+        except FileNotFoundError:
+            return False
+        stat = os.fstat(fd)
+        self.close()
+        self.fd = fd
+        self.identity = (stat.st_dev, stat.st_ino)
+        self.offset = stat.st_size if offset is None else min(offset, stat.st_size)
+        self.partial = b""
+        self.tail = self._read_at(max(0, self.offset - TAIL_CHECK), min(self.offset, TAIL_CHECK))
+        return True
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def read_block(self):
+        """Return ``(lines, truncated)``: complete lines appended since the last call, up to READ_SIZE bytes of them.
+
+        ``truncated`` is True if the file was cut back, as copytruncate
+        rotation does, even when it has since grown past the old offset;
+        reading then starts over from the top.
+        """
+        if self.fd is None:
+            return b"", False
+        size = self.size = os.fstat(self.fd).st_size
+        truncated = size < self.offset or (
+            bool(self.tail) and self._read_at(self.offset - len(self.tail), len(self.tail)) != self.tail
+        )
+        if truncated:
+            self.offset = 0
+            self.partial = b""
+            self.tail = b""
+        if size == self.offset:
+            return b"", truncated
+        data = self.partial + self._read_at(self.offset, min(size - self.offset, READ_SIZE))
+        self.offset += len(data) - len(self.partial)
+        self.tail = (self.tail + data[len(self.partial):])[-TAIL_CHECK:]
+        end = data.rfind(b"\n") + 1
+        if len(data) - end > MAX_LINE:
+            end = len(data)
+        self.partial = data[end:]
+        return data[:end], truncated
+
+    def flush(self):
+        """Return and forget the unfinished last line, once no more can be added to it."""
+        partial, self.partial = self.partial, b""
+        return partial + b"\n" if partial else b""
+
+    def _read_at(self, offset, count):
+        os.lseek(self.fd, offset, os.SEEK_SET)
+        chunks = []
+        while count > 0:
+            chunk = os.read(self.fd, count)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            count -= len(chunk)
+        return b"".join(chunks)
+
+
+class Alert:
+    """Call ``callback(path, line)`` for every followed line that ``pattern`` is found in."""
+
+    def __init__(self, pattern, callback):
+        if isinstance(pattern, str):
+            pattern = pattern.encode("utf-8")
+        self.pattern = re.compile(pattern) if isinstance(pattern, bytes) else pattern
+        self.callback = callback
+
+    def matching_lines(self, block):
+        """Yield each line of ``block`` that matches once, decoded and without its newline."""
+        # One search over the whole block, so a block without a match costs one regex call
+        line_end = 0
+        for match in self.pattern.finditer(block):
+            if match.start() < line_end:
+                continue
+            line_start = block.rfind(b"\n", 0, match.start()) + 1
+            line_end = block.find(b"\n", match.start())
+            line_end = len(block) if line_end < 0 else line_end + 1
+            yield block[line_start:line_end].rstrip(b"\r\n").decode("utf-8", "replace")
+
+
+class InotifyWatch:
+    """The directories of the followed files under one inotify descriptor."""
+
+    def __init__(self, directories):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.directories = {}
+        for directory in directories:
+            wd = libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+            if wd < 0:
+                error = ctypes.get_errno()
+                os.close(self.fd)
+                raise OSError(error, f"Cannot watch {directory}")
+            self.directories[wd] = directory
+
+    def read(self):
+        """Return the paths that have had events since the last call."""
+        paths = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return paths
+            offset = 0
+            while offset < len(data):
+                wd, _, _, length = EVENT_HEADER.unpack_from(data, offset)
+                name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b"\0")
+                offset += EVENT_HEADER.size + length
+                if wd in self.directories and name:
+                    paths.add(os.path.join(self.directories[wd], os.fsdecode(name)))
+
+    def close(self):
+        os.close(self.fd)
+
+
+class LogFollower:
+    """Follow log files like ``tail -F`` and fire alerts on the lines appended to them.
+
+    Only bytes written after the last read are read, from an offset kept
+    per file. A file renamed away by rotation is read to its end before
+    the new file at the same path is followed from its start. A file
+    truncated in place is read again from the top. A file that does not
+    exist yet is picked up when it appears.
+
+    On Linux the loop sleeps in inotify until one of the files' directories
+    changes, so alerts fire within milliseconds of a write and an idle
+    follower uses no CPU; elsewhere the files are checked every
+    ``POLL_INTERVAL`` seconds. With ``state_path`` the offsets are saved
+    every few seconds and on stop, and a restarted follower carries on
+    where the last one stopped, provided the files were not replaced.
+    """
+
+    def __init__(self, paths, from_start=False, state_path=None, on_notice=None):
+        self.files = {os.path.abspath(path): FollowedFile(os.path.abspath(path)) for path in paths}
+        self.from_start = from_start
+        self.state_path = state_path
+        self.on_notice = on_notice
+        self.alerts = []
+        self.lines = 0
+        self._stopping = False
+        self._wake_read, self._wake_write = os.pipe()
+        self._saved_at = 0.0
+        self._open_all()
+
+    def add_alert(self, pattern, callback):
+        """Call ``callback(path, line)`` for each new line that ``pattern`` (a regex, str or bytes) is found in."""
+        alert = Alert(pattern, callback)
+        self.alerts.append(alert)
+        return alert
+
+    def stop(self):
+        """Make run return, from an alert callback or another thread."""
+        self._stopping = True
+        os.write(self._wake_write, b"x")
+
+    def close(self):
+        """Save the offsets and close every file."""
+        self.save_state()
+        for followed in self.files.values():
+            followed.close()
+        for fd in (self._wake_read, self._wake_write):
+            os.close(fd)
+
+    def check(self, paths=None):
+        """Read what was appended to ``paths`` (all files by default) and fire the alerts."""
+        for path in paths if paths is not None else list(self.files):
+            followed = self.files.get(path)
+            if followed is not None and not self._stopping:
+                self._check(followed)
+        if self.state_path and time.monotonic() - self._saved_at >= STATE_EVERY:
+            self.save_state()
+
+    def run(self, timeout=None):
+        """Follow the files until stop is called or ``timeout`` seconds have passed."""
+        self._stopping = False
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            watch = InotifyWatch({os.path.dirname(path) for path in self.files})
+        except (OSError, AttributeError):
+            watch = None
+        try:
+            self.check()
+            while not self._stopping:
+                wait = IDLE_CHECK if watch is not None else POLL_INTERVAL
+                if deadline is not None:
+                    wait = min(wait, deadline - time.monotonic())
+                    if wait <= 0:
+                        break
+                readable, _, _ = select.select([self._wake_read] + ([watch.fd] if watch else []), [], [], wait)
+                if self._wake_read in readable:
+                    os.read(self._wake_read, 1024)
+                if watch is not None and watch.fd in readable:
+                    self.check(watch.read())
+                elif not readable:
+                    self.check()
+        finally:
+            if watch is not None:
+                watch.close()
+            self.save_state()
+
+    def save_state(self):
+        """Write every file's identity and offset to the state file, if there is one."""
+        if not self.state_path:
+            return
+        state = {}
+        for path, followed in self.files.items():
+            if followed.identity is not None:
+                # The unfinished line has not been handed out, so it is read again next time
+                state[path] = {"dev": followed.identity[0], "inode": followed.identity[1],
+                               "offset": followed.offset - len(followed.partial)}
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(state, file)
+        os.replace(tmp_path, self.state_path)
+        self._saved_at = time.monotonic()
+
+    def _open_all(self):
+        state = {}
+        if self.state_path and os.path.exists(self.state_path):
+            with open(self.state_path) as file:
+                state = json.load(file)
+        for path, followed in self.files.items():
+            saved = state.get(path)
+            if not followed.open(0 if self.from_start else None):
+                continue
+            if saved and followed.identity == (saved["dev"], saved["inode"]):
+                followed.open(saved["offset"])
+            elif saved:
+                # Rotated while nobody was following, so all of the new file is new
+                followed.open(0)
+
+    def _check(self, followed):
+        self._emit(followed)
+        try:
+            stat = os.stat(followed.path)
+        except FileNotFoundError:
+            # Renamed away or deleted; keep the old file in case it is still written to
+            return
+        if (stat.st_dev, stat.st_ino) != followed.identity:
+            # The old file was read to its end above, so its last line cannot grow any more
+            self._fire(followed.path, followed.flush())
+            reopened = followed.identity is not None
+            if followed.open(0):
+                self._notice(followed.path, "rotated" if reopened else "appeared")
+                self._emit(followed)
+
+    def _emit(self, followed):
+        while True:
+            block, truncated = followed.read_block()
+            if truncated:
+                self._notice(followed.path, "truncated")
+            self._fire(followed.path, block)
+            if followed.offset >= followed.size or self._stopping:
+                return
+
+    def _fire(self, path, block):
+        if not block:
+            return
+        self.lines += block.count(b"\n")
+        for alert in self.alerts:
+            for line in alert.matching_lines(block):
+                alert.callback(path, line)
+                if self._stopping:
+                    return
+
+    def _notice(self, path, what):
+        if self.on_notice is not None:
+            self.on_notice(path, what)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Follow log files like tail -F and report the lines that match.")
+    parser.add_argument("paths", nargs="+", help="log files to follow; they do not have to exist yet")
+    parser.add_argument("--pattern", default=r"\bERROR\b", help=r"regular expression to alert on (default: \bERROR\b)")
+    parser.add_argument("--from-start", action="store_true", help="read files that are already there from the top")
+    parser.add_argument("--state", help="keep offsets in this file, so a restart carries on where it stopped")
+    parser.add_argument("--exit-on-match", action="store_true", help="stop at the first matching line, with exit status 1")
+    args = parser.parse_args(argv)
+
+    follower = LogFollower(args.paths, args.from_start, args.state,
+                           on_notice=lambda path, what: print(f"{path}: {what}", file=sys.stderr))
+    matched = False
+
+    def report(path, line):
+        nonlocal matched
+        print(f"{path}: {line}", flush=True)
+        matched = True
+        if args.exit_on_match:
+            follower.stop()
+
+    follower.add_alert(args.pattern, report)
+    try:
+        follower.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        follower.close()
+    if args.exit_on_match and matched:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
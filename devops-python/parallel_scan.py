@@ -0,0 +1,192 @@
+import argparse
+import fnmatch
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from log_analyzer import MAX_UNIQUE, LogStats, analyze_file, write_synthetic_log
+
+# Files bigger than a shard are split into byte ranges of at least this size,
+# so starting a range costs little next to scanning it
+MIN_RANGE = 32 * 1024 * 1024
+
+# Shards per worker, so the last few do not leave most cores idle
+SHARDS_PER_WORKER = 4
+
+# Matches cpu.log as well as its rotations cpu.log1, cpu.log.2 and cpu.log.3.gz
+LOG_PATTERN = "*.log*"
+
+
+def default_workers():
+    """Return how many CPUs this process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def find_logs(directory, pattern=LOG_PATTERN):
+    """Return the sorted paths of the files in ``directory`` whose names match ``pattern``."""
+    with os.scandir(directory) as entries:
+        return sorted(entry.path for entry in entries if entry.is_file() and fnmatch.fnmatch(entry.name, pattern))
+
+
+def plan_shards(paths, workers, min_range=MIN_RANGE):
+    """Split ``paths`` into ``(path, start, end)`` shards of roughly equal size, biggest first.
+
+    Small files are one shard each. Big ones are cut into byte ranges, and
+    analyze_file moves every cut to the next line boundary, so no line is
+    split or counted twice. Compressed files cannot be entered in the
+    middle and are always one shard.
+    """
+    sizes = [(path, os.path.getsize(path)) for path in paths]
+    total = sum(size for _, size in sizes)
+    target = max(min_range, total // (workers * SHARDS_PER_WORKER), 1)
+    shards = []
+    for path, size in sizes:
+        if path.endswith(".gz") or size <= target:
+            shards.append((path, 0, size))
+        else:
+            # Equal ranges, rather than target-sized ones and a small leftover
+            count = -(-size // target)
+            bounds = [size * i // count for i in range(count + 1)]
+            shards.extend((path, start, end) for start, end in zip(bounds, bounds[1:]))
+    # Longest first, so the short ones fill in around them at the end
+    shards.sort(key=lambda shard: shard[2] - shard[1], reverse=True)
+    return shards
+
+
+def scan_shard(shard, track, max_unique):
+    """Count one shard in a worker process and return its LogStats."""
+    path, start, end = shard
+    return analyze_file(path, LogStats(track, max_unique), start=start, end=end)
+
+
+def scan(paths, workers=None, track=(b"ERROR",), max_unique=MAX_UNIQUE, min_range=MIN_RANGE):
+    """Count the tracked levels of all ``paths`` on ``workers`` processes and return one LogStats.
+
+    Each worker returns the counters for its shard, which are small
+    whatever the size of the logs, and they are merged here in shard
+    order. With one worker everything runs in this process. Past
+    ``max_unique`` the kept messages and the dropped count depend on the
+    number of workers, as described in LogStats.merge.
+    """
+    workers = workers or default_workers()
+    shards = plan_shards(paths, workers, min_range)
+    stats = LogStats(track, max_unique)
+    if workers == 1:
+        for shard in shards:
+            stats.merge(scan_shard(shard, track, max_unique))
+        return stats
+    with ProcessPoolExecutor(workers) as pool:
+        for result in pool.map(scan_shard, shards, repeat(track), repeat(max_unique)):
+            stats.merge(result)
+    return stats
+
+
+def exact_counts(stats):
+    """Return ``stats.to_dict()`` without the fields that depend on how the logs were sharded.
+
+    Past ``max_unique`` the kept messages and the dropped count depend on
+    the shards, see LogStats.merge, so they are left out once any message
+    was dropped.
+    """
+    summary = stats.to_dict()
+    if stats.dropped:
+        del summary["dropped_messages"]
+        for level in summary["levels"].values():
+            del level["unique_messages"]
+    return summary
+
+
+def warm_cache(paths):
+    """Read the files once so every timed run finds them in the page cache."""
+    for path in paths:
+        with open(path, "rb", buffering=0) as file:
+            while file.read(16 * 1024 * 1024):
+                pass
+
+
+def bench(args):
+    """Scan synthetic logs with 1 up to N workers and print MB/s and the speedup over one worker."""
+    counts = [int(count) for count in args.workers.split(",")] if args.workers else list(range(1, default_workers() + 1))
+    workdir = tempfile.mkdtemp(prefix="scan-bench-")
+    try:
+        paths = []
+        for index in range(args.files):
+            path = os.path.join(workdir, f"app.log{index or ''}")
+            write_synthetic_log(path, args.size_mb // args.files, args.seed + index)
+            paths.append(path)
+        size = sum(os.path.getsize(path) for path in paths)
+        warm_cache(paths)
+
+        results = []
+        baseline = None
+        expected = None
+        for workers in counts:
+            start = time.perf_counter()
+            stats = scan(paths, workers)
+            elapsed = time.perf_counter() - start
+            summary = exact_counts(stats)
+            if expected is None:
+                expected = summary
+            elif summary != expected:
+                sys.exit(f"{workers} workers counted differently from {counts[0]}")
+            baseline = baseline or elapsed
+            results.append({
+                "workers": workers,
+                "bytes": size,
+                "seconds": round(elapsed, 3),
+                "mb_per_s": round(size / elapsed / 1e6, 1),
+                "speedup": round(baseline / elapsed, 2)
+            })
+            print(f"{workers:>3} workers  {elapsed:>8.2f} s  {size / elapsed / 1e6:>8.1f} MB/s  x{baseline / elapsed:.2f}", file=sys.stderr)
+        report = {
+            "meta": {"cpus": default_workers(), "files": args.files, "bytes": size, "seed": args.seed},
+            "results": results
+        }
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run(args):
+    paths = []
+    for target in args.paths:
+        paths.extend(find_logs(target, args.pattern) if os.path.isdir(target) else [target])
+    stats = scan(paths, args.workers, [level.encode("ascii") for level in args.track], args.max_unique)
+    json.dump(stats.to_dict(args.top), sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Count error lines, codes and unique messages across many logs on all cores.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    scan_parser = commands.add_parser("scan", help="scan files and directories of rotated logs and print JSON counts")
+    scan_parser.add_argument("paths", nargs="+", help="log files, or directories to take every file matching --pattern from")
+    scan_parser.add_argument("--pattern", default=LOG_PATTERN, help=f"file names to scan in directories (default: {LOG_PATTERN})")
+    scan_parser.add_argument("--workers", type=int, help="worker processes (default: one per CPU)")
+    scan_parser.add_argument("--track", nargs="+", default=["ERROR"], help="levels to count (default: ERROR)")
+    scan_parser.add_argument("--max-unique", type=int, default=MAX_UNIQUE, help=f"unique messages kept per level (default: {MAX_UNIQUE})")
+    scan_parser.add_argument("--top", type=int, help="only list this many codes and messages")
+    scan_parser.set_defaults(func=run)
+
+    bench_parser = commands.add_parser("bench", help="compare 1 to N workers on synthetic logs")
+    bench_parser.add_argument("--size-mb", type=int, default=1024, help="total size of the synthetic logs (default: 1024)")
+    bench_parser.add_argument("--files", type=int, default=1, help="split the logs over this many files (default: 1)")
+    bench_parser.add_argument("--workers", help="comma-separated worker counts (default: 1 up to the CPU count)")
+    bench_parser.add_argument("--seed", type=int, default=0)
+    bench_parser.set_defaults(func=bench)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
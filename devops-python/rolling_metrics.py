@@ -0,0 +1,327 @@
+import argparse
+import heapq
+import itertools
+import json
+import math
+import random
+import sys
+import time
+from collections import deque
+
+# Seconds of history each series keeps
+DEFAULT_WINDOW = 300.0
+
+# Most samples a series keeps, whatever their age, so a chatty host cannot exhaust memory
+DEFAULT_MAX_SAMPLES = 10000
+
+# Quantiles are within this fraction of the true value
+DEFAULT_ACCURACY = 0.01
+
+# Values at or below this count as zero in the quantile sketch
+MIN_VALUE = 1e-9
+
+
+class QuantileSketch:
+    """Approximate quantiles of a multiset of non-negative numbers that values can be added to and removed from.
+
+    Each value goes into the bin ``ceil(log(value, gamma))``, so every bin
+    spans values within ``accuracy`` of each other and any quantile is off
+    by at most that fraction. Only bins in use are stored, which for
+    percentages and latencies is a few hundred at most, and adding or
+    removing a value is one dict update.
+    """
+
+    def __init__(self, accuracy=DEFAULT_ACCURACY):
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins = {}
+        self.zeros = 0
+        self.count = 0
+
+    def add(self, value):
+        """Count one more ``value``; NaN and infinities have no bin and raise ValueError."""
+        if not math.isfinite(value):
+            raise ValueError(f"Cannot add {value} to a quantile sketch")
+        self.count += 1
+        if value <= MIN_VALUE:
+            self.zeros += 1
+        else:
+            key = math.ceil(math.log(value) / self._log_gamma)
+            self.bins[key] = self.bins.get(key, 0) + 1
+
+    def remove(self, value):
+        """Forget one ``value`` that was added before."""
+        self.count -= 1
+        if value <= MIN_VALUE:
+            self.zeros -= 1
+            return
+        key = math.ceil(math.log(value) / self._log_gamma)
+        left = self.bins[key] - 1
+        if left:
+            self.bins[key] = left
+        else:
+            del self.bins[key]
+
+    def quantile(self, q):
+        """Return the value with a fraction ``q`` of the values below it, or None if there are none."""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if rank < seen:
+                # The middle of the bin, in relative terms
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
+
+
+class RollingSeries:
+    """The samples of one host's metric over the last ``window`` seconds.
+
+    Samples sit in a ring buffer in arrival order, so expiring the old ones
+    pops from its head. The count, sum, quantile sketch and a monotonic
+    queue of candidate maxima are updated on every append and expiry, so
+    each sample costs O(1) amortized however long the window is, and mean
+    and max are O(1) to read.
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW, max_samples=DEFAULT_MAX_SAMPLES, accuracy=DEFAULT_ACCURACY):
+        self.window = window
+        self.max_samples = max_samples
+        # (sequence number, time, value), oldest first
+        self.samples = deque()
+        # (sequence number, value) of the samples that are bigger than every later one
+        self._maxima = deque()
+        self.sketch = QuantileSketch(accuracy)
+        self.total = 0.0
+        self.latest = None
+        self._seq = 0
+
+    def add(self, value, now):
+        """Append a sample taken at ``now`` seconds, dropping what has fallen out of the window.
+
+        Raises ValueError for NaN or an infinity, which no statistic could use.
+        """
+        if not math.isfinite(value):
+            raise ValueError(f"Not a finite sample: {value}")
+        self.expire(now)
+        if len(self.samples) >= self.max_samples:
+            self._drop_oldest()
+        self._seq += 1
+        self.samples.append((self._seq, now, value))
+        self.total += value
+        self.sketch.add(value)
+        while self._maxima and self._maxima[-1][1] <= value:
+            self._maxima.pop()
+        self._maxima.append((self._seq, value))
+        self.latest = value
+
+    def expire(self, now):
+        """Drop the samples older than the window."""
+        cutoff = now - self.window
+        while self.samples and self.samples[0][1] <= cutoff:
+            self._drop_oldest()
+
+    def count(self):
+        return len(self.samples)
+
+    def mean(self):
+        return self.total / len(self.samples) if self.samples else None
+
+    def max(self):
+        return self._maxima[0][1] if self._maxima else None
+
+    def quantile(self, q):
+        return self.sketch.quantile(q)
+
+    def _drop_oldest(self):
+        seq, _, value = self.samples.popleft()
+        self.sketch.remove(value)
+        if self.samples:
+            self.total -= value
+        else:
+            # Start again from an exact zero rather than carry rounding errors
+            self.total = 0.0
+        if self._maxima and self._maxima[0][0] == seq:
+            self._maxima.popleft()
+
+
+class MetricsAggregator:
+    """Rolling statistics for every host and metric, and the most or least loaded hosts per metric.
+
+    ``record`` feeds a sample into the host's RollingSeries for the metric.
+    ``top`` ranks hosts by their latest value from two heaps per metric
+    that are pushed to on every sample, so it costs O(k log n) instead of
+    sorting the fleet. Entries made stale by newer samples, or older than
+    the window because the host stopped reporting, are skipped when they
+    surface, and the heaps are rebuilt once stale entries outnumber live
+    ones.
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW, max_samples=DEFAULT_MAX_SAMPLES, accuracy=DEFAULT_ACCURACY, clock=time.monotonic):
+        self.window = window
+        self.max_samples = max_samples
+        self.accuracy = accuracy
+        self.clock = clock
+        # (host, metric) -> RollingSeries
+        self.series = {}
+        # Metric -> host -> (sequence number, time) of its latest sample
+        self._latest = {}
+        # Metric -> heap of (-value, seq, host) and heap of (value, seq, host)
+        self._highest = {}
+        self._lowest = {}
+        self._order = itertools.count()
+
+    def record(self, host, metric, value, now=None):
+        """Add a sample of ``metric`` for ``host``, taken ``now`` (default: the clock).
+
+        Raises ValueError for NaN or an infinity.
+        """
+        now = self.clock() if now is None else now
+        if not math.isfinite(value):
+            raise ValueError(f"Not a finite sample: {value}")
+        series = self.series.get((host, metric))
+        if series is None:
+            series = self.series[(host, metric)] = RollingSeries(self.window, self.max_samples, self.accuracy)
+        series.add(value, now)
+
+        seq = next(self._order)
+        latest = self._latest.setdefault(metric, {})
+        latest[host] = (seq, now)
+        highest = self._highest.setdefault(metric, [])
+        lowest = self._lowest.setdefault(metric, [])
+        heapq.heappush(highest, (-value, seq, host))
+        heapq.heappush(lowest, (value, seq, host))
+        if len(highest) > 2 * len(latest) + 64:
+            self._compact(metric)
+
+    def stats(self, host, metric, now=None):
+        """Return count, mean, max, p50, p95, p99 and latest for a host's metric over the window, or None."""
+        series = self.series.get((host, metric))
+        if series is None:
+            return None
+        series.expire(self.clock() if now is None else now)
+        return {
+            "count": series.count(),
+            "mean": series.mean(),
+            "max": series.max(),
+            "p50": series.quantile(0.50),
+            "p95": series.quantile(0.95),
+            "p99": series.quantile(0.99),
+            "latest": series.latest
+        }
+
+    def top(self, metric, k=5, least=False, now=None):
+        """Return up to ``k`` ``(host, latest value)`` pairs with the highest values, or the lowest with ``least``.
+
+        Hosts whose latest sample is older than the window, taken back from
+        ``now`` (default: the clock), are left out until they report again.
+        """
+        cutoff = (self.clock() if now is None else now) - self.window
+        heap = (self._lowest if least else self._highest).get(metric, [])
+        latest = self._latest.get(metric, {})
+        found = []
+        popped = []
+        while heap and len(found) < k:
+            entry = heapq.heappop(heap)
+            popped.append(entry)
+            key, seq, host = entry
+            current = latest.get(host)
+            if current is not None and current[0] == seq:
+                if current[1] <= cutoff:
+                    # The host went quiet, so its last value is no longer news
+                    del latest[host]
+                    continue
+                found.append((host, key if least else -key))
+        # Stale entries go too; the live ones are still wanted
+        for entry in popped:
+            current = latest.get(entry[2])
+            if current is not None and current[0] == entry[1]:
+                heapq.heappush(heap, entry)
+        return found
+
+    def forget(self, host):
+        """Drop every series of a host that was taken out of the fleet."""
+        for key in [key for key in self.series if key[0] == host]:
+            del self.series[key]
+        for latest in self._latest.values():
+            latest.pop(host, None)
+
+    def _compact(self, metric):
+        """Rebuild a metric's heaps from the latest sample of every host."""
+        latest = self._latest[metric]
+        live = {(seq, host) for host, (seq, _) in latest.items()}
+        self._highest[metric] = [entry for entry in self._highest[metric] if entry[1:] in live]
+        self._lowest[metric] = [entry for entry in self._lowest[metric] if entry[1:] in live]
+        heapq.heapify(self._highest[metric])
+        heapq.heapify(self._lowest[metric])
+
+
+def bench(args):
+    """Feed random CPU samples for a fleet and time record, stats and top against sorting."""
+    rng = random.Random(args.seed)
+    hosts = [f"srv{i}" for i in range(args.hosts)]
+    aggregator = MetricsAggregator(window=args.window)
+    samples = [(rng.choice(hosts), rng.betavariate(2, 5) * 100) for _ in range(args.samples)]
+
+    # Simulated time in which every host reports about every 10 seconds
+    step = 10.0 / args.hosts
+    start = time.perf_counter()
+    for i, (host, value) in enumerate(samples):
+        aggregator.record(host, "cpu", value, now=i * step)
+    record_s = time.perf_counter() - start
+    now = len(samples) * step
+
+    start = time.perf_counter()
+    for host in hosts[:1000]:
+        aggregator.stats(host, "cpu", now)
+    stats_us = (time.perf_counter() - start) / min(1000, len(hosts)) * 1e6
+
+    start = time.perf_counter()
+    for _ in range(100):
+        top = aggregator.top("cpu", args.k, now=now)
+    top_us = (time.perf_counter() - start) / 100 * 1e6
+
+    latest = {host: aggregator.series[(host, "cpu")].latest for host in hosts if (host, "cpu") in aggregator.series}
+    start = time.perf_counter()
+    for _ in range(10):
+        ranked = sorted(latest.items(), key=lambda item: item[1], reverse=True)[:args.k]
+    sort_us = (time.perf_counter() - start) / 10 * 1e6
+    if [value for _, value in ranked] != [value for _, value in top]:
+        sys.exit("top disagrees with sorting")
+
+    report = {
+        "hosts": args.hosts,
+        "samples": args.samples,
+        "record_us": round(record_s / len(samples) * 1e6, 3),
+        "stats_us": round(stats_us, 3),
+        "top_us": round(top_us, 3),
+        "sorted_us": round(sort_us, 3)
+    }
+    print(f"record {report['record_us']:.2f} us/sample  stats {report['stats_us']:.2f} us  "
+          f"top-{args.k} {report['top_us']:.2f} us  sorted() {report['sorted_us']:.2f} us", file=sys.stderr)
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the rolling metrics aggregator.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    bench_parser = commands.add_parser("bench", help="time record, stats and top-k on random samples")
+    bench_parser.add_argument("--hosts", type=int, default=10000)
+    bench_parser.add_argument("--samples", type=int, default=1000000)
+    bench_parser.add_argument("--window", type=float, default=DEFAULT_WINDOW)
+    bench_parser.add_argument("--k", type=int, default=10)
+    bench_parser.add_argument("--seed", type=int, default=0)
+    bench_parser.set_defaults(func=bench)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
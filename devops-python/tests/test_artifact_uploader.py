@@ -0,0 +1,112 @@
+import hashlib
+import os
+import random
+
+from artifact_uploader import FileStore, UploadState, Uploader, collect_files
+
+PART_SIZE = 1024
+BUCKET = "artifacts"
+
+
+def make_files(directory, sizes, seed=0):
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    for name, size in sizes.items():
+        with open(os.path.join(directory, name), "wb") as file:
+            file.write(rng.randbytes(size))
+    return collect_files([str(directory)])
+
+
+def uploader(store, state=None, workers=4):
+    return Uploader(store, BUCKET, workers, PART_SIZE, PART_SIZE, state)
+
+
+def stored(store, key):
+    return store.get_object(Bucket=BUCKET, Key=key)["Body"]
+
+
+def read(path):
+    with open(path, "rb") as file:
+        return file.read()
+
+
+def test_multipart_upload_reassembles_parts_in_order(tmp_path):
+    files = make_files(tmp_path / "src", {"big.bin": 10 * PART_SIZE + 123, "small.bin": 100})
+    store = FileStore(str(tmp_path / "store"))
+
+    report = uploader(store).upload(files)
+
+    assert report.failed == {}
+    assert report.uploaded == 2
+    assert report.parts == 11
+    for path, key in files:
+        assert stored(store, key) == read(path)
+    head = store.head_object(Bucket=BUCKET, Key="big.bin")
+    assert head["ETag"].endswith('-11"')
+    assert head["Metadata"]["sha256"] == hashlib.sha256(read(str(tmp_path / "src" / "big.bin"))).hexdigest()
+    assert not os.listdir(tmp_path / "store" / BUCKET / "uploads")
+
+
+def test_unchanged_files_are_skipped_by_hash(tmp_path):
+    files = make_files(tmp_path / "src", {"a.bin": 500, "b.bin": 3 * PART_SIZE, "c.bin": 10})
+    store = FileStore(str(tmp_path / "store"))
+    state = UploadState(str(tmp_path / "state.json"))
+    uploader(store, state).upload(files)
+
+    requests = store.requests
+    report = uploader(store, UploadState(str(tmp_path / "state.json"))).upload(files)
+    assert report.skipped == 3
+    assert report.uploaded == 0
+    assert report.bytes_sent == 0
+    # Only one head_object per file
+    assert store.requests - requests == 3
+
+    # Same size, different content
+    with open(tmp_path / "src" / "a.bin", "r+b") as file:
+        file.write(b"changed")
+    # Filesystems with coarse timestamps could leave the mtime as it was
+    st = os.stat(tmp_path / "src" / "a.bin")
+    os.utime(tmp_path / "src" / "a.bin", ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    report = uploader(store, UploadState(str(tmp_path / "state.json"))).upload(files)
+    assert report.skipped == 2
+    assert report.uploaded == 1
+    assert stored(store, "a.bin") == read(str(tmp_path / "src" / "a.bin"))
+
+
+def test_interrupted_upload_resumes_with_the_missing_parts(tmp_path):
+    files = make_files(tmp_path / "src", {"big.bin": 8 * PART_SIZE})
+    state_path = str(tmp_path / "state.json")
+    store = FileStore(str(tmp_path / "store"), fail_after=3)
+
+    report = uploader(store, UploadState(state_path), workers=1).upload(files)
+    assert "big.bin" in report.failed
+    assert report.parts == 3
+    assert "big.bin" in UploadState(state_path).uploads
+
+    store.fail_after = None
+    report = uploader(store, UploadState(state_path)).upload(files)
+    assert report.failed == {}
+    assert report.uploaded == 1
+    assert report.resumed_parts == 3
+    assert report.parts == 5
+    assert stored(store, "big.bin") == read(files[0][0])
+    assert UploadState(state_path).uploads == {}
+
+
+def test_resume_sends_again_a_part_that_was_cut_off(tmp_path):
+    files = make_files(tmp_path / "src", {"big.bin": 4 * PART_SIZE})
+    state_path = str(tmp_path / "state.json")
+    store = FileStore(str(tmp_path / "store"), fail_after=2)
+    uploader(store, UploadState(state_path), workers=1).upload(files)
+
+    # Leave the second part half written, as a dropped connection might
+    upload_id = UploadState(state_path).uploads["big.bin"]["upload_id"]
+    part_path = tmp_path / "store" / BUCKET / "uploads" / upload_id / "00002.part"
+    part_path.write_bytes(part_path.read_bytes()[:PART_SIZE // 2])
+
+    store.fail_after = None
+    report = uploader(store, UploadState(state_path)).upload(files)
+    assert report.failed == {}
+    assert report.resumed_parts == 1
+    assert report.parts == 3
+    assert stored(store, "big.bin") == read(files[0][0])
@@ -0,0 +1,400 @@
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import sys
+import time
+from urllib.parse import urlsplit
+
+# Payloads accepted but not yet processed; when it is full new ones wait, then get a 503
+DEFAULT_QUEUE_SIZE = 10000
+
+# Worker tasks taking payloads off the queue
+DEFAULT_WORKERS = 4
+
+# Most payloads a worker takes off the queue and processes at once
+DEFAULT_BATCH = 256
+
+# Seconds a request may wait for room in a full queue before it is turned away with 503
+DEFAULT_ENQUEUE_WAIT = 0.5
+
+# Requests with a bigger body are refused with 413
+MAX_BODY = 1024 * 1024
+
+# Statuses of a build or job that count as failed, as Jenkins and GitLab spell them
+FAILED_STATUSES = {"failed", "failure", "FAILURE", "FAILED", "UNSTABLE", "ABORTED"}
+
+OK = b"HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n"
+BUSY = b"HTTP/1.1 503 Service Unavailable\r\nRetry-After: 1\r\nContent-Length: 0\r\n\r\n"
+TOO_BIG = b"HTTP/1.1 413 Payload Too Large\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+BAD = b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+UNSUPPORTED = b"HTTP/1.1 501 Not Implemented\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+
+
+def failed_jobs(payload):
+    """Return the names of the failed jobs in a webhook payload from Jenkins, GitLab or the notebooks.
+
+    Understands GitLab job and pipeline events, the Jenkins notification
+    plugin's ``{"name": ..., "build": {"status": ...}}``, and lists of
+    ``{"job": ..., "status": ...}`` like ``build_jobs`` in python-5, alone
+    or under a ``build_jobs`` key.
+    """
+    if isinstance(payload, list):
+        return [job["job"] for job in payload if isinstance(job, dict) and job.get("status") in FAILED_STATUSES]
+    if not isinstance(payload, dict):
+        return []
+    if "build_jobs" in payload:
+        return failed_jobs(payload["build_jobs"])
+    kind = payload.get("object_kind")
+    if kind == "build":
+        return [payload.get("build_name")] if payload.get("build_status") in FAILED_STATUSES else []
+    if kind == "pipeline":
+        return [build.get("name") for build in payload.get("builds", []) if build.get("status") in FAILED_STATUSES]
+    build = payload.get("build")
+    if isinstance(build, dict):
+        return [payload.get("name")] if build.get("status") in FAILED_STATUSES else []
+    if "job" in payload:
+        return [payload["job"]] if payload.get("status") in FAILED_STATUSES else []
+    return []
+
+
+def extract_failures(batch):
+    """Parse a batch of ``(path, body)`` payloads and return the failed jobs and how many bodies were not JSON."""
+    failures = []
+    invalid = 0
+    for path, body in batch:
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            invalid += 1
+            continue
+        for job in failed_jobs(payload):
+            failures.append({"source": path, "job": job})
+    return failures, invalid
+
+
+def print_failures(failures):
+    """Write failed jobs as JSON lines, a whole batch per write."""
+    if failures:
+        sys.stdout.write("".join(json.dumps(failure) + "\n" for failure in failures))
+        sys.stdout.flush()
+
+
+class WebhookReceiver:
+    """An HTTP server that acknowledges webhook POSTs at once and processes them on worker tasks.
+
+    A request is answered 200 as soon as its body is on the queue, so CI
+    servers are not held up by processing. When bursts fill the queue,
+    requests wait up to ``enqueue_wait`` for room and are then answered
+    503 with Retry-After, which Jenkins and GitLab retry, so an event is
+    never accepted and then lost. Workers take up to ``batch`` payloads
+    at once and run ``process`` on them in a thread, so slow processing
+    does not delay acknowledgements; ``process`` returns the failed jobs
+    and the count of bodies that were not JSON, and ``on_failures`` gets
+    the failed jobs of every batch. ``GET /stats`` answers the counters.
+    """
+
+    def __init__(self, queue_size=DEFAULT_QUEUE_SIZE, workers=DEFAULT_WORKERS, batch=DEFAULT_BATCH,
+                 enqueue_wait=DEFAULT_ENQUEUE_WAIT, process=extract_failures, on_failures=print_failures):
+        self.queue = asyncio.Queue(queue_size)
+        self.workers = workers
+        self.batch = batch
+        self.enqueue_wait = enqueue_wait
+        self.process = process
+        self.on_failures = on_failures
+        self.counts = {"accepted": 0, "rejected": 0, "processed": 0, "invalid": 0, "failed_jobs": 0, "batches": 0}
+        self._tasks = []
+        self._server = None
+
+    async def start(self, host="127.0.0.1", port=0):
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._server = await asyncio.start_server(self._handle, host, port, backlog=1024)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        """Stop taking requests, process what is queued, then stop the workers."""
+        self._server.close()
+        await self._server.wait_closed()
+        await self.queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self):
+        return {**self.counts, "queued": self.queue.qsize()}
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except asyncio.IncompleteReadError:
+                    return
+                lines = head.split(b"\r\n")
+                parts = lines[0].split()
+                if len(parts) < 3:
+                    writer.write(BAD)
+                    return
+                method, path = parts[0], parts[1].decode("ascii", "replace")
+                length = b"0"
+                encoding = None
+                close = parts[2] == b"HTTP/1.0"
+                for line in lines[1:]:
+                    name, _, value = line.partition(b":")
+                    name = name.strip().lower()
+                    if name == b"content-length":
+                        length = value.strip()
+                    elif name == b"transfer-encoding":
+                        encoding = value.strip().lower()
+                    elif name == b"connection":
+                        close = value.strip().lower() == b"close"
+                if not length.isdigit():
+                    writer.write(BAD)
+                    return
+                length = int(length)
+                if encoding is not None:
+                    # Transfer-Encoding overrides Content-Length; only plain chunked bodies are understood
+                    if encoding != b"chunked":
+                        writer.write(UNSUPPORTED)
+                        return
+                    try:
+                        body = await read_chunked(reader)
+                    except ValueError:
+                        writer.write(BAD)
+                        return
+                    if body is None:
+                        writer.write(TOO_BIG)
+                        return
+                elif length > MAX_BODY:
+                    writer.write(TOO_BIG)
+                    return
+                else:
+                    body = await reader.readexactly(length) if length else b""
+
+                if method == b"GET":
+                    stats = json.dumps(self.stats()).encode()
+                    writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n%s" % (len(stats), stats))
+                elif await self._enqueue((path, body)):
+                    writer.write(OK)
+                else:
+                    writer.write(BUSY)
+                await writer.drain()
+                if close:
+                    return
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
+
+    async def _enqueue(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            try:
+                await asyncio.wait_for(self.queue.put(item), self.enqueue_wait)
+            except asyncio.TimeoutError:
+                self.counts["rejected"] += 1
+                return False
+        self.counts["accepted"] += 1
+        return True
+
+    async def _worker(self):
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.batch and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                failures, invalid = await asyncio.to_thread(self.process, batch)
+                self.counts["invalid"] += invalid
+                self.counts["failed_jobs"] += len(failures)
+                if self.on_failures:
+                    self.on_failures(failures)
+            except Exception as error:
+                print(f"Processing a batch of {len(batch)} failed: {error!r}", file=sys.stderr)
+            finally:
+                self.counts["processed"] += len(batch)
+                self.counts["batches"] += 1
+                for _ in batch:
+                    self.queue.task_done()
+
+
+async def read_chunked(reader, limit=MAX_BODY):
+    """Read a ``Transfer-Encoding: chunked`` body and return it, or None once it grows past ``limit``.
+
+    Raises ValueError on a malformed chunk size, which is answered with 400.
+    """
+    chunks = []
+    size = 0
+    while True:
+        line = await reader.readuntil(b"\r\n")
+        # Chunk extensions after ";" are allowed and ignored
+        length = int(line.split(b";", 1)[0].strip(), 16)
+        if length == 0:
+            # Skip any trailer fields up to the blank line
+            while await reader.readuntil(b"\r\n") != b"\r\n":
+                pass
+            return b"".join(chunks)
+        size += length
+        if size > limit:
+            return None
+        chunks.append(await reader.readexactly(length))
+        if await reader.readexactly(2) != b"\r\n":
+            raise ValueError("Chunk not followed by CRLF")
+
+
+def sample_payloads(count, seed=0):
+    """Return ``count`` JSON webhook bodies in the shapes failed_jobs understands, about a tenth of them failed."""
+    rng = random.Random(seed)
+    payloads = []
+    for i in range(count):
+        failed = rng.random() < 0.1
+        shape = i % 3
+        if shape == 0:
+            payload = {"object_kind": "build", "build_name": f"test-{i}", "build_status": "failed" if failed else "success"}
+        elif shape == 1:
+            payload = {"name": f"deploy-{i}", "build": {"number": i, "phase": "COMPLETED", "status": "FAILURE" if failed else "SUCCESS"}}
+        else:
+            payload = {"build_jobs": [{"job": "backend", "status": "active"}, {"job": f"frontend-{i}", "status": "failed" if failed else "active"}]}
+        payloads.append(json.dumps(payload).encode())
+    return payloads
+
+
+async def _post_loop(host, port, path, payloads, deadline, latencies, statuses):
+    """Send payloads one after another over one keep-alive connection until ``deadline``."""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        index = 0
+        while time.perf_counter() < deadline:
+            body = payloads[index % len(payloads)]
+            index += 1
+            start = time.perf_counter()
+            writer.write(b"POST %s HTTP/1.1\r\nHost: %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n%s"
+                         % (path.encode(), host.encode(), len(body), body))
+            head = await reader.readuntil(b"\r\n\r\n")
+            latencies.append(time.perf_counter() - start)
+            status = int(head.split(None, 2)[1])
+            statuses[status] = statuses.get(status, 0) + 1
+            for line in head.split(b"\r\n")[1:]:
+                name, _, value = line.partition(b":")
+                if name.strip().lower() == b"content-length" and int(value):
+                    await reader.readexactly(int(value))
+    finally:
+        writer.close()
+
+
+async def get_stats(host, port):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(b"GET /stats HTTP/1.1\r\nHost: %s\r\nConnection: close\r\n\r\n" % host.encode())
+    response = await reader.read()
+    writer.close()
+    return json.loads(response.split(b"\r\n\r\n", 1)[1])
+
+
+async def load(url, connections, seconds, seed=0):
+    """POST sample payloads to ``url`` over ``connections`` connections for ``seconds`` and return the figures."""
+    parts = urlsplit(url)
+    host, port, path = parts.hostname, parts.port or 80, parts.path or "/"
+    payloads = sample_payloads(1000, seed)
+    latencies = []
+    statuses = {}
+    start = time.perf_counter()
+    deadline = start + seconds
+    await asyncio.gather(*(_post_loop(host, port, path, payloads, deadline, latencies, statuses) for _ in range(connections)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "connections": connections,
+        "requests": len(latencies),
+        "seconds": round(elapsed, 3),
+        "requests_per_s": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 3),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3),
+        "statuses": {str(status): count for status, count in sorted(statuses.items())}
+    }
+
+
+async def load_async(args):
+    report = await load(args.url, args.connections, args.seconds, args.seed)
+    print(f"{report['requests_per_s']:>9.1f} requests/s  p50 {report['p50_ms']:.2f} ms  p99 {report['p99_ms']:.2f} ms  "
+          f"statuses {report['statuses']}", file=sys.stderr)
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+async def bench_async(args):
+    """Run a receiver in its own process, load it, and check every accepted payload was processed."""
+    server = subprocess.Popen(
+        [sys.executable, __file__, "serve", "--port", "0", "--quiet", "--queue-size", str(args.queue_size)],
+        stderr=subprocess.PIPE, text=True
+    )
+    try:
+        port = int(server.stderr.readline().rsplit(":", 1)[1].strip(" /\n"))
+        report = await load(f"http://127.0.0.1:{port}/hook", args.connections, args.seconds, args.seed)
+        for _ in range(100):
+            stats = await get_stats("127.0.0.1", port)
+            if not stats["queued"] and stats["processed"] == stats["accepted"]:
+                break
+            await asyncio.sleep(0.1)
+        report["server"] = stats
+        if stats["accepted"] != report["statuses"].get("200", 0) or stats["processed"] != stats["accepted"]:
+            sys.exit(f"Accepted payloads went missing: {stats}")
+    finally:
+        server.terminate()
+        server.wait()
+    print(f"{report['requests_per_s']:>9.1f} requests/s  p50 {report['p50_ms']:.2f} ms  p99 {report['p99_ms']:.2f} ms  "
+          f"{stats['processed']} processed in {stats['batches']} batches  {stats['failed_jobs']} failed jobs", file=sys.stderr)
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+async def serve_async(args):
+    receiver = WebhookReceiver(args.queue_size, args.workers, args.batch, args.enqueue_wait,
+                               on_failures=None if args.quiet else print_failures)
+    port = await receiver.start(args.host, args.port)
+    print(f"Listening on http://{args.host}:{port}/", file=sys.stderr, flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await receiver.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Receive CI webhooks, acknowledge them at once and report failed jobs.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="receive webhooks and print failed jobs as JSON lines")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8080)
+    serve_parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE)
+    serve_parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    serve_parser.add_argument("--batch", type=int, default=DEFAULT_BATCH, help="most payloads processed at once")
+    serve_parser.add_argument("--enqueue-wait", type=float, default=DEFAULT_ENQUEUE_WAIT,
+                              help="seconds to wait for room in a full queue before answering 503")
+    serve_parser.add_argument("--quiet", action="store_true", help="count failed jobs without printing them")
+    serve_parser.set_defaults(func=serve_async)
+
+    load_parser = commands.add_parser("load", help="POST sample payloads to a receiver as fast as it answers")
+    load_parser.add_argument("url")
+    load_parser.add_argument("--connections", type=int, default=50)
+    load_parser.add_argument("--seconds", type=float, default=10.0)
+    load_parser.add_argument("--seed", type=int, default=0)
+    load_parser.set_defaults(func=load_async)
+
+    bench_parser = commands.add_parser("bench", help="load a receiver in another process and check nothing was lost")
+    bench_parser.add_argument("--connections", type=int, default=50)
+    bench_parser.add_argument("--seconds", type=float, default=10.0)
+    bench_parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE)
+    bench_parser.add_argument("--seed", type=int, default=0)
+    bench_parser.set_defaults(func=bench_async)
+
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(args.func(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import heapq
+import itertools
+from datetime import date, datetime, timedelta
+
+# Longest wait between ticks, so a suspended laptop or a clock change is noticed soon
+MAX_TICK_MS = 60 * 1000
+
+# Event kinds, in the order they fire when they fall on the same moment
+OVERDUE = "overdue"
+REMINDER = "reminder"
+
+
+def parse_due_date(value):
+    """Return the date of a YYYY-MM-DD due date, or None if it is missing or not a date."""
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+class DueScheduler:
+    """Fire reminders and overdue notices for tasks as their due dates pass.
+
+    Every pending task with a due date in the future has its next events in
+    a heap ordered by time: a reminder when its due day starts and an overdue
+    notice when the day after starts. A single ``root.after`` tick sleeps
+    until the earliest event and pops whatever has come due, so each event
+    costs O(log n) and nothing ever walks all the tasks on a timer.
+
+    Edits are handled lazily. The heap keeps entries for due dates that have
+    since changed, and each popped entry is checked against ``_scheduled``
+    before it fires. The heap is rebuilt once stale entries outnumber live
+    ones.
+
+    Fired events go to ``on_due(reminders, overdue)`` as two lists of tasks,
+    once per tick, from the Tk main loop.
+    """
+
+    def __init__(self, engine, root, on_due=None):
+        self.engine = engine
+        self.root = root
+        self.on_due = on_due
+        self.today = date.today()
+        self._heap = []
+        # Task ID -> the due date its heap entries were made for
+        self._scheduled = {}
+        self._order = itertools.count()
+        self._job = None
+        engine.add_listener(self.on_task_event)
+
+    def start(self):
+        """Start ticking."""
+        if self._job is None:
+            self._job = self.root.after(self._delay_ms(), self._tick)
+
+    def stop(self):
+        """Stop ticking."""
+        if self._job is not None:
+            self.root.after_cancel(self._job)
+            self._job = None
+
+    def is_overdue(self, task):
+        """Return True if the task is still pending and its due day has passed."""
+        due = parse_due_date(task["due_date"])
+        return not task["completed"] and due is not None and due < self.today
+
+    def add_tasks(self, tasks):
+        """Schedule tasks that were loaded in bulk."""
+        for task in tasks:
+            self._schedule(task)
+
+    def on_task_event(self, event, task):
+        """Reschedule a task when it is added, changed or removed."""
+        if event == "removed":
+            self._scheduled.pop(task["id"], None)
+        else:
+            self._schedule(task)
+
+    def _schedule(self, task):
+        due = parse_due_date(task["due_date"])
+        if task["completed"] or due is None or due < self.today:
+            # Nothing left to fire; any heap entries go stale
+            self._scheduled.pop(task["id"], None)
+            return
+        if self._scheduled.get(task["id"]) == due:
+            return
+
+        self._scheduled[task["id"]] = due
+        start = datetime.combine(due, datetime.min.time())
+        if due > self.today:
+            self._push(start, REMINDER, task["id"], due)
+        self._push(start + timedelta(days=1), OVERDUE, task["id"], due)
+        if len(self._heap) > 2 * len(self._scheduled) + 64:
+            self._compact()
+
+    def _push(self, when, kind, task_id, due):
+        # The counter keeps entries for the same moment in the order they were made
+        heapq.heappush(self._heap, (when, kind == REMINDER, next(self._order), kind, task_id, due))
+
+    def _compact(self):
+        """Drop stale entries by rebuilding the heap from the live schedule."""
+        self._heap = [entry for entry in self._heap if self._scheduled.get(entry[4]) == entry[5]]
+        heapq.heapify(self._heap)
+
+    def _tick(self):
+        self._job = None
+        now = datetime.now()
+        self.today = now.date()
+        reminders = []
+        overdue = []
+        while self._heap and self._heap[0][0] <= now:
+            _, _, _, kind, task_id, due = heapq.heappop(self._heap)
+            if self._scheduled.get(task_id) != due:
+                continue
+            task = self.engine.get(task_id)
+            if task is None or task["completed"]:
+                continue
+            if kind == OVERDUE:
+                del self._scheduled[task_id]
+                overdue.append(task)
+            else:
+                reminders.append(task)
+        if (reminders or overdue) and self.on_due:
+            self.on_due(reminders, overdue)
+        self._job = self.root.after(self._delay_ms(), self._tick)
+
+    def _delay_ms(self):
+        if not self._heap:
+            return MAX_TICK_MS
+        wait = (self._heap[0][0] - datetime.now()).total_seconds() * 1000
+        # A millisecond late so the event is due when the tick runs
+        return max(1, min(MAX_TICK_MS, int(wait) + 1))
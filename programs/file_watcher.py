@@ -0,0 +1,137 @@
+import ctypes
+import ctypes.util
+import os
+import struct
+import sys
+
+# inotify flags from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+# struct inotify_event: int wd; uint32_t mask, cookie, len; char name[len]
+EVENT_HEADER = struct.Struct("iIII")
+
+# How often the polling watcher looks at the files
+POLL_INTERVAL_MS = 1000
+
+
+class InotifyWatcher:
+    """Call ``callback()`` when any of ``paths`` is written or replaced, using Linux inotify.
+
+    The parent directories are watched rather than the files, so a file
+    that is replaced by a rename keeps being watched. The inotify descriptor
+    is handed to Tk's file handler, so nothing runs until the kernel reports
+    a change, and a burst of events becomes one callback on the next idle.
+    """
+
+    def __init__(self, paths, root, callback):
+        self.root = root
+        self.callback = callback
+        self._idle_job = None
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        # Watch descriptor -> names in that directory that matter
+        self._names = {}
+        directories = {}
+        for path in paths:
+            directory, name = os.path.split(os.path.abspath(path))
+            directories.setdefault(directory, set()).add(os.fsencode(name))
+        for directory, names in directories.items():
+            wd = libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+            if wd < 0:
+                error = ctypes.get_errno()
+                os.close(self.fd)
+                raise OSError(error, f"Cannot watch {directory}")
+            self._names[wd] = names
+
+        import tkinter
+        root.tk.createfilehandler(self.fd, tkinter.READABLE, self._on_readable)
+
+    def close(self):
+        """Stop watching."""
+        if self.fd is not None:
+            self.root.tk.deletefilehandler(self.fd)
+            os.close(self.fd)
+            self.fd = None
+        if self._idle_job is not None:
+            self.root.after_cancel(self._idle_job)
+            self._idle_job = None
+
+    def _on_readable(self, fd, mask):
+        changed = False
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, _, _, length = EVENT_HEADER.unpack_from(data, offset)
+                name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b"\0")
+                offset += EVENT_HEADER.size + length
+                if name in self._names.get(wd, ()):
+                    changed = True
+        if changed and self._idle_job is None:
+            self._idle_job = self.root.after_idle(self._fire)
+
+    def _fire(self):
+        self._idle_job = None
+        self.callback()
+
+
+class PollingWatcher:
+    """Call ``callback()`` when the size, modification time or inode of any of ``paths`` changes.
+
+    Used where inotify is not available. Each check is one stat per file,
+    scheduled with ``root.after``.
+    """
+
+    def __init__(self, paths, root, callback, interval=POLL_INTERVAL_MS):
+        self.paths = list(paths)
+        self.root = root
+        self.callback = callback
+        self.interval = interval
+        self._seen = self._stat_all()
+        self._job = root.after(interval, self._check)
+
+    def close(self):
+        """Stop watching."""
+        if self._job is not None:
+            self.root.after_cancel(self._job)
+            self._job = None
+
+    def _stat_all(self):
+        stats = []
+        for path in self.paths:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                stats.append(None)
+            else:
+                stats.append((stat.st_ino, stat.st_size, stat.st_mtime_ns))
+        return stats
+
+    def _check(self):
+        stats = self._stat_all()
+        if stats != self._seen:
+            self._seen = stats
+            self.callback()
+        self._job = self.root.after(self.interval, self._check)
+
+
+def watch_files(paths, root, callback):
+    """Watch ``paths`` with inotify on Linux and by polling elsewhere; returns an object with close()."""
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(paths, root, callback)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(paths, root, callback)
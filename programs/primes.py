@@ -0,0 +1,366 @@
+import argparse
+import itertools
+import json
+import math
+import operator
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    # The batch API then falls back to a loop over is_prime
+    np = None
+
+# Odd numbers per sieve segment, one byte each: small enough to stay in the L2 cache, big enough
+# that the Python loop over the base primes, once per segment, is paid rarely (1 MiB: 4.1 s to 10**9, 256 KiB: 6.4 s)
+SEGMENT_SIZE = 1 << 20
+
+# Bases that make Miller-Rabin exact for every n below 4759123141, which covers 32 bits
+MR_BASES_32 = (2, 7, 61)
+MR_BASE_32_LIMIT = 4759123141
+
+# Bases that make Miller-Rabin exact for every n below 2**64 (Jim Sinclair's set)
+MR_BASES_64 = (2, 325, 9375, 28178, 450775, 9780504, 1795265022)
+
+# The first thirteen primes as bases are exact below 3.3 * 10**24; above that is_prime is a strong probable-prime test
+MR_BASES_BIG = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41)
+
+# Batches whose values span at most this many numbers may be answered from a sieve instead of one test each
+BATCH_SIEVE_SPAN = 1 << 31
+
+# Nor is a sieve used when its base primes, up to sqrt(hi), would need more than this many bytes
+SIEVE_ROOT_LIMIT = 1 << 27
+
+# Rough costs in ns, measured on CPython 3.11, to choose between sieving a range and testing each number:
+# per number of the range, per number up to sqrt(hi) for the base primes, per base prime in each segment,
+# and per is_prime call
+SIEVE_NS_PER_NUMBER = 5
+SIEVE_NS_PER_ROOT = 20
+SIEVE_NS_PER_BASE_PRIME = 1000
+TEST_NS = 4000
+
+# Trial division by these first catches most composites before any modular exponentiation
+SMALL_PRIMES = (3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41, 43, 47)
+
+# Segment-sized run of zero bytes, sliced to cross off multiples without allocating
+_ZEROS = memoryview(bytes(SEGMENT_SIZE))
+
+
+def base_primes(limit):
+    """Return the odd primes up to ``limit`` from a plain sieve of the odd numbers."""
+    if limit < 3:
+        return []
+    # flags[i] stands for 2 * i + 1
+    flags = bytearray([1]) * ((limit + 1) // 2)
+    flags[0] = 0
+    for i in range(1, (math.isqrt(limit) - 1) // 2 + 1):
+        if flags[i]:
+            p = 2 * i + 1
+            start = p * p // 2
+            flags[start::p] = bytes(len(range(start, len(flags), p)))
+    return list(itertools.compress(range(1, limit + 1, 2), flags))
+
+
+def odd_segments(lo, hi, segment_size=SEGMENT_SIZE):
+    """Yield ``(first, flags)`` covering the odd numbers in ``[lo, hi)``, where ``flags[i]`` is 1 if ``first + 2 * i`` is prime.
+
+    Only the primes up to sqrt(hi) are kept in memory, and each segment
+    of ``segment_size`` odd numbers is sieved by slice assignments, so a
+    range of billions costs about a MiB. The same bytearray is
+    reused for every segment: copy anything wanted from it before asking
+    for the next one.
+    """
+    lo = max(lo, 3) | 1
+    if lo >= hi:
+        return
+    primes = base_primes(math.isqrt(hi - 1))
+    flags = bytearray(segment_size)
+    # Odd multiples of p from p * p on; each is advanced past every segment it was used in
+    next_multiple = [max(p * p, (lo + p - 1) // p * p) for p in primes]
+    next_multiple = [multiple if multiple & 1 else multiple + p for multiple, p in zip(next_multiple, primes)]
+    for first in range(lo, hi, 2 * segment_size):
+        count = min(segment_size, (hi - first + 1) // 2)
+        flags[:count] = b"\x01" * count
+        end = first + 2 * count
+        for index, p in enumerate(primes):
+            multiple = next_multiple[index]
+            if multiple >= end:
+                continue
+            start = (multiple - first) // 2
+            crossed = (count - 1 - start) // p + 1
+            flags[start:count:p] = _ZEROS[:crossed]
+            next_multiple[index] = multiple + 2 * p * crossed
+        yield first, flags if count == segment_size else flags[:count]
+
+
+def sieve_pays(lo, hi, tests):
+    """Return whether sieving ``[lo, hi)`` is cheaper than ``tests`` calls to is_prime.
+
+    Besides the length of the range, a sieve pays for its base primes up
+    to sqrt(hi), and for going through all of them once per segment, which
+    is what makes a narrow range of big numbers slow to sieve.
+    """
+    root = math.isqrt(max(hi - 1, 0))
+    if root // 2 > SIEVE_ROOT_LIMIT:
+        return False
+    base = root / max(math.log(root), 1) if root > 2 else 0
+    segments = (hi - lo) // (2 * SEGMENT_SIZE) + 1
+    cost = SIEVE_NS_PER_NUMBER * (hi - lo) + SIEVE_NS_PER_ROOT * root + SIEVE_NS_PER_BASE_PRIME * base * segments
+    return cost < TEST_NS * tests
+
+
+def primes_between(lo, hi):
+    """Yield the primes in ``[lo, hi)`` in order.
+
+    A range too narrow for its height to be worth sieving, like a hundred
+    numbers around 10**17, has each odd number tested instead.
+    """
+    if lo <= 2 < hi:
+        yield 2
+    if not sieve_pays(lo, hi, (hi - lo) // 2):
+        yield from (n for n in range(max(lo, 3) | 1, hi, 2) if is_prime(n))
+        return
+    for first, flags in odd_segments(lo, hi):
+        yield from itertools.compress(range(first, first + 2 * len(flags), 2), flags)
+
+
+def count_primes(lo, hi):
+    """Return how many primes there are in ``[lo, hi)``."""
+    if not sieve_pays(lo, hi, (hi - lo) // 2):
+        return sum(1 for _ in primes_between(lo, hi))
+    return (lo <= 2 < hi) + sum(flags.count(1) for _, flags in odd_segments(lo, hi))
+
+
+class PrimeBitmap:
+    """Which numbers of ``[lo, hi)`` are prime, one bit per odd number.
+
+    Bit ``i`` of ``bits`` (little-endian within each byte) stands for
+    ``first + 2 * i``, so the primes below 10**9 take 62.5 MB. Built by
+    packing the segments of odd_segments as they are sieved.
+    """
+
+    def __init__(self, lo, hi):
+        self.lo = lo
+        self.hi = hi
+        self.first = max(lo, 3) | 1
+        packed = bytearray()
+        for _, flags in odd_segments(lo, hi):
+            packed += pack_bits(flags)
+        self.bits = bytes(packed)
+
+    def __contains__(self, n):
+        if not self.lo <= n < self.hi:
+            raise ValueError(f"{n} is outside [{self.lo}, {self.hi})")
+        if n == 2:
+            return True
+        if n < 3 or not n & 1:
+            return False
+        index = (n - self.first) >> 1
+        return bool(self.bits[index >> 3] >> (index & 7) & 1)
+
+    def lookup(self, values):
+        """Return a bool array of which of a NumPy integer array of values, all in ``[lo, hi)``, are prime."""
+        values = np.asarray(values)
+        if not self.bits:
+            # Nothing odd from 3 up is in the range
+            return values == 2
+        bits = np.frombuffer(self.bits, dtype=np.uint8)
+        odd = (values & 1).astype(bool) & (values >= 3)
+        index = np.where(odd, (values - self.first) >> 1, 0)
+        found = (bits[index >> 3] >> (index & 7).astype(np.uint8)) & 1
+        return (odd & found.astype(bool)) | (values == 2)
+
+
+def pack_bits(flags):
+    """Pack a bytearray of 0 and 1 bytes into bits, the first byte into the lowest bit."""
+    if np is not None:
+        return np.packbits(np.frombuffer(flags, dtype=np.uint8), bitorder="little").tobytes()
+    padded = bytes(flags) + bytes(-len(flags) % 8)
+    # int() reads base 2 in linear time, so this is C speed as well
+    digits = padded.translate(bytes.maketrans(b"\x00\x01", b"01"))[::-1]
+    return int(digits, 2).to_bytes(len(padded) // 8, "little")
+
+
+def is_prime(n):
+    """Return whether ``n`` is prime, by Miller-Rabin with bases that make it exact below 2**64."""
+    if n < 2:
+        return False
+    if n < 4:
+        return True
+    if not n & 1:
+        return False
+    for p in SMALL_PRIMES:
+        if n % p == 0:
+            return n == p
+    if n < 53 * 53:
+        # A composite with no prime factor up to 47 is at least 53 squared
+        return True
+    d = n - 1
+    shift = 0
+    while not d & 1:
+        d >>= 1
+        shift += 1
+    if n < MR_BASE_32_LIMIT:
+        bases = MR_BASES_32
+    else:
+        bases = MR_BASES_64 if n < 1 << 64 else MR_BASES_BIG
+    for base in bases:
+        base %= n
+        if not base:
+            # A base that is a multiple of n says nothing about it
+            continue
+        x = pow(base, d, n)
+        if not x:
+            # n divides a power of a smaller number, so it shares a factor with it
+            return False
+        if x == 1 or x == n - 1:
+            continue
+        for _ in range(shift - 1):
+            x = x * x % n
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+
+def is_prime_batch(values):
+    """Return which of ``values`` are prime, as a bool array for a NumPy array or a list otherwise.
+
+    When sieve_pays says a PrimeBitmap of the values' span, of at most
+    BATCH_SIEVE_SPAN numbers, is cheaper than testing each value, the
+    values are looked up in one, so a million values cost one sieve and a
+    few vector operations; otherwise each gets is_prime. Integer arrays
+    keep their dtype, so uint64 values above 2**63 work too. Floats, even
+    whole ones, raise ValueError rather than being cut down to an integer.
+    """
+    if np is None or not isinstance(values, np.ndarray):
+        return [is_prime(_integer(value)) for value in values]
+    if values.dtype.kind not in "biuO":
+        raise ValueError(f"Cannot test {values.dtype} values for primality, only integers")
+    if values.size == 0:
+        return np.zeros(values.shape, dtype=bool)
+    if values.dtype.kind in "iu":
+        lo = max(int(values.min()), 0)
+        hi = int(values.max()) + 1
+        if hi - lo <= BATCH_SIEVE_SPAN and sieve_pays(lo, hi, values.size):
+            return (values >= 2) & PrimeBitmap(lo, hi).lookup(np.maximum(values, lo))
+    return np.fromiter((is_prime(_integer(value)) for value in values.ravel()), dtype=bool, count=values.size).reshape(values.shape)
+
+
+def _integer(value):
+    """Return ``value`` as an int, raising ValueError for anything that is not an integer, such as 2.5."""
+    try:
+        return operator.index(value)
+    except TypeError:
+        raise ValueError(f"Not an integer: {value!r}") from None
+
+
+def trial_division(num):
+    """prime_num.py's loop without its prints: try every divisor up to the square root. Kept as the benchmark baseline."""
+    if num <= 1:
+        return False
+    for i in range(2, int(num ** 0.5) + 1):
+        if num % i == 0:
+            return False
+    return True
+
+
+def bench(args):
+    """Count primes below --limit with the sieve, and time single tests and a batch against trial division."""
+    limit = int(args.limit)
+    report = {"limit": limit}
+
+    start = time.perf_counter()
+    count = count_primes(0, limit)
+    report["sieve_count"] = count
+    report["sieve_s"] = round(time.perf_counter() - start, 3)
+    print(f"sieve    pi({limit}) = {count}  {report['sieve_s']:.2f} s", file=sys.stderr)
+
+    # Trial division of the whole range would take days, so it gets the window just below the limit
+    lo = max(limit - args.window, 0)
+    start = time.perf_counter()
+    trial_count = sum(1 for n in range(lo, limit) if trial_division(n))
+    report["trial_window_s"] = round(time.perf_counter() - start, 3)
+    start = time.perf_counter()
+    window_count = count_primes(lo, limit)
+    report["sieve_window_s"] = round(time.perf_counter() - start, 3)
+    if window_count != trial_count:
+        sys.exit(f"The sieve found {window_count} primes in [{lo}, {limit}) and trial division {trial_count}")
+    report["window"] = [lo, limit]
+    report["window_primes"] = window_count
+    print(f"window   [{lo}, {limit})  trial division {report['trial_window_s']:.2f} s  sieve {report['sieve_window_s']:.4f} s", file=sys.stderr)
+
+    primes = list(primes_between(lo, limit))[-args.singles:]
+    start = time.perf_counter()
+    for p in primes:
+        trial_division(p)
+    report["trial_single_us"] = round((time.perf_counter() - start) / len(primes) * 1e6, 2)
+    start = time.perf_counter()
+    for p in primes:
+        is_prime(p)
+    report["mr_single_us"] = round((time.perf_counter() - start) / len(primes) * 1e6, 2)
+    big = (1 << 61) - 1
+    start = time.perf_counter()
+    for _ in range(1000):
+        is_prime(big)
+    report["mr_2_61_minus_1_us"] = round((time.perf_counter() - start) / 1000 * 1e6, 2)
+    print(f"single   prime near {limit}: trial division {report['trial_single_us']:.1f} us  Miller-Rabin {report['mr_single_us']:.1f} us  "
+          f"2**61-1: {report['mr_2_61_minus_1_us']:.1f} us", file=sys.stderr)
+
+    if np is not None:
+        rng = np.random.default_rng(args.seed)
+        values = rng.integers(0, limit, args.batch)
+        start = time.perf_counter()
+        flags = is_prime_batch(values)
+        report["batch_s"] = round(time.perf_counter() - start, 3)
+        report["batch_values"] = args.batch
+        sample = values[:2000]
+        if [trial_division(int(value)) for value in sample] != flags[:2000].tolist():
+            sys.exit("The batch disagrees with trial division")
+        print(f"batch    {args.batch} random values below {limit}  {report['batch_s']:.2f} s", file=sys.stderr)
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+def check(args):
+    for n in args.numbers:
+        print(f"{n} is {'a' if is_prime(n) else 'not a'} prime number")
+
+
+def list_range(args):
+    if args.count:
+        print(count_primes(args.lo, args.hi))
+        return
+    sys.stdout.writelines(f"{p}\n" for p in primes_between(args.lo, args.hi))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prime tests and ranges by Miller-Rabin and a segmented sieve.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    check_parser = commands.add_parser("check", help="say whether numbers are prime")
+    check_parser.add_argument("numbers", nargs="+", type=int)
+    check_parser.set_defaults(func=check)
+
+    range_parser = commands.add_parser("range", help="print the primes in [LO, HI)")
+    range_parser.add_argument("lo", type=int)
+    range_parser.add_argument("hi", type=int)
+    range_parser.add_argument("--count", action="store_true", help="only print how many there are")
+    range_parser.set_defaults(func=list_range)
+
+    bench_parser = commands.add_parser("bench", help="compare with prime_num.py's trial division")
+    bench_parser.add_argument("--limit", type=float, default=1e9)
+    bench_parser.add_argument("--window", type=int, default=100000, help="numbers below the limit that trial division also tests")
+    bench_parser.add_argument("--singles", type=int, default=1000, help="primes timed one at a time")
+    bench_parser.add_argument("--batch", type=int, default=1000000, help="random values for is_prime_batch")
+    bench_parser.add_argument("--seed", type=int, default=0)
+    bench_parser.set_defaults(func=bench)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import bisect
+import re
+
+WORD_RE = re.compile(r"\w+")
+
+
+def tokenize(text):
+    """Split text into lowercase words."""
+    return WORD_RE.findall(text.lower()) if text else []
+
+
+class SearchIndex:
+    """Inverted index from word to the IDs of the tasks whose title or description has it.
+
+    Words are also kept in a sorted list, so every word starting with a
+    prefix is one bisect away and prefix queries never scan the vocabulary.
+    Words from add_many are appended unsorted and the list is sorted the
+    next time it is needed, so loading in batches sorts it once.
+    """
+
+    def __init__(self):
+        self._postings = {}
+        self._words = []
+        self._words_sorted = True
+        self._task_words = {}
+
+    def rebuild(self, tasks):
+        """Index all tasks from scratch."""
+        self._postings = {}
+        self._words = []
+        self._words_sorted = True
+        self._task_words = {}
+        self.add_many(tasks)
+
+    def add_many(self, tasks):
+        """Index tasks that are not in the index yet, sorting the new words in one go."""
+        new_words = []
+        for task in tasks:
+            words = self._words_of(task)
+            self._task_words[task["id"]] = words
+            for word in words:
+                postings = self._postings.get(word)
+                if postings is None:
+                    postings = self._postings[word] = set()
+                    new_words.append(word)
+                postings.add(task["id"])
+        if new_words:
+            self._words.extend(new_words)
+            self._words_sorted = False
+
+    def add(self, task):
+        """Index a new or changed task."""
+        words = self._words_of(task)
+        old_words = self._task_words.get(task["id"], frozenset())
+        for word in old_words - words:
+            self._unpost(word, task["id"])
+        for word in words - old_words:
+            postings = self._postings.get(word)
+            if postings is None:
+                postings = self._postings[word] = set()
+                bisect.insort(self._sorted_words(), word)
+            postings.add(task["id"])
+        self._task_words[task["id"]] = words
+
+    def remove(self, task_id):
+        """Drop a task from the index."""
+        for word in self._task_words.pop(task_id, ()):
+            self._unpost(word, task_id)
+
+    def on_task_event(self, event, task):
+        """Keep the index in step with repository events."""
+        if event == "removed":
+            self.remove(task["id"])
+        else:
+            self.add(task)
+
+    def search(self, query):
+        """Return the set of task IDs with a word starting with each word of the query."""
+        matches = None
+        for prefix in sorted(set(tokenize(query)), key=len, reverse=True):
+            ids = self._prefix_ids(prefix)
+            matches = ids if matches is None else matches & ids
+            if not matches:
+                break
+        return matches if matches is not None else set()
+
+    def matches(self, task_id, query):
+        """Return True if the task would be found by the query."""
+        words = self._task_words.get(task_id, ())
+        return all(
+            any(word.startswith(prefix) for word in words)
+            for prefix in tokenize(query)
+        )
+
+    def _prefix_ids(self, prefix):
+        ids = set()
+        words = self._sorted_words()
+        index = bisect.bisect_left(words, prefix)
+        while index < len(words) and words[index].startswith(prefix):
+            ids |= self._postings[words[index]]
+            index += 1
+        return ids
+
+    def _sorted_words(self):
+        if not self._words_sorted:
+            self._words.sort()
+            self._words_sorted = True
+        return self._words
+
+    def _unpost(self, word, task_id):
+        postings = self._postings[word]
+        postings.discard(task_id)
+        if not postings:
+            del self._postings[word]
+            words = self._sorted_words()
+            del words[bisect.bisect_left(words, word)]
+
+    @staticmethod
+    def _words_of(task):
+        return frozenset(tokenize(task["title"]) + tokenize(task["description"]))
@@ -0,0 +1,154 @@
+import sqlite3
+import threading
+
+from task_store import JournaledTaskStore, TaskStore
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL,
+    description TEXT NOT NULL DEFAULT '',
+    created_at TEXT NOT NULL,
+    due_date TEXT,
+    priority TEXT NOT NULL,
+    completed INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS tasks_priority ON tasks (priority);
+CREATE INDEX IF NOT EXISTS tasks_completed ON tasks (completed);
+CREATE INDEX IF NOT EXISTS tasks_due_date ON tasks (due_date);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+# sqlite3 caches compiled statements by their SQL text, so these are only prepared once
+UPSERT_TASK = """
+INSERT INTO tasks (id, title, description, created_at, due_date, priority, completed)
+VALUES (:id, :title, :description, :created_at, :due_date, :priority, :completed)
+ON CONFLICT (id) DO UPDATE SET
+    title = excluded.title,
+    description = excluded.description,
+    due_date = excluded.due_date,
+    priority = excluded.priority,
+    completed = excluded.completed
+"""
+DELETE_TASK = "DELETE FROM tasks WHERE id = ?"
+# Rows fetched per hold of the connection lock while loading, so writes can go in between
+FETCH_ROWS = 1000
+SET_NEXT_ID = "INSERT INTO meta (key, value) VALUES ('next_id', ?) ON CONFLICT (key) DO UPDATE SET value = MAX(value, excluded.value)"
+
+
+class SqliteTaskStore(TaskStore):
+    """Keep tasks in a SQLite database running in WAL mode.
+
+    Each batch of operations is one transaction, and the priority, completed
+    and due_date columns are indexed for the filters the app offers.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.next_id = 1
+        # The connection is shared with the background writer, and sqlite3 cannot
+        # run two transactions on one connection at once, so every use holds this
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # WAL mode keeps commits atomic with NORMAL, FULL would fsync every commit
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def load(self):
+        """Return all tasks in ID order."""
+        return list(self.iter_load())
+
+    def iter_load(self):
+        """Yield all tasks in ID order straight from the cursor."""
+        self.load_progress = 0.0
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'next_id'").fetchone()
+            max_id, total = self.conn.execute("SELECT MAX(id), COUNT(*) FROM tasks").fetchone()
+            self.next_id = max(row[0] if row else 1, (max_id or 0) + 1)
+
+            # Tasks the app adds while this runs get IDs from next_id on and must not come back here
+            cursor = self.conn.execute(
+                "SELECT id, title, description, created_at, due_date, priority, completed "
+                "FROM tasks WHERE id < ? ORDER BY id",
+                (self.next_id,)
+            )
+        count = 0
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(FETCH_ROWS)
+            if not rows:
+                break
+            for task_id, title, description, created_at, due_date, priority, completed in rows:
+                count += 1
+                self.load_progress = count / total
+                yield {
+                    "id": task_id,
+                    "title": title,
+                    "description": description,
+                    "created_at": created_at,
+                    "due_date": due_date,
+                    "priority": priority,
+                    "completed": bool(completed)
+                }
+        self.load_progress = 1.0
+
+    def put(self, task):
+        """Insert or update a task."""
+        self.write_batch([("put", task)])
+
+    def delete(self, task_id):
+        """Delete a task."""
+        self.write_batch([("delete", task_id)])
+
+    def write_batch(self, ops):
+        """Apply all operations in a single transaction."""
+        with self._lock, self.conn:
+            puts = []
+            deletes = []
+            for op, value in ops:
+                if op == "put":
+                    # A delete earlier in the batch must not remove a later put of the same task
+                    if deletes:
+                        self._flush(puts, deletes)
+                        puts, deletes = [], []
+                    puts.append(value)
+                    self.next_id = max(self.next_id, value["id"] + 1)
+                else:
+                    deletes.append((value,))
+            self._flush(puts, deletes)
+            self.conn.execute(SET_NEXT_ID, (self.next_id,))
+
+    def reserve_ids(self, count):
+        """Set aside ``count`` new task IDs in the database and return the first one."""
+        with self._lock, self.conn:
+            # BEGIN IMMEDIATE takes the write lock first, so two processes cannot read the same value
+            self.conn.execute("BEGIN IMMEDIATE")
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'next_id'").fetchone()
+            start = max(self.next_id, row[0] if row else 1)
+            self.next_id = start + count
+            self.conn.execute(SET_NEXT_ID, (self.next_id,))
+        return start
+
+    def import_json(self, json_path):
+        """Copy every task from a tasks.json board (and its journal) into the database."""
+        json_store = JournaledTaskStore(json_path)
+        tasks = json_store.load()
+        json_store.close()
+        self.next_id = max(self.next_id, json_store.next_id)
+        self.write_batch([("put", task) for task in tasks])
+        return len(tasks)
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self.conn.close()
+
+    def _flush(self, puts, deletes):
+        if puts:
+            self.conn.executemany(UPSERT_TASK, [dict(task, completed=int(task["completed"])) for task in puts])
+        if deletes:
+            self.conn.executemany(DELETE_TASK, deletes)
@@ -0,0 +1,127 @@
+from search_index import SearchIndex
+from task_repository import TaskRepository
+
+PRIORITIES = ("low", "medium", "high")
+
+
+class TaskEngine:
+    """Everything the todo app does with tasks, without any GUI.
+
+    The Tk app and the command line both drive this class. It validates
+    input, raises ValueError with a user-facing message on bad input, and
+    leaves persistence and indexing to TaskRepository and its store.
+    """
+
+    def __init__(self, store, table=None):
+        self.store = store
+        self.repository = TaskRepository(store, table)
+        self.search_index = SearchIndex()
+        self.repository.add_listener(self.search_index.on_task_event)
+
+    def load(self):
+        """Load all tasks from the store."""
+        for _ in self.load_iter():
+            pass
+
+    def load_iter(self, batch_size=1000):
+        """Load tasks from the store, yielding each batch once it can be queried and searched."""
+        self.search_index.rebuild([])
+        for batch in self.repository.load_iter(batch_size):
+            self.search_index.add_many(batch)
+            yield batch
+
+    def close(self):
+        """Flush and close the store."""
+        self.store.close()
+
+    def add_listener(self, listener):
+        """Call ``listener(event, task)`` after every added, changed or removed task."""
+        self.repository.add_listener(listener)
+
+    def add(self, title, description="", due_date=None, priority="medium"):
+        """Create a task and return it."""
+        fields = self._clean(title=title, description=description, due_date=due_date, priority=priority)
+        return self.repository.add(**fields)
+
+    def update(self, task_id, **fields):
+        """Change fields of a task and return it, or None if it does not exist."""
+        return self.repository.update(task_id, **self._clean(**fields))
+
+    def complete(self, task_id):
+        """Mark a task as completed and return it."""
+        return self.repository.update(task_id, completed=True)
+
+    def mark_pending(self, task_id):
+        """Mark a task as pending and return it."""
+        return self.repository.update(task_id, completed=False)
+
+    def delete(self, task_id):
+        """Remove a task and return it, or None if it does not exist."""
+        return self.repository.delete(task_id)
+
+    def apply_changes(self, ops):
+        """Take in the tasks another process changed, as returned by the store's poll_changes."""
+        self.repository.apply_changes(ops)
+
+    def get(self, task_id):
+        """Return the task with the given ID, or None."""
+        return self.repository.get(task_id)
+
+    def query(self, show_completed=True, priority="all", due_before=None, text=None):
+        """Return the sorted IDs of the tasks that pass the given filters.
+
+        ``text`` matches tasks whose title or description has a word starting
+        with each word of the text.
+        """
+        if not text:
+            return self.repository.query(show_completed, priority, due_before)
+        return sorted(
+            task_id for task_id in self.search_index.search(text)
+            if self.matches(self.repository.get(task_id), show_completed, priority, due_before)
+        )
+
+    def matches(self, task, show_completed=True, priority="all", due_before=None, text=None):
+        """Return True if a task passes the given filters."""
+        if not show_completed and task["completed"]:
+            return False
+        if priority != "all" and task["priority"] != priority:
+            return False
+        if due_before and not (task["due_date"] and task["due_date"] < due_before):
+            return False
+        return not text or self.search_index.matches(task["id"], text)
+
+    def tasks(self, show_completed=True, priority="all", due_before=None, text=None):
+        """Yield the tasks that pass the given filters in ID order."""
+        for task_id in self.query(show_completed, priority, due_before, text):
+            yield self.repository.get(task_id)
+
+    def all(self):
+        """Return all tasks."""
+        return self.repository.all()
+
+    def import_tasks(self, records):
+        """Add every record as a new task in a single write and return the count."""
+        return len(self.repository.add_many(self._clean(**record) for record in records))
+
+    def __len__(self):
+        return len(self.repository)
+
+    def __contains__(self, task_id):
+        return task_id in self.repository
+
+    @staticmethod
+    def _clean(**fields):
+        """Validate and normalise task fields."""
+        if "title" in fields:
+            fields["title"] = (fields["title"] or "").strip()
+            if not fields["title"]:
+                raise ValueError("Task title cannot be empty!")
+        if "description" in fields:
+            fields["description"] = (fields["description"] or "").strip()
+        if "due_date" in fields:
+            fields["due_date"] = (fields["due_date"] or "").strip() or None
+        if "priority" in fields:
+            fields["priority"] = fields["priority"] or "medium"
+            if fields["priority"] not in PRIORITIES:
+                raise ValueError(f"Priority must be one of: {', '.join(PRIORITIES)}")
+        return fields
@@ -0,0 +1,269 @@
+import bisect
+from datetime import datetime
+
+from task_table import DictTaskTable
+
+# Most new IDs reserved from the store at a time
+ID_BLOCK = 64
+
+
+class TaskRepository:
+    """In-memory tasks indexed by a stable ID, persisted through a task store.
+
+    IDs come from a monotonically increasing counter that survives restarts,
+    so a deleted task's ID is never reused and no other task is renumbered.
+    They are reserved from the store in blocks, so processes sharing a
+    store never hand out the same ID.
+    Secondary indexes on priority, completion and due date are kept up to
+    date on every mutation so filtered queries only touch matching tasks.
+
+    Tasks are held in ``table``, a DictTaskTable unless a more compact one
+    such as ColumnarTaskTable is passed in.
+    """
+
+    def __init__(self, store, table=None):
+        self.store = store
+        self._tasks = table if table is not None else DictTaskTable()
+        # The reserved IDs not used yet are _next_id up to _id_limit
+        self._next_id = self._id_limit = 0
+        self._id_block = 1
+        self._listeners = []
+        self._by_priority = {}
+        self._by_completed = {True: set(), False: set()}
+        # Sorted (due_date, id) pairs for tasks that have a due date, see _due_dates
+        self._by_due_date = []
+        self._due_dates_sorted = True
+
+    def add_listener(self, listener):
+        """Call ``listener(event, task)`` after every added, changed or removed task."""
+        self._listeners.append(listener)
+
+    def load(self):
+        """Load all tasks from the store."""
+        for _ in self.load_iter():
+            pass
+
+    def load_iter(self, batch_size=1000):
+        """Load tasks from the store, yielding each batch of tasks once it is indexed.
+
+        Tasks can be queried as soon as their batch has been yielded, so a
+        caller can show a big board while the rest of it is still loading.
+        """
+        self._tasks.load([])
+        self._next_id = self._id_limit = 0
+        self._by_priority = {}
+        self._by_completed = {True: set(), False: set()}
+        self._by_due_date = []
+        self._due_dates_sorted = True
+
+        batch = []
+        for task in self.store.iter_load():
+            batch.append(task)
+            if len(batch) == batch_size:
+                self._load_batch(batch)
+                yield batch
+                batch = []
+        self._load_batch(batch)
+        if batch:
+            yield batch
+
+    def add(self, title, description="", due_date=None, priority="medium"):
+        """Create a task and return it."""
+        task = {
+            "id": self._new_ids(1),
+            "title": title,
+            "description": description,
+            "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "due_date": due_date,
+            "priority": priority,
+            "completed": False
+        }
+        self._tasks.insert(task)
+        self._index(task)
+        self.store.put(task)
+        self._notify("added", task)
+        return task
+
+    def add_many(self, records):
+        """Create a task for every record and write them all as one batch.
+
+        Records are dicts with task fields; missing fields get the same
+        defaults as add and any ``id`` is ignored in favour of a new one.
+        Returns the new tasks.
+        """
+        created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        records = list(records)
+        next_id = self._new_ids(len(records))
+        tasks = []
+        for record in records:
+            task = {
+                "id": next_id,
+                "title": record["title"],
+                "description": record.get("description") or "",
+                "created_at": record.get("created_at") or created_at,
+                "due_date": record.get("due_date") or None,
+                "priority": record.get("priority") or "medium",
+                "completed": bool(record.get("completed"))
+            }
+            next_id += 1
+            self._tasks.insert(task)
+            self._index(task, keep_sorted=False)
+            tasks.append(task)
+
+        self.store.write_batch([("put", task) for task in tasks])
+        for task in tasks:
+            self._notify("added", task)
+        return tasks
+
+    def apply_changes(self, ops):
+        """Take in tasks another process changed, without writing them back to the store.
+
+        ``ops`` are ``("put", task)``, ``("delete", task_id)`` and
+        ``("snapshot", {id: task})`` operations from the store's poll_changes.
+        A snapshot is the whole board, and only the tasks that differ from it
+        are touched.
+        """
+        for op, value in ops:
+            if op == "put":
+                self._apply_put(value)
+            elif op == "delete":
+                self._apply_delete(value)
+            else:
+                for task_id in self._tasks.sorted_ids():
+                    if task_id not in value:
+                        self._apply_delete(task_id)
+                for task in value.values():
+                    if self._tasks.get(task["id"]) != task:
+                        self._apply_put(task)
+
+    def get(self, task_id):
+        """Return the task with the given ID, or None."""
+        return self._tasks.get(task_id)
+
+    def update(self, task_id, **fields):
+        """Change fields of a task and return it, or None if it does not exist."""
+        task = self._tasks.get(task_id)
+        if task is None:
+            return None
+        self._unindex(task)
+        task = self._tasks.update(task_id, fields)
+        self._index(task)
+        self.store.put(task)
+        self._notify("changed", task)
+        return task
+
+    def delete(self, task_id):
+        """Remove a task and return it, or None if it does not exist."""
+        task = self._tasks.remove(task_id)
+        if task is not None:
+            self._unindex(task)
+            self.store.delete(task_id)
+            self._notify("removed", task)
+        return task
+
+    def query(self, show_completed=True, priority="all", due_before=None):
+        """Return the sorted IDs of the tasks that pass the given filters.
+
+        Each filter is answered from its index and the smallest candidate set
+        is checked against the others, so the cost follows the size of the
+        result rather than the number of tasks.
+        """
+        candidates = []
+        if priority != "all":
+            candidates.append(self._by_priority.get(priority, set()))
+        if not show_completed:
+            candidates.append(self._by_completed[False])
+        if due_before:
+            due_dates = self._due_dates()
+            end = bisect.bisect_left(due_dates, (due_before,))
+            candidates.append({task_id for _, task_id in due_dates[:end]})
+        if not candidates:
+            return self._tasks.sorted_ids()
+
+        candidates.sort(key=len)
+        smallest, others = candidates[0], candidates[1:]
+        return sorted(
+            task_id for task_id in smallest
+            if all(task_id in other for other in others)
+        )
+
+    def all(self):
+        """Return all tasks."""
+        return self._tasks.values()
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def __contains__(self, task_id):
+        return task_id in self._tasks
+
+    def _load_batch(self, tasks):
+        for task in tasks:
+            self._tasks.insert(task)
+            self._index(task, keep_sorted=False)
+
+    def _apply_put(self, task):
+        # The store keeps the record it read, so the table gets its own copy
+        task = dict(task)
+        old = self._tasks.get(task["id"])
+        if old is None:
+            self._tasks.insert(task)
+            self._index(task)
+            self._notify("added", task)
+        else:
+            self._unindex(old)
+            task = self._tasks.update(task["id"], {k: v for k, v in task.items() if k != "id"})
+            self._index(task)
+            self._notify("changed", task)
+
+    def _apply_delete(self, task_id):
+        task = self._tasks.remove(task_id)
+        if task is not None:
+            self._unindex(task)
+            self._notify("removed", task)
+
+    def _new_ids(self, count):
+        """Return the first of ``count`` consecutive unused IDs.
+
+        The blocks start at one ID and double up to ID_BLOCK, so a one-off
+        add from the command line does not leave a gap behind.
+        """
+        if self._id_limit - self._next_id < count:
+            block = max(count, self._id_block)
+            self._next_id = self.store.reserve_ids(block)
+            self._id_limit = self._next_id + block
+            self._id_block = min(self._id_block * 2, ID_BLOCK)
+        start = self._next_id
+        self._next_id += count
+        return start
+
+    def _index(self, task, keep_sorted=True):
+        self._by_priority.setdefault(task["priority"], set()).add(task["id"])
+        self._by_completed[bool(task["completed"])].add(task["id"])
+        if task["due_date"]:
+            if keep_sorted:
+                bisect.insort(self._due_dates(), (task["due_date"], task["id"]))
+            else:
+                # Sorted once, the next time the list is needed
+                self._by_due_date.append((task["due_date"], task["id"]))
+                self._due_dates_sorted = False
+
+    def _unindex(self, task):
+        self._by_priority[task["priority"]].discard(task["id"])
+        self._by_completed[bool(task["completed"])].discard(task["id"])
+        if task["due_date"]:
+            entry = (task["due_date"], task["id"])
+            due_dates = self._due_dates()
+            index = bisect.bisect_left(due_dates, entry)
+            if index < len(due_dates) and due_dates[index] == entry:
+                del due_dates[index]
+
+    def _due_dates(self):
+        if not self._due_dates_sorted:
+            self._by_due_date.sort()
+            self._due_dates_sorted = True
+        return self._by_due_date
+
+    def _notify(self, event, task):
+        for listener in self._listeners:
+            listener(event, task)
@@ -0,0 +1,621 @@
+import contextlib
+import io
+import json
+import os
+import re
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # No flock on Windows, so boards there are only safe for one process
+    fcntl = None
+
+# Version 2 snapshots carry next_id so deleted IDs are never handed out again
+SNAPSHOT_VERSION = 2
+
+# Default file of each storage engine
+STORAGE_PATHS = {"json": "tasks.json", "sqlite": "tasks.db"}
+
+# The ID of a task written by json.dumps, no string value can contain this unescaped
+TASK_ID_RE = re.compile(r'"id": (-?\d+)')
+
+# How the header line of a one-task-per-line snapshot ends
+TASKS_LINE_END = b', "tasks": [\n'
+
+# Snapshot lines are decoded this many at a time
+DECODE_BATCH = 500
+
+# Older snapshot layouts are decoded this many characters at a time
+READ_CHUNK = 1 << 16
+TASKS_KEY_RE = re.compile(r'"tasks"\s*:\s*\[')
+ARRAY_GAP_RE = re.compile(r"[\s,]*")
+
+
+class TaskStore:
+    """Interface between TaskRepository and whatever keeps tasks on disk."""
+
+    # The first ID that has never been handed out
+    next_id = 1
+
+    # How far iter_load has got, from 0.0 to 1.0
+    load_progress = 0.0
+
+    # Set by iter_load when the stored tasks ended part way through a task
+    truncated = False
+
+    def load(self):
+        """Return all stored tasks as a list of dicts."""
+        raise NotImplementedError
+
+    def iter_load(self):
+        """Yield the stored tasks one at a time, updating ``load_progress`` as it goes."""
+        tasks = self.load()
+        for count, task in enumerate(tasks, 1):
+            self.load_progress = count / len(tasks)
+            yield task
+        self.load_progress = 1.0
+
+    def put(self, task):
+        """Record that a task was added or changed."""
+        raise NotImplementedError
+
+    def delete(self, task_id):
+        """Record that a task was removed."""
+        raise NotImplementedError
+
+    def write_batch(self, ops):
+        """Apply many ``("put", task)`` / ``("delete", task_id)`` operations at once."""
+        for op, value in ops:
+            if op == "put":
+                self.put(value)
+            else:
+                self.delete(value)
+
+    def reserve_ids(self, count):
+        """Set aside ``count`` new task IDs and return the first one."""
+        start = self.next_id
+        self.next_id += count
+        return start
+
+    def watch_paths(self):
+        """Return the files that change when another process writes to the store."""
+        return []
+
+    def poll_changes(self):
+        """Return the operations other processes made since the last call, in write_batch form."""
+        return []
+
+    def close(self):
+        """Release any open files or connections."""
+
+
+class JournaledTaskStore(TaskStore):
+    """Persist tasks as a JSON snapshot plus an append-only journal of mutations.
+
+    Every mutation appends one compact record to ``<file>.journal`` instead of
+    rewriting the whole task list. Once the journal grows past ``compact_every``
+    records it is folded into a fresh snapshot, which is written to a temporary
+    file and atomically renamed over ``tasks.json`` so a crash never leaves a
+    truncated snapshot behind.
+
+    The store keeps no copy of the tasks in memory, only the changes made
+    since the last snapshot. Compaction streams the old snapshot line by line
+    and swaps those changes in, and it waits until the journal holds a quarter
+    as many records as the snapshot has tasks, so big boards are not rewritten
+    every ``compact_every`` changes.
+
+    Several processes can share one board. Every write holds an flock on
+    ``<file>.lock`` and first reads whatever the others appended, so
+    sequence numbers and IDs stay unique, and new IDs are reserved in the
+    journal before they are used. Compaction puts a fresh journal in place
+    instead of truncating the old one, so a process still holding the old
+    journal open reads it to the end before moving on. Records written by
+    other processes are handed out by poll_changes.
+    """
+
+    def __init__(self, file_path, compact_every=1000, fsync=True):
+        self.file_path = file_path
+        self.journal_path = file_path + ".journal"
+        self.lock_path = file_path + ".lock"
+        self.compact_every = compact_every
+        self.fsync = fsync
+        # Task ID -> task, or None once deleted, for every change since the last snapshot
+        self._changes = {}
+        self._snapshot_size = 0
+        self._seq = 0
+        self.next_id = 1
+        self._journal_fd = None
+        # Bytes of the open journal that have been read or written by this process
+        self._journal_offset = 0
+        self._journal_records = 0
+        # Operations of other processes that poll_changes has not handed out yet
+        self._remote = []
+        self._lock = threading.RLock()
+        self._lock_fd = None
+        self._lock_depth = 0
+
+    def load(self):
+        """Return the tasks from the snapshot with the journal replayed on top."""
+        return list(self.iter_load())
+
+    def iter_load(self):
+        """Yield the tasks from the snapshot with the journal replayed on top, one at a time.
+
+        The journal is read first, then the snapshot is parsed a task at a
+        time with journal changes swapped in, so a big board never sits in
+        memory as raw text and a parsed list at once. A snapshot that ends in
+        the middle of a task still yields every task before the cut.
+        """
+        with self._locked():
+            self._close_journal()
+            self.load_progress = 0.0
+            self.truncated = False
+            self._remote = []
+            header, entries = self._read_snapshot(loading=True)
+            self._seq = header.get("seq", 0)
+            migrate = header.get("version", 1) < SNAPSHOT_VERSION
+            if migrate:
+                tasks = [task if task is not None else json.loads(text) for _, text, task in entries]
+                self.next_id = self._migrate_ids(tasks)
+            else:
+                self.next_id = header["next_id"]
+
+            # Everything writes need is settled before the first task is handed out
+            self._changes = {}
+            self._journal_records = 0
+            self._open_journal()
+            for record in self._read_journal():
+                self._replay(record)
+            changes = dict(self._changes)
+
+            if migrate:
+                tasks = [changes.pop(task["id"], task) for task in tasks]
+                tasks = [task for task in tasks if task is not None]
+                tasks.extend(task for _, task in sorted(changes.items()) if task is not None)
+                # IDs were rewritten, so the old snapshot cannot be streamed
+                self._write_snapshot(map(json.dumps, tasks))
+                self.load_progress = 1.0
+
+        if migrate:
+            yield from tasks
+            return
+
+        # The snapshot file is already open, so a compaction by another process cannot swap it from under us
+        count = 0
+        texts = []
+        for task_id, text, task in entries:
+            count += 1
+            if task_id in changes:
+                task = changes.pop(task_id)
+            elif task is None:
+                texts.append(text)
+                if len(texts) == DECODE_BATCH:
+                    yield from self._decode(texts)
+                    texts = []
+                continue
+            yield from self._decode(texts)
+            texts = []
+            if task is not None:
+                yield task
+        yield from self._decode(texts)
+        for task_id in sorted(changes):
+            if changes[task_id] is not None:
+                yield changes[task_id]
+        self._snapshot_size = count
+        self.load_progress = 1.0
+
+    def put(self, task):
+        """Record that a task was added or changed."""
+        self.write_batch([("put", task)])
+
+    def delete(self, task_id):
+        """Record that a task was removed."""
+        self.write_batch([("delete", task_id)])
+
+    def write_batch(self, ops):
+        """Append one journal record per operation with a single flush.
+
+        A batch too big for the journal goes straight into a new snapshot.
+        """
+        with self._locked():
+            self._sync()
+            records = []
+            for op, value in ops:
+                if op == "put":
+                    self._changes[value["id"]] = value
+                    self.next_id = max(self.next_id, value["id"] + 1)
+                    records.append({"op": "put", "task": value})
+                else:
+                    self._changes[value] = None
+                    records.append({"op": "delete", "id": value})
+            if self._remote:
+                # These records land after the ones just read from other processes, so they win
+                self._remote = overlay_local_ops(self._remote, ops)
+            if len(records) >= self._compact_threshold():
+                # The snapshot covers these records, so later replays skip any older journal
+                # entries, and other processes see its seq jump and reload the board
+                self._seq += len(records)
+                self.compact()
+            else:
+                self._append(records)
+                if self._journal_records >= self._compact_threshold():
+                    self.compact()
+
+    def reserve_ids(self, count):
+        """Set aside ``count`` new task IDs in the journal and return the first one.
+
+        This never compacts, the next write folds the journal in when it is due.
+        """
+        with self._locked():
+            self._sync()
+            start = self.next_id
+            self.next_id += count
+            self._append([{"op": "reserve", "next_id": self.next_id}])
+            return start
+
+    def watch_paths(self):
+        """Return the journal, which every write and compaction changes."""
+        return [self.journal_path]
+
+    def poll_changes(self):
+        """Return the operations other processes made since the last call.
+
+        Besides puts and deletes this can hold ``("snapshot", {id: task})``,
+        the whole board, when this process fell too far behind to know what
+        changed.
+        """
+        with self._locked():
+            if self._journal_fd is not None:
+                self._sync()
+            ops, self._remote = self._remote, []
+        return ops
+
+    def compact(self):
+        """Fold the journal into a new snapshot."""
+        with self._locked():
+            self._sync()
+            changes = self._changes
+            written = set()
+
+            def lines():
+                for task_id, text, task in self._read_snapshot()[1]:
+                    if task_id in changes:
+                        written.add(task_id)
+                        if changes[task_id] is not None:
+                            yield json.dumps(changes[task_id])
+                    else:
+                        yield text if text is not None else json.dumps(task)
+                for task_id in sorted(changes.keys() - written):
+                    if changes[task_id] is not None:
+                        yield json.dumps(changes[task_id])
+
+            self._write_snapshot(lines())
+
+    def close(self):
+        """Close the journal and lock files."""
+        with self._lock:
+            self._close_journal()
+            if self._lock_fd is not None and not self._lock_depth:
+                os.close(self._lock_fd)
+                self._lock_fd = None
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Hold the board: a thread lock within this process and an flock between processes."""
+        with self._lock:
+            if not self._lock_depth and fcntl is not None:
+                if self._lock_fd is None:
+                    self._lock_fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if not self._lock_depth and fcntl is not None:
+                    fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _open_journal(self):
+        self._journal_fd = os.open(self.journal_path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+        self._journal_offset = 0
+
+    def _close_journal(self):
+        if self._journal_fd is not None:
+            os.close(self._journal_fd)
+            self._journal_fd = None
+
+    def _read_journal(self):
+        """Return the records added to the open journal since it was last read.
+
+        Only called with the lock held, when no process can be part way
+        through a write, so a line that does not parse is a torn write from a
+        crash. Nothing after it was acknowledged, so it is cut off.
+        """
+        size = os.fstat(self._journal_fd).st_size
+        if size <= self._journal_offset:
+            return []
+        # Writes go to the end whatever the position, since the journal is opened with O_APPEND
+        os.lseek(self._journal_fd, self._journal_offset, os.SEEK_SET)
+        chunks = []
+        remaining = size - self._journal_offset
+        while remaining > 0:
+            chunk = os.read(self._journal_fd, remaining)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            remaining -= len(chunk)
+        data = b"".join(chunks)
+        records = []
+        good = 0
+        for line in data.splitlines(keepends=True):
+            try:
+                if not line.endswith(b"\n"):
+                    raise ValueError("Unterminated journal record")
+                records.append(json.loads(line))
+            except ValueError:
+                break
+            good += len(line)
+        if good != len(data):
+            os.ftruncate(self._journal_fd, self._journal_offset + good)
+        self._journal_offset += good
+        return records
+
+    def _sync(self):
+        """Catch up with the records and compactions of other processes; the lock must be held."""
+        if self._journal_fd is None:
+            self._open_journal()
+        while True:
+            for record in self._read_journal():
+                self._replay(record, remote=True)
+            try:
+                current = os.stat(self.journal_path).st_ino
+            except FileNotFoundError:
+                current = None
+            if current == os.fstat(self._journal_fd).st_ino:
+                return
+            # Another process compacted, and its snapshot holds everything read so far
+            self._close_journal()
+            self._open_journal()
+            self._changes = {}
+            self._journal_records = 0
+            header, entries = self._read_snapshot()
+            if header.get("seq", 0) > self._seq:
+                # It compacted more than once, so a whole journal went by unseen. Hand
+                # out the full board and let the reader work out what changed.
+                tasks = {}
+                for task_id, text, task in entries:
+                    tasks[task_id] = task if task is not None else json.loads(text)
+                self._seq = header["seq"]
+                self.next_id = max(self.next_id, header["next_id"])
+                self._remote.append(("snapshot", tasks))
+            else:
+                entries.close()
+
+    def _replay(self, record, remote=False):
+        self._journal_records += 1
+        if record["seq"] <= self._seq:
+            # Already folded into the snapshot by an interrupted compaction
+            return
+        self._seq = record["seq"]
+        if record["op"] == "put":
+            task = record["task"]
+            self._changes[task["id"]] = task
+            self.next_id = max(self.next_id, task["id"] + 1)
+            if remote:
+                self._remote.append(("put", task))
+        elif record["op"] == "delete":
+            self._changes[record["id"]] = None
+            if remote:
+                self._remote.append(("delete", record["id"]))
+        elif record["op"] == "reserve":
+            self.next_id = max(self.next_id, record["next_id"])
+
+    def _read_snapshot(self, loading=False):
+        """Return the snapshot header and a generator of ``(task ID, JSON text, task)``.
+
+        Snapshots written one task per line are read line by line and hand
+        out the text, which compaction copies as is. Older layouts are decoded
+        a task at a time and hand out the task instead. Either way a task cut
+        off by the end of the file is dropped.
+
+        Only ``loading`` reads, those of iter_load, update ``load_progress``
+        and ``truncated``; compaction and catching up read the snapshot on
+        the writer thread while the app may still be streaming a load.
+        """
+        if not os.path.exists(self.file_path):
+            return {"version": SNAPSHOT_VERSION, "seq": 0, "next_id": 1}, iter(())
+        size = os.path.getsize(self.file_path) or 1
+        file = open(self.file_path, "rb")
+        first = file.readline(READ_CHUNK)
+        if first.startswith(b'{"version"') and first.endswith(TASKS_LINE_END):
+            header = json.loads(first[:-len(TASKS_LINE_END)] + b"}")
+            return header, self._task_lines(file, len(first), size, loading)
+
+        file.seek(0)
+        text_file = io.TextIOWrapper(file, encoding="utf-8")
+        buffer = text_file.read(READ_CHUNK)
+        if buffer.lstrip().startswith("["):
+            # Older versions of the app saved a bare list of tasks
+            return {}, self._decoded_tasks(text_file, buffer, buffer.index("[") + 1, size, loading)
+        match = TASKS_KEY_RE.search(buffer)
+        if match is None:
+            text_file.close()
+            raise json.JSONDecodeError("Expecting a task list", buffer, 0)
+        header = json.loads(buffer[:match.start()].rstrip().rstrip(",") + "}")
+        return header, self._decoded_tasks(text_file, buffer, match.end(), size, loading)
+
+    @staticmethod
+    def _decode(texts):
+        """Decode task lines in one call, so json shares the key strings between the tasks."""
+        return json.loads("[" + ",".join(texts) + "]") if texts else []
+
+    def _task_lines(self, file, offset, size, loading):
+        with file:
+            for raw in file:
+                offset += len(raw)
+                if loading:
+                    self.load_progress = offset / size
+                if raw.startswith(b"]}"):
+                    return
+                if raw.endswith(b",\n"):
+                    line = raw[:-2].decode()
+                    yield int(TASK_ID_RE.search(line).group(1)), line, None
+                elif raw.strip():
+                    # Only the last task has no comma, so check it was written out in full
+                    try:
+                        task = json.loads(raw)
+                    except ValueError:
+                        break
+                    yield task["id"], raw.rstrip(b"\n").decode(), task
+        if loading:
+            self.truncated = True
+
+    def _decoded_tasks(self, file, buffer, pos, size, loading):
+        decoder = json.JSONDecoder()
+        dropped = 0
+        with file:
+            while True:
+                pos = ARRAY_GAP_RE.match(buffer, pos).end()
+                if buffer[pos:pos + 1] == "]":
+                    return
+                try:
+                    task, pos = decoder.raw_decode(buffer, pos)
+                except ValueError:
+                    chunk = file.read(READ_CHUNK)
+                    if not chunk:
+                        break
+                    dropped += pos
+                    buffer = buffer[pos:] + chunk
+                    pos = 0
+                    continue
+                if loading:
+                    self.load_progress = min(1.0, (dropped + pos) / size)
+                yield task["id"], None, task
+        if loading:
+            self.truncated = True
+
+    def _write_snapshot(self, lines):
+        """Atomically replace the snapshot with the given task lines and empty the journal."""
+        header = {"version": SNAPSHOT_VERSION, "seq": self._seq, "next_id": self.next_id}
+        tmp_path = self.file_path + ".tmp"
+        count = 0
+        with open(tmp_path, "w") as file:
+            # One task per line: still readable, and without indent json uses its fast C encoder
+            file.write(json.dumps(header)[:-1] + ', "tasks": [\n')
+            for line in lines:
+                file.write(line if not count else ",\n" + line)
+                count += 1
+            file.write("\n]}\n")
+            file.flush()
+            if self.fsync:
+                os.fsync(file.fileno())
+        os.replace(tmp_path, self.file_path)
+        self._sync_directory()
+
+        # The snapshot is durable now, so the journal can start over. The empty
+        # journal is renamed into place, so other processes still reading the old
+        # one through an open file finish it first.
+        self._close_journal()
+        open(self.journal_path + ".tmp", "wb").close()
+        os.replace(self.journal_path + ".tmp", self.journal_path)
+        self._sync_directory()
+        self._open_journal()
+        self._journal_records = 0
+        self._changes = {}
+        self._snapshot_size = count
+
+    def _compact_threshold(self):
+        return max(self.compact_every, self._snapshot_size // 4)
+
+    def _append(self, records):
+        lines = []
+        for record in records:
+            self._seq += 1
+            record["seq"] = self._seq
+            lines.append(json.dumps(record, separators=(",", ":")) + "\n")
+        data = memoryview("".join(lines).encode())
+        written = 0
+        while written < len(data):
+            written += os.write(self._journal_fd, data[written:])
+        if self.fsync:
+            os.fsync(self._journal_fd)
+        self._journal_offset += len(data)
+        self._journal_records += len(records)
+
+    def _sync_directory(self):
+        if not self.fsync or os.name != "posix":
+            return
+        directory = os.path.dirname(os.path.abspath(self.file_path))
+        fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def _migrate_ids(tasks):
+        """Give every task of a version 1 snapshot a unique integer ID.
+
+        Version 1 renumbered tasks on every delete, so IDs are kept where they
+        are valid and unique and only missing or clashing ones get new IDs.
+        Returns the next free ID.
+        """
+        seen = set()
+        clashing = []
+        for task in tasks:
+            task_id = task.get("id")
+            if isinstance(task_id, int) and task_id > 0 and task_id not in seen:
+                seen.add(task_id)
+            else:
+                clashing.append(task)
+        next_id = max(seen, default=0) + 1
+        for task in clashing:
+            task["id"] = next_id
+            next_id += 1
+        return next_id
+
+
+def overlay_local_ops(remote_ops, local_ops):
+    """Return ``remote_ops`` with ``local_ops`` winning over them.
+
+    Local operations reach the journal after the remote ones, so remote puts
+    and deletes of the same tasks are dropped and board snapshots are given
+    the local version of those tasks.
+    """
+    local = {value["id"] if op == "put" else value: (op, value) for op, value in local_ops}
+    merged = []
+    for op, value in remote_ops:
+        if op == "snapshot":
+            value = dict(value)
+            for task_id, (local_op, local_value) in local.items():
+                if local_op == "put":
+                    value[task_id] = local_value
+                else:
+                    value.pop(task_id, None)
+        elif (value["id"] if op == "put" else value) in local:
+            continue
+        merged.append((op, value))
+    return merged
+
+
+def open_store(storage, path=None):
+    """Return the task store for a storage engine name ("json" or "sqlite").
+
+    Without a path the engine's default file in the current directory is
+    used. A new default SQLite database imports an existing tasks.json
+    board, including one that has only ever been written to its journal.
+    """
+    if storage == "json":
+        return JournaledTaskStore(path or STORAGE_PATHS["json"])
+    if storage == "sqlite":
+        from sqlite_store import SqliteTaskStore
+        if path is None:
+            path = STORAGE_PATHS["sqlite"]
+            json_path = STORAGE_PATHS["json"]
+            if not os.path.exists(path) and (os.path.exists(json_path) or os.path.exists(json_path + ".journal")):
+                store = SqliteTaskStore(path)
+                store.import_json(json_path)
+                return store
+        return SqliteTaskStore(path)
+    raise ValueError(f"Unknown storage engine: {storage}")
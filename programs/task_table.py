@@ -0,0 +1,277 @@
+import bisect
+import re
+from array import array
+from datetime import date, timedelta
+
+TIMESTAMP_RE = re.compile(r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$")
+DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}$")
+EPOCH = date(1970, 1, 1)
+
+# Marker values in the integer columns, far outside any real date
+NO_DATE = -(2 ** 31)
+RAW_VALUE = -(2 ** 31) + 1
+
+
+class DictTaskTable:
+    """Tasks kept as one dict per task, looked up through a dict of IDs."""
+
+    def __init__(self):
+        self._tasks = {}
+
+    def load(self, tasks):
+        """Replace the contents with the given tasks."""
+        self._tasks = {task["id"]: task for task in tasks}
+
+    def insert(self, task):
+        """Add a new task."""
+        self._tasks[task["id"]] = task
+
+    def get(self, task_id):
+        """Return the task with the given ID, or None."""
+        return self._tasks.get(task_id)
+
+    def update(self, task_id, fields):
+        """Change fields of a task and return it, or None if it does not exist."""
+        task = self._tasks.get(task_id)
+        if task is not None:
+            task.update(fields)
+        return task
+
+    def remove(self, task_id):
+        """Remove a task and return it, or None if it does not exist."""
+        return self._tasks.pop(task_id, None)
+
+    def values(self):
+        """Return all tasks in the order they were added."""
+        return self._tasks.values()
+
+    def sorted_ids(self):
+        """Return all task IDs in ascending order."""
+        return sorted(self._tasks)
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def __contains__(self, task_id):
+        return task_id in self._tasks
+
+
+class ColumnarTaskTable:
+    """Tasks kept column by column to cut the memory used per task.
+
+    IDs live in a sorted array that is searched with bisect, timestamps and
+    due dates are stored as integers, priorities as one-byte codes and the
+    completed flags as a bit array. Only titles and descriptions remain
+    Python strings. Deleted rows are marked dead and swept out once they
+    outnumber the live ones.
+
+    Tasks go in and come out as ordinary dicts, so callers cannot tell the
+    difference from DictTaskTable; the dicts handed out are copies.
+    """
+
+    def __init__(self):
+        self.load([])
+
+    def load(self, tasks):
+        """Replace the contents with the given tasks."""
+        self._ids = array("q")
+        self._titles = []
+        self._descriptions = []
+        self._created = array("q")
+        self._due = array("i")
+        self._priority = bytearray()
+        self._completed = bytearray()
+        self._alive = bytearray()
+        self._priority_names = ["low", "medium", "high"]
+        self._priority_codes = {name: code for code, name in enumerate(self._priority_names)}
+        # Values that do not fit their integer column, keyed by (column, task ID)
+        self._raw = {}
+        self._live = 0
+        for task in sorted(tasks, key=lambda task: task["id"]):
+            self.insert(task)
+
+    def insert(self, task):
+        """Add a new task."""
+        task_id = task["id"]
+        row = len(self._ids)
+        if row and self._ids[-1] >= task_id:
+            # Another window reserved IDs below ours, or a removed task came back
+            row = bisect.bisect_left(self._ids, task_id)
+            if row < len(self._ids) and self._ids[row] == task_id and self._is_alive(row):
+                raise KeyError(f"Task {task_id} already exists")
+        self._insert_row(row, task)
+        self._live += 1
+
+    def get(self, task_id):
+        """Return a copy of the task with the given ID, or None."""
+        row = self._row(task_id)
+        return None if row is None else self._task_at(row)
+
+    def update(self, task_id, fields):
+        """Change fields of a task and return a copy of it, or None if it does not exist."""
+        row = self._row(task_id)
+        if row is None:
+            return None
+        for field, value in fields.items():
+            if field == "title":
+                self._titles[row] = value
+            elif field == "description":
+                self._descriptions[row] = value
+            elif field == "created_at":
+                self._created[row] = self._encode(task_id, "created_at", value)
+            elif field == "due_date":
+                self._due[row] = self._encode(task_id, "due_date", value)
+            elif field == "priority":
+                self._priority[row] = self._priority_code(value)
+            elif field == "completed":
+                self._set_completed(row, value)
+            else:
+                raise KeyError(f"Unknown task field: {field}")
+        return self._task_at(row)
+
+    def remove(self, task_id):
+        """Remove a task and return it, or None if it does not exist."""
+        row = self._row(task_id)
+        if row is None:
+            return None
+        task = self._task_at(row)
+        self._alive[row >> 3] &= ~(1 << (row & 7))
+        self._titles[row] = self._descriptions[row] = ""
+        self._raw.pop(("created_at", task_id), None)
+        self._raw.pop(("due_date", task_id), None)
+        self._live -= 1
+        if len(self._ids) - self._live > max(1024, self._live):
+            self._sweep()
+        return task
+
+    def values(self):
+        """Yield copies of all tasks in ID order."""
+        for row in range(len(self._ids)):
+            if self._is_alive(row):
+                yield self._task_at(row)
+
+    def sorted_ids(self):
+        """Return all task IDs in ascending order."""
+        return [self._ids[row] for row in range(len(self._ids)) if self._is_alive(row)]
+
+    def __len__(self):
+        return self._live
+
+    def __contains__(self, task_id):
+        return self._row(task_id) is not None
+
+    def _row(self, task_id):
+        row = bisect.bisect_left(self._ids, task_id)
+        if row < len(self._ids) and self._ids[row] == task_id and self._is_alive(row):
+            return row
+        return None
+
+    def _is_alive(self, row):
+        return self._alive[row >> 3] >> (row & 7) & 1
+
+    def _set_completed(self, row, completed):
+        if completed:
+            self._completed[row >> 3] |= 1 << (row & 7)
+        else:
+            self._completed[row >> 3] &= ~(1 << (row & 7))
+
+    def _insert_row(self, row, task):
+        task_id = task["id"]
+        count = len(self._ids)
+        if row < count and self._ids[row] == task_id:
+            # The dead row the task left behind when it was removed is taken over
+            pass
+        elif row == count:
+            self._ids.append(task_id)
+            self._titles.append("")
+            self._descriptions.append("")
+            self._created.append(0)
+            self._due.append(0)
+            self._priority.append(0)
+            if row & 7 == 0:
+                self._completed.append(0)
+                self._alive.append(0)
+        else:
+            # Out of order: move the later rows up by one, a memmove per column
+            self._ids.insert(row, task_id)
+            self._titles.insert(row, "")
+            self._descriptions.insert(row, "")
+            self._created.insert(row, 0)
+            self._due.insert(row, 0)
+            self._priority.insert(row, 0)
+            self._insert_bit(self._completed, row, count + 1)
+            self._insert_bit(self._alive, row, count + 1)
+
+        self._titles[row] = task["title"]
+        self._descriptions[row] = task["description"]
+        self._created[row] = self._encode(task_id, "created_at", task["created_at"])
+        self._due[row] = self._encode(task_id, "due_date", task["due_date"])
+        self._priority[row] = self._priority_code(task["priority"])
+        self._alive[row >> 3] |= 1 << (row & 7)
+        self._set_completed(row, task["completed"])
+
+    @staticmethod
+    def _insert_bit(bits, row, rows):
+        """Open a zero bit at ``row`` in a bit array that is to hold ``rows`` bits."""
+        first = row >> 3
+        shift = row & 7
+        tail = int.from_bytes(bits[first:], "little")
+        low = tail & ((1 << shift) - 1)
+        tail = (tail - low) << 1 | low
+        bits[first:] = tail.to_bytes(((rows + 7) >> 3) - first, "little")
+
+    def _sweep(self):
+        self.load(list(self.values()))
+
+    def _priority_code(self, name):
+        code = self._priority_codes.get(name)
+        if code is None:
+            code = len(self._priority_names)
+            self._priority_names.append(name)
+            self._priority_codes[name] = code
+        return code
+
+    def _encode(self, task_id, field, value):
+        """Turn a timestamp or date string into an integer, falling back to keeping the string."""
+        self._raw.pop((field, task_id), None)
+        if value is None:
+            return NO_DATE
+        pattern = TIMESTAMP_RE if field == "created_at" else DATE_RE
+        if pattern.match(value):
+            try:
+                days = (date(int(value[0:4]), int(value[5:7]), int(value[8:10])) - EPOCH).days
+            except ValueError:
+                days = None
+            if days is not None and field == "due_date":
+                return days
+            if days is not None and value[11:13] < "24" and value[14:16] < "60" and value[17:19] < "60":
+                return days * 86400 + int(value[11:13]) * 3600 + int(value[14:16]) * 60 + int(value[17:19])
+        self._raw[(field, task_id)] = value
+        return RAW_VALUE
+
+    def _decode(self, task_id, field, value):
+        if value == NO_DATE:
+            return None
+        if value == RAW_VALUE:
+            return self._raw[(field, task_id)]
+        if field == "due_date":
+            return (EPOCH + timedelta(days=value)).isoformat()
+        days, seconds = divmod(value, 86400)
+        day = EPOCH + timedelta(days=days)
+        return f"{day.isoformat()} {seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+    def _task_at(self, row):
+        task_id = self._ids[row]
+        return {
+            "id": task_id,
+            "title": self._titles[row],
+            "description": self._descriptions[row],
+            "created_at": self._decode(task_id, "created_at", self._created[row]),
+            "due_date": self._decode(task_id, "due_date", self._due[row]),
+            "priority": self._priority_names[self._priority[row]],
+            "completed": bool(self._completed[row >> 3] >> (row & 7) & 1)
+        }
+
+
+# Task table implementations by name, for configuration
+TABLES = {"dict": DictTaskTable, "columnar": ColumnarTaskTable}
@@ -0,0 +1,217 @@
+import bisect
+from tkinter import ttk
+
+PRIORITY_COLORS = {
+    "high": "#ffcccc",
+    "medium": "#ffffcc",
+    "low": "#ccffcc"
+}
+
+# Text colour of overdue rows, on top of their priority background
+OVERDUE_COLOR = "#c62828"
+
+
+def task_row(task, overdue=False):
+    """Return the Treeview values and tags for a task."""
+    status = "Completed" if task["completed"] else "Overdue" if overdue else "Pending"
+    due_date = task["due_date"] if task["due_date"] else "Not set"
+    values = (task["id"], task["title"], task["priority"], due_date, status)
+    tags = (f"priority_{task['priority']}", "overdue") if overdue else (f"priority_{task['priority']}",)
+    return values, tags
+
+
+class TaskListView:
+    """Keep a ttk.Treeview in step with a task engine, one row at a time.
+
+    Each row's iid is its task ID, so an engine event only touches the row
+    it is about instead of rebuilding the whole list. Rows are kept in ID
+    order, which never changes for a task, so rows never have to be moved.
+
+    ``is_overdue(task)`` decides which rows are drawn as overdue.
+    """
+
+    def __init__(self, tree, engine, is_overdue=None):
+        self.tree = tree
+        self.engine = engine
+        self.is_overdue = is_overdue or (lambda task: False)
+        self.show_completed = True
+        self.priority = "all"
+        self.due_before = None
+        self.text = None
+        # Sorted IDs of the tasks that currently have a row
+        self._shown = []
+
+        for priority, color in PRIORITY_COLORS.items():
+            tree.tag_configure(f"priority_{priority}", background=color)
+        tree.tag_configure("overdue", foreground=OVERDUE_COLOR)
+        engine.add_listener(self.on_task_event)
+
+    def matches(self, task):
+        """Return True if the task passes the current filters."""
+        return self.engine.matches(task, self.show_completed, self.priority, self.due_before, self.text)
+
+    def set_filter(self, show_completed, priority, due_before=None, text=None):
+        """Apply new filters, only adding and removing the rows that differ."""
+        self.show_completed = show_completed
+        self.priority = priority
+        self.due_before = due_before
+        self.text = text
+        wanted = self.engine.query(show_completed, priority, due_before, text)
+        self._sync_rows(self._shown, wanted)
+        self._shown = wanted
+
+    def on_task_event(self, event, task):
+        """Reflect an added, changed or removed task in the list."""
+        task_id = task["id"]
+        iid = str(task_id)
+        index = bisect.bisect_left(self._shown, task_id)
+        has_row = index < len(self._shown) and self._shown[index] == task_id
+
+        if event == "removed" or not self.matches(task):
+            if has_row:
+                self.tree.delete(iid)
+                del self._shown[index]
+        elif has_row:
+            values, tags = task_row(task, self.is_overdue(task))
+            self.tree.item(iid, values=values, tags=tags)
+        else:
+            self._insert_row(task, index)
+            self._shown.insert(index, task_id)
+
+    def add_tasks(self, tasks):
+        """Show tasks that were loaded in bulk and that pass the filters."""
+        for task in tasks:
+            if self.matches(task):
+                # Loaded tasks arrive in ID order, so this is nearly always the end
+                index = bisect.bisect_left(self._shown, task["id"])
+                self._shown.insert(index, task["id"])
+                self._insert_row(task, index)
+
+    def refresh_task(self, task):
+        """Redraw a task's row, if it has one, after it became overdue."""
+        iid = str(task["id"])
+        if self.tree.exists(iid):
+            values, tags = task_row(task, self.is_overdue(task))
+            self.tree.item(iid, values=values, tags=tags)
+
+    def _sync_rows(self, current, wanted):
+        """Turn the rows for the sorted IDs ``current`` into rows for ``wanted``."""
+        wanted_set = set(wanted)
+        stale = [task_id for task_id in current if task_id not in wanted_set]
+        if stale:
+            self.tree.delete(*[str(task_id) for task_id in stale])
+
+        # What is left is already in order, so each missing row goes in at its final index
+        kept = wanted_set.intersection(current)
+        for index, task_id in enumerate(wanted):
+            if task_id not in kept:
+                self._insert_row(self.engine.get(task_id), index)
+
+    def _insert_row(self, task, index):
+        values, tags = task_row(task, self.is_overdue(task))
+        self.tree.insert("", index, iid=str(task["id"]), values=values, tags=tags)
+
+
+class VirtualTaskListView(TaskListView):
+    """A task list that only creates Treeview rows for the visible viewport.
+
+    The filtered task IDs live in a plain sorted list and the scrollbar is
+    driven from that list, so the Treeview never holds more than a screenful
+    of rows (plus ``overscan``) no matter how many tasks there are.
+    """
+
+    def __init__(self, tree, scrollbar, engine, overscan=10, is_overdue=None):
+        super().__init__(tree, engine, is_overdue)
+        self.scrollbar = scrollbar
+        self.overscan = overscan
+        self.top = 0
+        self._rows = []
+        self._selected = None
+        self.rowheight = int(ttk.Style().lookup("Treeview", "rowheight") or 20)
+
+        # The Treeview only knows about the materialized rows, so it must not drive the scrollbar
+        tree.configure(yscrollcommand="")
+        scrollbar.configure(command=self.yview)
+        tree.bind("<Configure>", lambda e: self._render())
+        tree.bind("<<TreeviewSelect>>", self._remember_selection)
+        tree.bind("<MouseWheel>", self._on_mousewheel)
+        tree.bind("<Button-4>", lambda e: self.yview("scroll", -3, "units") or "break")
+        tree.bind("<Button-5>", lambda e: self.yview("scroll", 3, "units") or "break")
+
+    def set_filter(self, show_completed, priority, due_before=None, text=None):
+        """Apply new filters and redraw the viewport."""
+        self.show_completed = show_completed
+        self.priority = priority
+        self.due_before = due_before
+        self.text = text
+        self._shown = self.engine.query(show_completed, priority, due_before, text)
+        self._render()
+
+    def on_task_event(self, event, task):
+        """Reflect an added, changed or removed task in the list."""
+        task_id = task["id"]
+        index = bisect.bisect_left(self._shown, task_id)
+        listed = index < len(self._shown) and self._shown[index] == task_id
+
+        if event == "removed" or not self.matches(task):
+            if listed:
+                del self._shown[index]
+        elif not listed:
+            self._shown.insert(index, task_id)
+        elif self.top <= index < self.top + len(self._rows):
+            values, tags = task_row(task, self.is_overdue(task))
+            self.tree.item(str(task_id), values=values, tags=tags)
+            return
+        else:
+            return
+        self._render()
+
+    def add_tasks(self, tasks):
+        """List tasks that were loaded in bulk, redrawing the viewport once."""
+        for task in tasks:
+            if self.matches(task):
+                bisect.insort(self._shown, task["id"])
+        self._render()
+
+    def page_size(self):
+        """Return how many rows fit in the Treeview."""
+        # Leave room for the heading row
+        return max(1, self.tree.winfo_height() // self.rowheight - 1)
+
+    def yview(self, *args):
+        """Scroll like Treeview.yview, but over the full filtered list."""
+        page = self.page_size()
+        if args[0] == "moveto":
+            top = int(float(args[1]) * len(self._shown))
+        elif args[2] == "pages":
+            top = self.top + int(args[1]) * page
+        else:
+            top = self.top + int(args[1])
+        self.top = max(0, min(top, len(self._shown) - page))
+        self._render()
+
+    def _render(self):
+        page = self.page_size()
+        self.top = max(0, min(self.top, len(self._shown) - page))
+        wanted = self._shown[self.top:self.top + page + self.overscan]
+        self._sync_rows(self._rows, wanted)
+        self._rows = wanted
+
+        if self._selected is not None and self.tree.exists(str(self._selected)):
+            self.tree.selection_set(str(self._selected))
+
+        if self._shown:
+            first = self.top / len(self._shown)
+            last = min(self.top + page, len(self._shown)) / len(self._shown)
+            self.scrollbar.set(first, last)
+        else:
+            self.scrollbar.set(0, 1)
+
+    def _remember_selection(self, event):
+        selection = self.tree.selection()
+        if selection:
+            self._selected = int(selection[0])
+
+    def _on_mousewheel(self, event):
+        self.yview("scroll", -1 if event.delta > 0 else 1, "units")
+        return "break"
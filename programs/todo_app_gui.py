@@ -2,7 +2,29 @@ import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog
 import json
 import os
-from datetime import datetime
+from datetime import timedelta
+from due_scheduler import DueScheduler
+from file_watcher import watch_files
+from task_store import open_store
+from task_engine import TaskEngine
+from task_table import TABLES
+from task_view import TaskListView, VirtualTaskListView
+from write_behind import WriteBehindStore
+
+# Storage engine: "json" keeps tasks.json plus a journal, "sqlite" keeps tasks.db
+STORAGE = os.environ.get("TODO_STORAGE", "json")
+
+# In-memory layout: "dict" keeps a dict per task, "columnar" packs tasks into arrays to save memory
+TABLE = os.environ.get("TODO_TABLE", "dict")
+
+# Wait this long after the last keystroke before searching
+SEARCH_DELAY_MS = 250
+
+# Boards bigger than this only create Treeview rows for the visible tasks
+VIRTUAL_LIST_THRESHOLD = 5000
+
+# Tasks are loaded and shown this many at a time, with the UI kept responsive in between
+LOAD_BATCH_SIZE = 2000
 
 class TodoApp:
     def __init__(self, root):
@@ -21,9 +43,20 @@ class TodoApp:
         self.root.configure(bg=self.bg_color)
         
         # Initialize tasks
-        self.tasks = []
-        self.file_path = "tasks.json"
+        # A failing save is retried every second, but the dialog only shows once until a save works
+        self.save_error_shown = False
+        # Disk writes happen on a background thread so they never block the UI
+        self.store = WriteBehindStore(
+            open_store(STORAGE),
+            self.root,
+            on_flush=self.on_tasks_saved,
+            on_error=self.on_save_error,
+            on_changes=self.on_changes_read
+        )
+        self.engine = TaskEngine(self.store, TABLES[TABLE]())
+        self.scheduler = DueScheduler(self.engine, self.root, on_due=self.on_tasks_due)
         self.load_tasks()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         
         # Create main frame
         self.main_frame = tk.Frame(self.root, bg=self.bg_color)
@@ -172,6 +205,38 @@ class TodoApp:
         self.filter_priority_menu.pack(side=tk.LEFT, padx=5)
         self.filter_priority_menu.bind("<<ComboboxSelected>>", lambda e: self.refresh_task_list())
         
+        # Filter by due date
+        self.filter_due_label = tk.Label(
+            self.filter_frame, 
+            text="Due Before:", 
+            font=("Arial", 12), 
+            bg=self.bg_color, 
+            fg=self.text_color
+        )
+        self.filter_due_label.pack(side=tk.LEFT, padx=(20, 5))
+        
+        self.filter_due_entry = tk.Entry(self.filter_frame, font=("Arial", 12), width=12)
+        self.filter_due_entry.pack(side=tk.LEFT, padx=5)
+        self.filter_due_entry.bind("<Return>", lambda e: self.refresh_task_list())
+        
+        # Search frame
+        self.search_frame = tk.Frame(self.main_frame, bg=self.bg_color)
+        self.search_frame.pack(fill=tk.X, pady=(0, 10))
+        
+        self.search_label = tk.Label(
+            self.search_frame, 
+            text="Search:", 
+            font=("Arial", 12), 
+            bg=self.bg_color, 
+            fg=self.text_color
+        )
+        self.search_label.pack(side=tk.LEFT, padx=5)
+        
+        self.search_entry = tk.Entry(self.search_frame, font=("Arial", 12), width=40)
+        self.search_entry.pack(side=tk.LEFT, padx=5)
+        self.search_entry.bind("<KeyRelease>", self.schedule_search)
+        self.search_job = None
+        
         # Create task list frame
         self.list_frame = tk.Frame(self.main_frame, bg=self.bg_color)
         self.list_frame.pack(fill=tk.BOTH, expand=True)
@@ -207,6 +272,13 @@ class TodoApp:
         self.task_list.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         
+        if self.expected_tasks > VIRTUAL_LIST_THRESHOLD:
+            self.task_view = VirtualTaskListView(
+                self.task_list, self.scrollbar, self.engine, is_overdue=self.scheduler.is_overdue
+            )
+        else:
+            self.task_view = TaskListView(self.task_list, self.engine, is_overdue=self.scheduler.is_overdue)
+        
         # Bind double-click event to view task details
         self.task_list.bind("<Double-1>", self.view_task_details)
         
@@ -263,55 +335,148 @@ class TodoApp:
         )
         self.delete_button.pack(side=tk.LEFT, padx=5)
         
+        # Status text
+        self.status_var = tk.StringVar(value="")
+        self.status_label = tk.Label(
+            self.buttons_frame, 
+            textvariable=self.status_var, 
+            font=("Arial", 10), 
+            bg=self.bg_color, 
+            fg=self.text_color
+        )
+        self.status_label.pack(side=tk.RIGHT, padx=5)
+        
         # Populate task list
         self.refresh_task_list()
     
     def load_tasks(self):
-        """Load tasks from the JSON file if it exists."""
-        if os.path.exists(self.file_path):
-            try:
-                with open(self.file_path, "r") as file:
-                    self.tasks = json.load(file)
-            except json.JSONDecodeError:
-                messagebox.showerror("Error", "Error loading tasks. Starting with an empty task list.")
-                self.tasks = []
-        else:
-            self.tasks = []
+        """Start loading tasks, the first batch now and the rest from the event loop."""
+        self.loader = self.engine.load_iter(LOAD_BATCH_SIZE)
+        try:
+            self.scheduler.add_tasks(next(self.loader, None) or [])
+        except json.JSONDecodeError:
+            self.loader = None
+            messagebox.showerror("Error", "Error loading tasks. Starting with an empty task list.")
+        
+        # Guess the board size from how far the first batch got, to pick the list view
+        progress = self.store.load_progress
+        self.expected_tasks = len(self.engine) / progress if progress else len(self.engine)
+        if self.loader is not None:
+            self.root.after(1, self.load_next_batch)
+        self.scheduler.start()
+        
+        # Other windows on the same board show up through the store's change feed
+        paths = self.store.watch_paths()
+        self.watcher = watch_files(paths, self.root, self.on_board_changed) if paths else None
     
-    def save_tasks(self):
-        """Save tasks to the JSON file."""
-        with open(self.file_path, "w") as file:
-            json.dump(self.tasks, file, indent=4)
+    def load_next_batch(self):
+        """Load and show the next batch of tasks, then give the event loop a turn."""
+        try:
+            batch = next(self.loader, None)
+        except ValueError as error:
+            self.loader = None
+            self.status_var.set(f"Loaded {len(self.engine)} tasks")
+            messagebox.showerror("Error", f"Error loading tasks after {len(self.engine)} of them: {error}")
+            return
+        
+        if batch is None:
+            self.loader = None
+            if self.store.truncated:
+                self.status_var.set(f"Loaded {len(self.engine)} tasks, the task file was cut short")
+                messagebox.showwarning(
+                    "Warning",
+                    f"The task file ends part way through a task. The {len(self.engine)} complete tasks were loaded."
+                )
+            else:
+                self.status_var.set(f"Loaded {len(self.engine)} tasks{self.due_summary()}")
+            self.on_board_changed()
+            return
+        
+        self.scheduler.add_tasks(batch)
+        self.task_view.add_tasks(batch)
+        self.status_var.set(f"Loading tasks... {self.store.load_progress:.0%}")
+        self.root.after(1, self.load_next_batch)
+    
+    def on_board_changed(self):
+        """Have the store read the tasks another window changed."""
+        if self.loader is not None:
+            # Changes made while loading are picked up once it finishes
+            return
+        self.store.request_changes()
+    
+    def on_changes_read(self, ops):
+        """Apply the tasks another window changed, touching only their rows."""
+        self.engine.apply_changes(ops)
+        self.status_var.set(f"{len(ops)} changes from another window")
+    
+    def due_summary(self):
+        """Describe how many pending tasks are overdue or due today."""
+        today = self.scheduler.today
+        overdue = len(self.engine.query(False, "all", today.isoformat()))
+        due_today = len(self.engine.query(False, "all", (today + timedelta(days=1)).isoformat())) - overdue
+        parts = [f"{overdue} overdue"] if overdue else []
+        if due_today:
+            parts.append(f"{due_today} due today")
+        return f", {', '.join(parts)}" if parts else ""
+    
+    def on_tasks_due(self, reminders, overdue):
+        """Mark newly overdue tasks and tell the user about them."""
+        for task in overdue:
+            self.task_view.refresh_task(task)
+        
+        messages = []
+        if len(reminders) == 1:
+            messages.append(f"Task '{reminders[0]['title']}' is due today")
+        elif reminders:
+            messages.append(f"{len(reminders)} tasks are due today")
+        if len(overdue) == 1:
+            messages.append(f"Task '{overdue[0]['title']}' is overdue")
+        elif overdue:
+            messages.append(f"{len(overdue)} tasks are overdue")
+        self.status_var.set("; ".join(messages))
+        self.root.bell()
+    
+    def on_tasks_saved(self, count):
+        """Show that queued changes reached the disk."""
+        self.save_error_shown = False
+        if not self.store.pending():
+            self.status_var.set("All changes saved")
+    
+    def on_save_error(self, error):
+        """Report a failed background save."""
+        self.status_var.set(f"Saving failed, retrying... ({error})")
+        if not self.save_error_shown:
+            self.save_error_shown = True
+            messagebox.showerror("Error", f"Could not save tasks: {error}")
+    
+    def on_close(self):
+        """Write any queued changes, then close the window."""
+        if self.loader is not None:
+            self.loader.close()
+        self.scheduler.stop()
+        if self.watcher is not None:
+            self.watcher.close()
+        try:
+            self.store.close()
+        except Exception as error:
+            messagebox.showerror("Error", f"Could not save tasks: {error}")
+        self.root.destroy()
     
     def add_task(self):
         """Add a new task to the list."""
-        title = self.title_entry.get().strip()
-        description = self.desc_entry.get().strip()
-        due_date = self.due_entry.get().strip()
-        priority = self.priority_var.get()
-        
-        if not title:
-            messagebox.showerror("Error", "Task title cannot be empty!")
+        try:
+            task = self.engine.add(
+                self.title_entry.get(),
+                self.desc_entry.get(),
+                self.due_entry.get(),
+                self.priority_var.get()
+            )
+        except ValueError as error:
+            messagebox.showerror("Error", str(error))
             return
         
-        if not due_date:
-            due_date = None
-        
-        task = {
-            "id": len(self.tasks) + 1,
-            "title": title,
-            "description": description,
-            "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "due_date": due_date,
-            "priority": priority,
-            "completed": False
-        }
-        
-        self.tasks.append(task)
-        self.save_tasks()
         self.clear_inputs()
-        self.refresh_task_list()
-        messagebox.showinfo("Success", f"Task '{title}' added successfully!")
+        messagebox.showinfo("Success", f"Task '{task['title']}' added successfully!")
     
     def clear_inputs(self):
         """Clear all input fields."""
@@ -321,42 +486,25 @@ class TodoApp:
         self.priority_var.set("medium")
     
     def refresh_task_list(self):
-        """Refresh the task list display."""
-        # Clear existing items
-        for item in self.task_list.get_children():
-            self.task_list.delete(item)
-        
-        # Filter tasks
-        filtered_tasks = self.tasks
-        
-        # Filter by completion status
-        if not self.show_completed_var.get():
-            filtered_tasks = [task for task in filtered_tasks if not task["completed"]]
-        
-        # Filter by priority
-        priority_filter = self.filter_priority_var.get()
-        if priority_filter != "all":
-            filtered_tasks = [task for task in filtered_tasks if task["priority"] == priority_filter]
-        
-        # Add tasks to the list
-        for task in filtered_tasks:
-            status = "Completed" if task["completed"] else "Pending"
-            due_date = task["due_date"] if task["due_date"] else "Not set"
-            
-            # Set row color based on priority
-            tag = f"priority_{task['priority']}"
-            
-            self.task_list.insert(
-                "", 
-                tk.END, 
-                values=(task["id"], task["title"], task["priority"], due_date, status),
-                tags=(tag,)
-            )
-        
-        # Configure row colors
-        self.task_list.tag_configure("priority_high", background="#ffcccc")
-        self.task_list.tag_configure("priority_medium", background="#ffffcc")
-        self.task_list.tag_configure("priority_low", background="#ccffcc")
+        """Apply the current filters to the task list display."""
+        # Mutations update their own rows, so only filter changes get here
+        self.task_view.set_filter(
+            self.show_completed_var.get(),
+            self.filter_priority_var.get(),
+            self.filter_due_entry.get().strip() or None,
+            self.search_entry.get().strip() or None
+        )
+    
+    def schedule_search(self, event=None):
+        """Re-run the search once typing has paused."""
+        if self.search_job is not None:
+            self.root.after_cancel(self.search_job)
+        self.search_job = self.root.after(SEARCH_DELAY_MS, self.run_search)
+    
+    def run_search(self):
+        """Apply the search box to the task list."""
+        self.search_job = None
+        self.refresh_task_list()
     
     def get_selected_task_id(self):
         """Get the ID of the selected task."""
@@ -365,16 +513,12 @@ class TodoApp:
             messagebox.showerror("Error", "No task selected!")
             return None
         
-        item = self.task_list.item(selection[0])
-        task_id = int(item["values"][0])
-        return task_id
+        # Row iids are the task IDs
+        return int(selection[0])
     
     def get_task_by_id(self, task_id):
         """Get a task by its ID."""
-        for task in self.tasks:
-            if task["id"] == task_id:
-                return task
-        return None
+        return self.engine.get(task_id)
     
     def view_task_details(self, event=None):
         """View details of the selected task."""
@@ -400,11 +544,8 @@ class TodoApp:
         if task_id is None:
             return
         
-        task = self.get_task_by_id(task_id)
+        task = self.engine.complete(task_id)
         if task:
-            task["completed"] = True
-            self.save_tasks()
-            self.refresh_task_list()
             messagebox.showinfo("Success", f"Task {task_id} marked as completed!")
     
     def mark_pending(self):
@@ -413,11 +554,8 @@ class TodoApp:
         if task_id is None:
             return
         
-        task = self.get_task_by_id(task_id)
+        task = self.engine.mark_pending(task_id)
         if task:
-            task["completed"] = False
-            self.save_tasks()
-            self.refresh_task_list()
             messagebox.showinfo("Success", f"Task {task_id} marked as pending!")
     
     def edit_task(self):
@@ -506,13 +644,18 @@ class TodoApp:
             buttons_frame.grid(row=4, column=0, columnspan=2, pady=20)
             
             def save_changes():
-                task["title"] = title_var.get().strip()
-                task["description"] = desc_var.get().strip()
-                task["due_date"] = due_var.get().strip() if due_var.get().strip() else None
-                task["priority"] = priority_var.get()
+                try:
+                    self.engine.update(
+                        task_id,
+                        title=title_var.get(),
+                        description=desc_var.get(),
+                        due_date=due_var.get(),
+                        priority=priority_var.get()
+                    )
+                except ValueError as error:
+                    messagebox.showerror("Error", str(error), parent=edit_window)
+                    return
                 
-                self.save_tasks()
-                self.refresh_task_list()
                 messagebox.showinfo("Success", f"Task {task_id} updated successfully!")
                 edit_window.destroy()
             
@@ -548,14 +691,8 @@ class TodoApp:
         
         confirm = messagebox.askyesno("Confirm", f"Are you sure you want to delete task {task_id}?")
         if confirm:
-            task = self.get_task_by_id(task_id)
+            task = self.engine.delete(task_id)
             if task:
-                self.tasks.remove(task)
-                # Reassign IDs to maintain sequence
-                for i, task in enumerate(self.tasks):
-                    task["id"] = i + 1
-                self.save_tasks()
-                self.refresh_task_list()
                 messagebox.showinfo("Success", f"Task {task_id} deleted successfully!")
 
 def main():
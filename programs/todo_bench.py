@@ -0,0 +1,272 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from task_engine import PRIORITIES, TaskEngine
+from task_store import open_store
+from task_table import TABLES
+
+DEFAULT_SIZES = "1000,10000,100000"
+WORDS = ["deploy", "review", "fix", "update", "write", "test", "backup", "server", "report",
+         "meeting", "invoice", "release", "docs", "cleanup", "migrate", "monitor"]
+
+
+def make_records(count, seed=0):
+    """Return ``count`` synthetic task records with mixed priorities and due dates."""
+    rng = random.Random(seed)
+    start = date(2026, 1, 1)
+    records = []
+    for i in range(count):
+        due = start + timedelta(days=rng.randrange(365))
+        records.append({
+            "title": f"{rng.choice(WORDS)} {rng.choice(WORDS)} {i}",
+            "description": " ".join(rng.choice(WORDS) for _ in range(rng.randrange(0, 8))),
+            "due_date": due.isoformat() if rng.random() < 0.7 else None,
+            "priority": rng.choice(PRIORITIES),
+            "completed": rng.random() < 0.3
+        })
+    return records
+
+
+def write_board(path, storage, count, seed=0):
+    """Create a board file with ``count`` synthetic tasks."""
+    engine = TaskEngine(open_store(storage, path))
+    engine.load()
+    engine.import_tasks(make_records(count, seed))
+    engine.close()
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def measure(name, size, func, runs):
+    """Time ``func`` ``runs`` times, then run it once more under tracemalloc for peak memory."""
+    samples = []
+    for run in range(runs):
+        start = time.perf_counter()
+        func(run)
+        samples.append((time.perf_counter() - start) * 1000)
+
+    tracemalloc.start()
+    func(runs)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    result = {
+        "op": name,
+        "size": size,
+        "runs": runs,
+        "p50_ms": round(percentile(samples, 0.50), 4),
+        "p90_ms": round(percentile(samples, 0.90), 4),
+        "p99_ms": round(percentile(samples, 0.99), 4),
+        "max_ms": round(max(samples), 4),
+        "peak_kib": round(peak / 1024, 1)
+    }
+    print(f"{name:<10} {size:>9}  p50 {result['p50_ms']:>10.3f} ms  p99 {result['p99_ms']:>10.3f} ms  "
+          f"peak {result['peak_kib']:>10.1f} KiB", file=sys.stderr)
+    return result
+
+
+def bench_size(size, args, workdir, tk_root):
+    """Run every operation against a board of ``size`` tasks."""
+    path = os.path.join(workdir, f"board-{size}" + (".db" if args.storage == "sqlite" else ".json"))
+    write_board(path, args.storage, size, args.seed)
+    heavy_runs = max(1, args.runs // 20)
+    results = []
+
+    def load(run):
+        engine = TaskEngine(open_store(args.storage, path))
+        engine.load()
+        engine.close()
+
+    results.append(measure("load", size, load, heavy_runs))
+
+    store = open_store(args.storage, path)
+    if args.no_fsync and hasattr(store, "fsync"):
+        store.fsync = False
+    engine = TaskEngine(store)
+    engine.load()
+    rng = random.Random(args.seed)
+    ids = list(engine.query())
+
+    def save(run):
+        engine.complete(rng.choice(ids))
+
+    results.append(measure("save", size, save, args.runs))
+
+    if hasattr(store, "compact"):
+        results.append(measure("compact", size, lambda run: store.compact(), heavy_runs))
+
+    filters = [(True, "all", None), (False, "all", None), (True, "high", None),
+               (False, "low", "2026-03-01"), (True, "all", "2026-06-01")]
+    if tk_root is None:
+        def refresh(run):
+            engine.query(*filters[run % len(filters)])
+    else:
+        from tkinter import ttk
+        from task_view import TaskListView, VirtualTaskListView
+        tree = ttk.Treeview(tk_root, columns=("id", "title", "priority", "due_date", "status"), show="headings")
+        scrollbar = ttk.Scrollbar(tk_root, command=tree.yview)
+        tree.pack()
+        if size > args.virtual_threshold:
+            view = VirtualTaskListView(tree, scrollbar, engine)
+        else:
+            view = TaskListView(tree, engine)
+
+        def refresh(run):
+            view.set_filter(*filters[run % len(filters)])
+            tk_root.update()
+
+    results.append(measure("refresh", size, refresh, heavy_runs if tk_root else args.runs))
+
+    results.append(measure("get", size, lambda run: engine.get(rng.choice(ids)), args.runs))
+    results.append(measure("search", size, lambda run: engine.query(text=rng.choice(WORDS)[:3]), args.runs))
+
+    deletable = rng.sample(ids, min(len(ids), args.runs + 1))
+    results.append(measure("delete", size, lambda run: engine.delete(deletable[run]), len(deletable) - 1))
+
+    engine.close()
+    if tk_root is not None:
+        for child in tk_root.winfo_children():
+            child.destroy()
+    return results
+
+
+def run(args):
+    tk_root = None
+    if args.tk:
+        import tkinter as tk
+        # Needs a display; on a server run the benchmark under xvfb-run
+        tk_root = tk.Tk()
+
+    workdir = tempfile.mkdtemp(prefix="todo-bench-")
+    try:
+        results = []
+        for size in (int(size) for size in args.sizes.split(",")):
+            results.extend(bench_size(size, args, workdir, tk_root))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+        if tk_root is not None:
+            tk_root.destroy()
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "storage": args.storage,
+            "fsync": not args.no_fsync,
+            "tk": args.tk,
+            "seed": args.seed,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")
+        },
+        "results": results
+    }
+    output = open(args.output, "w") if args.output else sys.stdout
+    json.dump(report, output, indent=2)
+    output.write("\n")
+    if args.output:
+        output.close()
+
+
+def memory(args):
+    """Print the memory each task table needs per task, alone and inside a loaded engine."""
+    print(f"{'size':>9} {'table':<9} {'table B/task':>13} {'engine B/task':>14}")
+    report = []
+    for size in (int(size) for size in args.sizes.split(",")):
+        records = make_records(size, args.seed)
+        # Parsed inside the trace, so the dict table is charged for its task dicts
+        text = json.dumps([dict(record, id=i + 1, created_at="2026-01-01 09:30:00") for i, record in enumerate(records)])
+        workdir = tempfile.mkdtemp(prefix="todo-bench-")
+        path = os.path.join(workdir, "board.json")
+        write_board(path, "json", size, args.seed)
+        try:
+            for name, table_class in sorted(TABLES.items()):
+                tracemalloc.start()
+                table = table_class()
+                table.load(json.loads(text))
+                table_bytes = tracemalloc.get_traced_memory()[0]
+                tracemalloc.stop()
+                del table
+
+                # The engine figure includes the secondary and search indexes
+                engine = TaskEngine(open_store("json", path), table_class())
+                tracemalloc.start()
+                engine.load()
+                engine_bytes = tracemalloc.get_traced_memory()[0]
+                tracemalloc.stop()
+                engine.close()
+                del engine
+
+                report.append({
+                    "size": size,
+                    "table": name,
+                    "table_bytes_per_task": round(table_bytes / size, 1),
+                    "engine_bytes_per_task": round(engine_bytes / size, 1)
+                })
+                print(f"{size:>9} {name:<9} {table_bytes / size:>13.1f} {engine_bytes / size:>14.1f}")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"results": report}, file, indent=2)
+
+
+def compare(args):
+    """Print how each operation's p50/p99 changed between two result files."""
+    with open(args.old) as file:
+        old = {(r["op"], r["size"]): r for r in json.load(file)["results"]}
+    with open(args.new) as file:
+        new = {(r["op"], r["size"]): r for r in json.load(file)["results"]}
+    print(f"{'op':<10} {'size':>9} {'p50 old':>11} {'p50 new':>11} {'change':>8} {'p99 old':>11} {'p99 new':>11} {'change':>8}")
+    for key in sorted(old.keys() & new.keys(), key=lambda key: (key[1], key[0])):
+        before, after = old[key], new[key]
+        line = f"{key[0]:<10} {key[1]:>9}"
+        for stat in ("p50_ms", "p99_ms"):
+            change = (after[stat] - before[stat]) / before[stat] * 100 if before[stat] else 0.0
+            line += f" {before[stat]:>11.3f} {after[stat]:>11.3f} {change:>+7.1f}%"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the todo app's data path.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the benchmarks and print JSON results")
+    run_parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"comma-separated task counts (default: {DEFAULT_SIZES})")
+    run_parser.add_argument("--storage", choices=["json", "sqlite"], default="json")
+    run_parser.add_argument("--runs", type=int, default=200, help="timed runs for cheap operations (heavy ones get 1/20th)")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--no-fsync", action="store_true", help="skip fsync on journal writes")
+    run_parser.add_argument("--tk", action="store_true", help="time refresh through a real Treeview (needs a display, e.g. xvfb-run)")
+    run_parser.add_argument("--virtual-threshold", type=int, default=5000, help="board size above which --tk uses the virtual list")
+    run_parser.add_argument("-o", "--output", help="write JSON results here instead of stdout")
+    run_parser.set_defaults(func=run)
+
+    memory_parser = commands.add_parser("memory", help="compare memory per task of the task tables")
+    memory_parser.add_argument("--sizes", default="100000", help="comma-separated task counts (default: 100000)")
+    memory_parser.add_argument("--seed", type=int, default=0)
+    memory_parser.add_argument("-o", "--output", help="also write JSON results here")
+    memory_parser.set_defaults(func=memory)
+
+    compare_parser = commands.add_parser("compare", help="compare two JSON result files")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+import argparse
+import csv
+import json
+import os
+import sys
+
+from task_engine import TaskEngine
+from task_store import open_store
+from task_table import TABLES
+
+FIELDS = ["id", "title", "description", "created_at", "due_date", "priority", "completed"]
+
+# Spellings of a completed flag taken as true, the rest of the strings are false
+TRUE_STRINGS = ("1", "true", "yes")
+FALSE_STRINGS = ("", "0", "false", "no")
+
+
+def read_records(stream, fmt):
+    """Yield task records from a CSV or JSON Lines stream, one at a time.
+
+    Raises ValueError, naming the line, for a CSV without a title column,
+    a row with more fields than the header, or a line that is not a JSON
+    object with a title, has a text field that is not a string or has a
+    completed flag that is not a boolean.
+    """
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        if reader.fieldnames is None:
+            return
+        if "title" not in reader.fieldnames:
+            raise ValueError("The CSV header has no title column")
+        for row in reader:
+            if None in row:
+                raise ValueError(f"Line {reader.line_num}: {len(row[None])} more fields than the header")
+            row["completed"] = (row.get("completed") or "").strip().lower() in TRUE_STRINGS
+            yield row
+    else:
+        for number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as error:
+                raise ValueError(f"Line {number}: {error}") from None
+            if not isinstance(record, dict) or "title" not in record:
+                raise ValueError(f"Line {number}: expected a JSON object with a title")
+            for field in ("title", "description", "created_at", "due_date", "priority"):
+                if record.get(field) is not None and not isinstance(record[field], str):
+                    raise ValueError(f"Line {number}: {field} must be a string, not {record[field]!r}")
+            completed = record.get("completed")
+            if isinstance(completed, str) and completed.strip().lower() in TRUE_STRINGS + FALSE_STRINGS:
+                record["completed"] = completed.strip().lower() in TRUE_STRINGS
+            elif completed is not None and not isinstance(completed, bool):
+                raise ValueError(f"Line {number}: completed must be true or false, not {completed!r}")
+            yield record
+
+
+def write_records(stream, fmt, tasks):
+    """Write tasks to a CSV or JSON Lines stream and return how many were written."""
+    count = 0
+    if fmt == "csv":
+        writer = csv.DictWriter(stream, fieldnames=FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        for task in tasks:
+            writer.writerow(task)
+            count += 1
+    else:
+        for task in tasks:
+            stream.write(json.dumps(task, separators=(",", ":")) + "\n")
+            count += 1
+    return count
+
+
+def guess_format(path, fmt):
+    """Pick the stream format from --format or the file extension."""
+    if fmt:
+        return fmt
+    if path.endswith(".csv"):
+        return "csv"
+    if path.endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    sys.exit(f"Cannot tell the format of {path!r}, pass --format csv or --format jsonl")
+
+
+def open_stream(path, mode):
+    if path == "-":
+        return sys.stdin if mode == "r" else sys.stdout
+    return open(path, mode, newline="")
+
+
+def cmd_list(engine, args):
+    for task in engine.tasks(not args.pending, args.priority, args.due_before):
+        status = "Completed" if task["completed"] else "Pending"
+        due_date = task["due_date"] if task["due_date"] else "Not set"
+        print(f"{task['id']:>6}  {status:<9}  {task['priority']:<6}  {due_date:<10}  {task['title']}")
+
+
+def cmd_add(engine, args):
+    task = engine.add(args.title, args.description, args.due_date, args.priority)
+    print(f"Task {task['id']} added")
+
+
+def cmd_done(engine, args):
+    if engine.complete(args.id) is None:
+        sys.exit(f"No task with ID {args.id}")
+    print(f"Task {args.id} marked as completed")
+
+
+def cmd_pending(engine, args):
+    if engine.mark_pending(args.id) is None:
+        sys.exit(f"No task with ID {args.id}")
+    print(f"Task {args.id} marked as pending")
+
+
+def cmd_delete(engine, args):
+    if engine.delete(args.id) is None:
+        sys.exit(f"No task with ID {args.id}")
+    print(f"Task {args.id} deleted")
+
+
+def cmd_import(engine, args):
+    fmt = guess_format(args.path, args.format)
+    stream = open_stream(args.path, "r")
+    try:
+        count = engine.import_tasks(read_records(stream, fmt))
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    print(f"Imported {count} tasks", file=sys.stderr)
+
+
+def cmd_export(engine, args):
+    fmt = guess_format(args.path, args.format)
+    stream = open_stream(args.path, "w")
+    try:
+        count = write_records(stream, fmt, engine.tasks())
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+    print(f"Exported {count} tasks", file=sys.stderr)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Manage the todo app's tasks without the GUI.")
+    parser.add_argument("--storage", choices=["json", "sqlite"], default=os.environ.get("TODO_STORAGE", "json"),
+                        help="storage engine (default: $TODO_STORAGE or json)")
+    parser.add_argument("--file", help="task file or database (default: tasks.json / tasks.db)")
+    parser.add_argument("--table", choices=sorted(TABLES), default=os.environ.get("TODO_TABLE", "dict"),
+                        help="in-memory task layout (default: $TODO_TABLE or dict)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    list_parser = commands.add_parser("list", help="list tasks")
+    list_parser.add_argument("--pending", action="store_true", help="hide completed tasks")
+    list_parser.add_argument("--priority", default="all", choices=["all", "low", "medium", "high"])
+    list_parser.add_argument("--due-before", help="only tasks due before this date (YYYY-MM-DD)")
+    list_parser.set_defaults(func=cmd_list)
+
+    add_parser = commands.add_parser("add", help="add a task")
+    add_parser.add_argument("title")
+    add_parser.add_argument("--description", default="")
+    add_parser.add_argument("--due-date")
+    add_parser.add_argument("--priority", default="medium")
+    add_parser.set_defaults(func=cmd_add)
+
+    for name, func, help_text in (
+        ("done", cmd_done, "mark a task as completed"),
+        ("pending", cmd_pending, "mark a task as pending"),
+        ("delete", cmd_delete, "delete a task"),
+    ):
+        id_parser = commands.add_parser(name, help=help_text)
+        id_parser.add_argument("id", type=int)
+        id_parser.set_defaults(func=func)
+
+    for name, func, help_text in (
+        ("import", cmd_import, "add tasks from a CSV or JSON Lines file in one write"),
+        ("export", cmd_export, "write all tasks to a CSV or JSON Lines file"),
+    ):
+        stream_parser = commands.add_parser(name, help=help_text)
+        stream_parser.add_argument("path", help="file path, or - for stdin/stdout")
+        stream_parser.add_argument("--format", choices=["csv", "jsonl"])
+        stream_parser.set_defaults(func=func)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    engine = TaskEngine(open_store(args.storage, args.file), TABLES[args.table]())
+    engine.load()
+    try:
+        args.func(engine, args)
+    except ValueError as error:
+        sys.exit(f"Error: {error}")
+    finally:
+        engine.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+import queue
+import threading
+import time
+
+from task_store import TaskStore, overlay_local_ops
+
+# IDs the writer thread reserves from the wrapped store ahead of time, so
+# adding a task never waits on the disk
+ID_PREFETCH = 256
+
+
+class WriteBehindStore(TaskStore):
+    """Wrap a task store so that writes happen on a background thread.
+
+    put and delete only record the operation and return. The worker thread
+    waits ``delay`` seconds for a burst of mutations to settle, keeps the
+    last operation per task and hands the batch to the wrapped store in one
+    write_batch call. Results are polled from the Tk main loop with
+    ``root.after`` and passed to ``on_flush(count)`` or ``on_error(exc)``,
+    so the callbacks are always safe to touch widgets from.
+
+    The worker thread also reserves IDs ahead of time and reads the changes
+    of other processes: request_changes asks for them and they arrive at
+    ``on_changes(ops)``, so nothing here locks or reads the board on the
+    Tk thread.
+    """
+
+    def __init__(self, store, root, on_flush=None, on_error=None, on_changes=None, delay=0.05, poll_interval=100):
+        self.store = store
+        self.root = root
+        self.on_flush = on_flush
+        self.on_error = on_error
+        self.on_changes = on_changes
+        self.delay = delay
+        self.poll_interval = poll_interval
+        self.last_error = None
+        self._pending = {}
+        self._cond = threading.Condition()
+        self._closing = False
+        # Reserved IDs not handed out yet, a list of [first, limit) ranges
+        self._ids = []
+        self._want_ids = False
+        # Set while a poll of other processes' changes is queued or running
+        self._want_changes = False
+        self._polling = False
+        self._poll_again = False
+        # Local operations since the last poll was read, which win over what it found
+        self._since_poll = None
+        self._results = queue.Queue()
+        # Started right away, so writes queued after a failed load still go out
+        self._thread = threading.Thread(target=self._run, name="task-writer", daemon=True)
+        self._thread.start()
+        self.root.after(self.poll_interval, self._poll)
+
+    @property
+    def next_id(self):
+        return self.store.next_id
+
+    @property
+    def load_progress(self):
+        return self.store.load_progress
+
+    @property
+    def truncated(self):
+        return self.store.truncated
+
+    def load(self):
+        """Load from the wrapped store."""
+        return list(self.iter_load())
+
+    def iter_load(self):
+        """Stream tasks from the wrapped store, then start reserving IDs."""
+        tasks = self.store.iter_load()
+        first = next(tasks, None)
+        # The wrapped store settles its write state before handing out a task
+        with self._cond:
+            self._want_ids = True
+            self._cond.notify()
+        if first is not None:
+            yield first
+            yield from tasks
+
+    def put(self, task):
+        """Queue a copy of the task to be written."""
+        self._enqueue(task["id"], ("put", dict(task)))
+
+    def delete(self, task_id):
+        """Queue the removal of a task."""
+        self._enqueue(task_id, ("delete", task_id))
+
+    def write_batch(self, ops):
+        """Queue many operations at once."""
+        with self._cond:
+            for op, value in ops:
+                if op == "put":
+                    self._queue_op(value["id"], ("put", dict(value)))
+                else:
+                    self._queue_op(value, ("delete", value))
+            self._cond.notify()
+
+    def reserve_ids(self, count):
+        """Hand out ``count`` IDs reserved by the worker thread and return the first one.
+
+        Only when none are reserved yet, or for a block bigger than the
+        reserve, are they taken from the wrapped store right away.
+        """
+        with self._cond:
+            while self._ids and self._ids[0][1] - self._ids[0][0] < count:
+                # Too short for the block, so its IDs are skipped
+                self._ids.pop(0)
+            if self._ids:
+                start = self._ids[0][0]
+                self._ids[0][0] += count
+                if sum(limit - first for first, limit in self._ids) < ID_PREFETCH // 2:
+                    self._want_ids = True
+                    self._cond.notify()
+                return start
+            self._want_ids = True
+            self._cond.notify()
+        return self.store.reserve_ids(count)
+
+    def watch_paths(self):
+        """Return the files the wrapped store changes."""
+        return self.store.watch_paths()
+
+    def request_changes(self):
+        """Have the worker thread read other processes' changes and pass them to on_changes.
+
+        Tasks with a write of ours still queued, or made since the changes
+        were read, are left out: our write lands after them, so it counts.
+        """
+        with self._cond:
+            if self._polling:
+                self._poll_again = True
+                return
+            self._polling = True
+            self._want_changes = True
+            self._cond.notify()
+
+    def pending(self):
+        """Return how many tasks are waiting to be written."""
+        with self._cond:
+            return len(self._pending)
+
+    def close(self):
+        """Write everything still queued, then close the wrapped store.
+
+        Raises the error of the final write if it failed.
+        """
+        if self._thread is not None:
+            with self._cond:
+                self._closing = True
+                self._cond.notify()
+            self._thread.join()
+            self._thread = None
+        self.store.close()
+        with self._cond:
+            if self._pending and self.last_error is not None:
+                raise self.last_error
+
+    def _enqueue(self, task_id, op):
+        with self._cond:
+            self._queue_op(task_id, op)
+            self._cond.notify()
+
+    def _queue_op(self, task_id, op):
+        self._pending[task_id] = op
+        if self._since_poll is not None:
+            self._since_poll[task_id] = op
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not (self._pending or self._want_ids or self._want_changes or self._closing):
+                    self._cond.wait()
+                if self._closing and not self._pending:
+                    return
+                want_ids, self._want_ids = self._want_ids and not self._closing, False
+                want_changes, self._want_changes = self._want_changes and not self._closing, False
+                closing = self._closing
+            if want_ids:
+                self._reserve()
+            if want_changes:
+                self._read_changes()
+            with self._cond:
+                if not self._pending:
+                    continue
+            if not closing:
+                # Let the rest of a burst pile up so it goes out as one write
+                time.sleep(self.delay)
+
+            with self._cond:
+                batch = self._pending
+                self._pending = {}
+            try:
+                self.store.write_batch(list(batch.values()))
+            except Exception as exc:
+                with self._cond:
+                    # Anything queued since is newer than the failed batch
+                    batch.update(self._pending)
+                    self._pending = batch
+                    self.last_error = exc
+                self._results.put(("error", exc))
+                if closing:
+                    return
+                time.sleep(1)
+            else:
+                self._results.put(("flushed", len(batch)))
+
+    def _reserve(self):
+        try:
+            start = self.store.reserve_ids(ID_PREFETCH)
+        except Exception as exc:
+            self._results.put(("error", exc))
+            return
+        with self._cond:
+            self._ids.append([start, start + ID_PREFETCH])
+
+    def _read_changes(self):
+        try:
+            ops = self.store.poll_changes()
+        except Exception as exc:
+            ops = []
+            self._results.put(("error", exc))
+        with self._cond:
+            # Writes still queued land after these changes; the Tk thread adds the ones made from here on
+            ops = overlay_local_ops(ops, list(self._pending.values()))
+            self._since_poll = {}
+        self._results.put(("changes", ops))
+
+    def _poll(self):
+        while True:
+            try:
+                kind, value = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "flushed" and self.on_flush:
+                self.on_flush(value)
+            elif kind == "error" and self.on_error:
+                self.on_error(value)
+            elif kind == "changes":
+                with self._cond:
+                    value = overlay_local_ops(value, list(self._since_poll.values()))
+                    self._since_poll = None
+                    self._polling = False
+                    poll_again, self._poll_again = self._poll_again, False
+                if value and self.on_changes:
+                    self.on_changes(value)
+                if poll_again:
+                    self.request_changes()
+        if self._thread is not None:
+            self.root.after(self.poll_interval, self._poll)